@@ -0,0 +1,270 @@
+"""Benchmark suite for nordic-preproc.
+
+Runs the I/O-heavy stages of the pipeline on a synthetic dataset (see
+``synthetic.py``) with a stand-in backend (see ``standin.py``), so that no
+MATLAB is needed, and saves wall/CPU time, peak RSS and I/O per benchmark to a
+JSON file named after the preset and commit. Two result files can then be
+compared::
+
+    python benchmarks/bench.py run --preset full
+    python benchmarks/bench.py compare benchmarks/results/full-<old>.json benchmarks/results/full-<new>.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from nordic_preproc import __version__
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.bids import discover_runs
+from nordic_preproc.cli import bids_run
+from nordic_preproc.gzip_index import GzipIndex
+from nordic_preproc.nifti_ops import gzip_nii, iter_stored_volumes, save_nifti, split_4d_nifti, stream_split_nifti
+from nordic_preproc.noise import find_noise_scans
+from nordic_preproc.profiling import Profiler
+
+from standin import StandInBackend
+from synthetic import PRESETS, make_dataset
+
+HERE = Path(__file__).resolve().parent
+
+
+def _git_revision() -> str:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return rev + ("-dirty" if dirty else "")
+
+
+class Context:
+    """Dataset paths and scratch space shared by the benchmarks."""
+
+    def __init__(self, dataset: Path, scratch: Path):
+        self.dataset = dataset
+        self.scratch = scratch
+        self.runs = discover_runs(dataset)
+        self.magnitude = self.runs[0].magnitude
+        self.noise_inds = find_noise_scans(str(self.magnitude)).noise_indices
+        self._functional = None
+        self._index = None
+
+    def functional(self) -> np.ndarray:
+        """The functional volumes of the magnitude, decoded once."""
+        if self._functional is None:
+            self._functional = split_4d_nifti(str(self.magnitude), self.noise_inds, dtype=np.float32)[0]
+        return self._functional
+
+    def nordic_output(self) -> Path:
+        """A fresh float32 .nii as written by the backend."""
+        out = self.scratch / "nordic.nii"
+        if not out.exists():
+            StandInBackend().run(str(self.magnitude), str(self.runs[0].phase), "nordic",
+                                 NordicArgs(dirout=str(self.scratch) + "/"))
+        return out
+
+    def blocked_magnitude(self) -> Path:
+        """The magnitude recompressed in independent gzip blocks (like pigz or our own outputs)."""
+        out = self.scratch / "magnitude_blocked.nii.gz"
+        if not out.exists():
+            plain = self.scratch / "magnitude_blocked.nii"
+            with gzip.open(self.magnitude, "rb") as src, open(plain, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            gzip_nii(plain)
+        return out
+
+    def blocked_index(self) -> GzipIndex:
+        """Seek-point index of :meth:`blocked_magnitude`, built by one full read."""
+        if self._index is None:
+            self._index = GzipIndex.for_file(self.blocked_magnitude())
+            for _ in iter_stored_volumes(self.blocked_magnitude(), index=self._index):
+                pass
+        return self._index
+
+
+def bench_discover(ctx: Context) -> None:
+    discover_runs(ctx.dataset)
+
+
+def bench_discover_cached(ctx: Context) -> None:
+    discover_runs(ctx.dataset, cache_file=ctx.scratch / "bids_index.json")
+
+
+def bench_find_noise_scans(ctx: Context) -> None:
+    find_noise_scans(str(ctx.magnitude))
+
+
+def bench_split_4d_nifti(ctx: Context) -> None:
+    split_4d_nifti(str(ctx.magnitude), ctx.noise_inds)
+
+
+def bench_read_noise_volumes(ctx: Context) -> None:
+    for _ in iter_stored_volumes(ctx.blocked_magnitude(), start=int(ctx.noise_inds[0])):
+        pass
+
+
+def bench_read_noise_volumes_indexed(ctx: Context) -> None:
+    for _ in iter_stored_volumes(ctx.blocked_magnitude(), start=int(ctx.noise_inds[0]), index=ctx.blocked_index()):
+        pass
+
+
+def bench_save_nifti(ctx: Context) -> None:
+    save_nifti(ctx.functional(), np.eye(4), ctx.scratch / "saved.nii.gz")
+
+
+def bench_stream_split_nifti(ctx: Context) -> None:
+    stream_split_nifti(ctx.nordic_output(), ctx.noise_inds, ctx.scratch / "func.nii.gz",
+                       ctx.scratch / "noise.nii.gz", dtype=np.float32)
+
+
+def bench_gzip_nii(ctx: Context) -> None:
+    src = ctx.nordic_output()
+    copy = ctx.scratch / "to_gzip.nii"
+    shutil.copyfile(src, copy)
+    gzip_nii(copy).unlink()
+
+
+def bench_nordic_bids(ctx: Context) -> None:
+    shutil.rmtree(ctx.dataset / "derivatives", ignore_errors=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        bids_run.main([str(ctx.dataset), "--numpy", "--mad_thresh", "10"], backend=StandInBackend())
+
+
+BENCHMARKS: Dict[str, Callable[[Context], None]] = {
+    "discover": bench_discover,
+    "discover_cached": bench_discover_cached,
+    "find_noise_scans": bench_find_noise_scans,
+    "split_4d_nifti": bench_split_4d_nifti,
+    "read_noise_volumes": bench_read_noise_volumes,
+    "read_noise_volumes_indexed": bench_read_noise_volumes_indexed,
+    "save_nifti": bench_save_nifti,
+    "stream_split_nifti": bench_stream_split_nifti,
+    "gzip_nii": bench_gzip_nii,
+    "nordic_bids": bench_nordic_bids,
+}
+
+
+def run_benchmarks(preset: str, data_dir: Path, repeat: int, selected: List[str]) -> dict:
+    dataset = make_dataset(data_dir, preset)
+    scratch = data_dir / f"scratch-{preset}"
+    shutil.rmtree(scratch, ignore_errors=True)
+    scratch.mkdir(parents=True)
+    ctx = Context(dataset, scratch)
+    prof = Profiler()
+
+    results = {}
+    for name in selected:
+        fn = BENCHMARKS[name]
+        fn(ctx)  # warm-up: page cache, imports, lazily created inputs
+        records = []
+        for _ in range(repeat):
+            with prof.stage(name):
+                fn(ctx)
+            records.append(prof.records[-1])
+        walls = [r.wall_s for r in records]
+        best = min(records, key=lambda r: r.wall_s)
+        results[name] = {
+            "wall_s": best.wall_s,
+            "wall_s_median": statistics.median(walls),
+            "wall_s_all": walls,
+            "cpu_s": best.cpu_s,
+            "peak_rss": max(r.peak_rss for r in records),
+            "read_bytes": best.read_bytes,
+            "write_bytes": best.write_bytes,
+        }
+        print(f"{name:<28} {best.wall_s:8.3f}s  cpu {best.cpu_s:8.3f}s  peak rss {results[name]['peak_rss'] / 1024**2:8.1f}M")
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "revision": _git_revision(),
+        "version": __version__,
+        "preset": preset,
+        "shape": list(PRESETS[preset].shape),
+        "repeat": repeat,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(base: dict, new: dict, threshold: float) -> bool:
+    """Print a comparison table; return True if any benchmark regressed."""
+    print(f"base: {base['revision']} ({base['preset']})   new: {new['revision']} ({new['preset']})")
+    if base["preset"] != new["preset"]:
+        print("Warning: results are for different presets")
+    print(f"{'benchmark':<28}{'base s':>10}{'new s':>10}{'ratio':>8}{'base rss':>10}{'new rss':>10}")
+    regressed = False
+    for name, b in base["results"].items():
+        n = new["results"].get(name)
+        if n is None:
+            continue
+        ratio = n["wall_s"] / b["wall_s"] if b["wall_s"] > 0 else float("inf")
+        rss_ratio = n["peak_rss"] / b["peak_rss"] if b["peak_rss"] > 0 else 1.0
+        flag = ""
+        if ratio > 1 + threshold or rss_ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<28}{b['wall_s']:>10.3f}{n['wall_s']:>10.3f}{ratio:>8.2f}"
+              f"{b['peak_rss'] / 1024**2:>9.0f}M{n['peak_rss'] / 1024**2:>9.0f}M{flag}")
+    return regressed
+
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark nordic-preproc on synthetic data.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Run the benchmarks and save the results")
+    r.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    r.add_argument("--data-dir", type=Path, default=HERE / "data",
+                   help="Where synthetic datasets are generated (reused across runs)")
+    r.add_argument("--repeat", type=int, default=3, help="Timed repetitions per benchmark (best is reported)")
+    r.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=None)
+    r.add_argument("--output", type=Path, default=None,
+                   help="Result file (default: benchmarks/results/<preset>-<revision>.json)")
+
+    c = sub.add_parser("compare", help="Compare two result files")
+    c.add_argument("base", type=Path)
+    c.add_argument("new", type=Path)
+    c.add_argument("--threshold", type=float, default=0.10,
+                   help="Relative slowdown (or memory growth) reported as a regression")
+
+    args = p.parse_args(argv)
+    if args.command == "run":
+        result = run_benchmarks(args.preset, args.data_dir, args.repeat, args.only or list(BENCHMARKS))
+        out = args.output or HERE / "results" / f"{args.preset}-{result['revision']}.json"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(result, indent=2))
+        print(f"Results written to {out}")
+    else:
+        base = json.loads(args.base.read_text())
+        new = json.loads(args.new.read_text())
+        if compare(base, new, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
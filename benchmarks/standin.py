@@ -0,0 +1,42 @@
+"""A fast stand-in for the NORDIC backends, for benchmarking the pipeline around them."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.nifti_ops import NiftiStreamWriter, VolumeReader
+
+
+class StandInBackend:
+    """Write a plausible NORDIC output without running NORDIC.
+
+    The magnitude is streamed, scaled to real-world values and smoothed with
+    a per-voxel exponential moving average over time (a cheap "denoising"),
+    and written as ``<dirout>/<output_base>.nii`` in float32, like
+    NIFTI_NORDIC.m. The I/O
+    pattern and output size match the real backends; the compute does not.
+    """
+
+    def __init__(self, chunk_volumes: int = 16, alpha: float = 0.7):
+        self.chunk_volumes = chunk_volumes
+        self.alpha = np.float32(alpha)
+
+    def run(self, magnitude_nii: str, phase_nii: str, output_base: str, args: NordicArgs) -> None:
+        img = nib.load(magnitude_nii)
+        out_path = Path(args.dirout) / f"{output_base}.nii"
+        with VolumeReader(magnitude_nii) as reader, \
+                NiftiStreamWriter(out_path, reader.shape, img.affine, header=img.header, dtype=np.float32) as out:
+            ema = None
+            for start in range(0, reader.n_volumes, self.chunk_volumes):
+                vols = reader.read(start, start + self.chunk_volumes).astype(np.float32)
+                vols = vols * np.float32(reader.slope) + np.float32(reader.inter)
+                for t in range(vols.shape[3]):
+                    ema = vols[..., t] if ema is None else self.alpha * vols[..., t] + (1 - self.alpha) * ema
+                    vols[..., t] = ema
+                out.write(vols)
+
+    def close(self) -> None:
+        pass
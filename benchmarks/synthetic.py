@@ -0,0 +1,101 @@
+"""Synthetic magnitude/phase BIDS datasets for the benchmarks.
+
+Images are generated volume by volume and streamed to disk, so even the
+``full`` preset (104x104x72x400, the size of a typical 7T run) needs only a
+few volumes in memory. Data is deterministic for a given preset and seed.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from nordic_preproc.nifti_ops import NiftiStreamWriter
+
+
+@dataclass(frozen=True)
+class Preset:
+    shape: tuple  # (x, y, z, t), t includes the noise volumes
+    n_noise: int
+    subjects: int
+    runs_per_subject: int
+
+
+PRESETS: Dict[str, Preset] = {
+    "tiny": Preset(shape=(16, 16, 8, 30), n_noise=3, subjects=1, runs_per_subject=1),
+    "small": Preset(shape=(48, 48, 24, 120), n_noise=3, subjects=2, runs_per_subject=1),
+    "medium": Preset(shape=(80, 80, 48, 200), n_noise=3, subjects=2, runs_per_subject=2),
+    "full": Preset(shape=(104, 104, 72, 400), n_noise=3, subjects=2, runs_per_subject=2),
+    # One multi-GB run, for reads that should not scale with the length of the series
+    "long": Preset(shape=(104, 104, 72, 1600), n_noise=3, subjects=1, runs_per_subject=1),
+}
+
+
+def _brain_mask(shape) -> np.ndarray:
+    x, y, z = (np.linspace(-1, 1, n)[:, None, None] for n in shape[:3])
+    y, z = y.reshape(1, -1, 1), z.reshape(1, 1, -1)
+    return (x / 0.8) ** 2 + (y / 0.9) ** 2 + (z / 0.75) ** 2 <= 1.0
+
+
+def _write_run(path_mag: Path, path_phase: Path, preset: Preset, seed: int, chunk: int = 8) -> None:
+    rng = np.random.default_rng(seed)
+    nx, ny, nz, nt = preset.shape
+    n_func = nt - preset.n_noise
+    mask = _brain_mask(preset.shape)
+    baseline = np.where(mask, 1000.0, 40.0) * (1 + 0.1 * rng.standard_normal(mask.shape)).clip(0.5, 1.5)
+    x, y, z = np.meshgrid(*(np.linspace(-np.pi, np.pi, n) for n in (nx, ny, nz)), indexing="ij")
+    phase0 = 0.6 * x + 0.3 * y + 0.2 * np.sin(z)
+    activation = mask & (rng.random(mask.shape) < 0.05)
+    design = np.sin(np.arange(n_func) * 2 * np.pi / 30)
+
+    hdr_kw = dict(affine=np.diag([2.0, 2.0, 2.0, 1.0]))
+    with NiftiStreamWriter(path_mag, preset.shape, dtype=np.int16, **hdr_kw) as mag_out, \
+            NiftiStreamWriter(path_phase, preset.shape, dtype=np.int16, **hdr_kw) as ph_out:
+        for t0 in range(0, nt, chunk):
+            t1 = min(t0 + chunk, nt)
+            mags, phases = [], []
+            for t in range(t0, t1):
+                noise = rng.standard_normal((2,) + mask.shape) * 20.0
+                if t < n_func:
+                    signal = baseline * (1 + 0.02 * design[t] * activation)
+                    drift = 0.05 * t / nt
+                else:
+                    # Noise scans: RF off, thermal noise only
+                    signal = np.zeros(mask.shape)
+                    drift = 0.0
+                re = signal * np.cos(phase0 + drift) + noise[0]
+                im = signal * np.sin(phase0 + drift) + noise[1]
+                mags.append(np.hypot(re, im))
+                phases.append(np.arctan2(im, re))
+            mag_out.write(np.clip(np.stack(mags, axis=3), 0, 32767).astype(np.int16))
+            ph_out.write(np.round(np.stack(phases, axis=3) / np.pi * 4095).astype(np.int16))
+
+
+def make_dataset(root: Path, preset_name: str, seed: int = 0) -> Path:
+    """Create (or reuse) a synthetic BIDS dataset for ``preset_name`` under ``root``.
+
+    The dataset lives in ``root/<preset>-seed<seed>``. It is regenerated only
+    if its ``.complete`` marker is missing or was written for other settings.
+    """
+    preset = PRESETS[preset_name]
+    ds = Path(root) / f"{preset_name}-seed{seed}"
+    marker = ds / ".complete"
+    settings = json.dumps({"preset": asdict(preset), "seed": seed}, sort_keys=True)
+    if marker.exists() and marker.read_text() == settings:
+        return ds
+
+    (ds / "dataset_description.json").parent.mkdir(parents=True, exist_ok=True)
+    (ds / "dataset_description.json").write_text(json.dumps({"Name": "synthetic", "BIDSVersion": "1.9.0"}))
+    for s in range(preset.subjects):
+        func = ds / f"sub-{s + 1:02d}" / "ses-01" / "func"
+        func.mkdir(parents=True, exist_ok=True)
+        for r in range(preset.runs_per_subject):
+            base = f"sub-{s + 1:02d}_ses-01_task-rest_run-{r + 1}"
+            _write_run(func / f"{base}_bold.nii.gz", func / f"{base}_part-phase_bold.nii.gz", preset,
+                       seed=seed * 1000 + s * 10 + r)
+            (func / f"{base}_bold.json").write_text(json.dumps({"RepetitionTime": 1.5, "TaskName": "rest"}))
+    marker.write_text(settings)
+    return ds
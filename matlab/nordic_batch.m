@@ -0,0 +1,42 @@
+function nordic_batch()
+% NORDIC_BATCH  Long-lived NORDIC worker for the nordic-preproc MCR batch mode.
+%
+% Compile together with NIFTI_NORDIC.m, e.g.
+%
+%   mcc -m nordic_batch.m -a /path/to/NORDIC_Raw -d /path/to/compiled_nordic/
+%
+% which produces run_nordic_batch.sh next to run_nifti_nordic_pipeline.sh.
+% nordic-preproc then starts one process per worker and sends it jobs on
+% stdin, one per line, as tab-separated fields:
+%
+%   done_file  magnitude  phase  output_base  temporal_phase  phase_filter_width  DIROUT  noise_volume_last
+%
+% After each job the worker writes "ok" or "error: <message>" to done_file
+% (via a temporary file and a rename). An empty line or "quit" ends it.
+
+while true
+    line = input('', 's');
+    if isempty(line) || strcmp(strtrim(line), 'quit')
+        break;
+    end
+    fields = strsplit(line, sprintf('\t'));
+    done_file = fields{1};
+    status = 'ok';
+    try
+        ARG.temporal_phase = str2double(fields{5});
+        ARG.phase_filter_width = str2double(fields{6});
+        ARG.DIROUT = fields{7};
+        ARG.noise_volume_last = str2double(fields{8});
+        NIFTI_NORDIC(fields{2}, fields{3}, fields{4}, ARG);
+    catch err
+        status = ['error: ' strrep(err.message, newline, ' ')];
+        fprintf(2, '%s\n', getReport(err, 'extended', 'hyperlinks', 'off'));
+    end
+    tmp = [done_file '.tmp'];
+    fid = fopen(tmp, 'w');
+    fprintf(fid, '%s\n', status);
+    fclose(fid);
+    movefile(tmp, done_file);
+    clear ARG
+end
+end
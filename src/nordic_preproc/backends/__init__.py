@@ -29,6 +29,22 @@ class NordicBackend(Protocol):
         """
         ...
 
+    def close(self) -> None:
+        """Release anything kept alive between runs (e.g. MATLAB engines)."""
+        ...
+
+
+class ArrayBackend(NordicBackend, Protocol):
+    """A backend that can also denoise arrays in memory, without any files."""
+
+    def denoise(self, magnitude, phase, args: NordicArgs):
+        """Return the denoised magnitude (float32 array of the magnitude's shape).
+
+        ``magnitude`` and ``phase`` are 4D real-world values (``phase`` may be
+        None); ``args.dirout`` is ignored.
+        """
+        ...
+
 
 def to_matlab_struct_dict(args: NordicArgs) -> Dict[str, Any]:
     # Keep keys compatible with the original MATLAB function signature.
@@ -1,29 +1,270 @@
 from __future__ import annotations
 
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
 from . import NordicArgs, to_matlab_struct_dict
 
 
+def _import_matlab_engine():
+    try:
+        import matlab.engine  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError(
+            "Failed to import matlab.engine. Install/configure the MATLAB Engine API for Python, "
+            "or use the MCR backend."
+        ) from e
+    return matlab.engine
+
+
+def _import_matlab():
+    """The ``matlab`` package, whose array types (``matlab.single``) carry data to the engine."""
+    _import_matlab_engine()
+    import matlab  # type: ignore
+
+    return matlab
+
+
+class _EngineSlot:
+    """An engine in the pool: either still starting (future) or ready."""
+
+    def __init__(self, future=None, engine=None):
+        self.future = future
+        self.engine = engine
+
+
+class MatlabEnginePool:
+    """Long-lived pool of MATLAB engines with the NORDIC path already added.
+
+    Engines are started with ``start_matlab(background=True)`` so that MATLAB
+    boots while the caller does other work (BIDS discovery, noise detection).
+    An engine that no longer responds is quit and replaced, and ``close()``
+    shuts every engine down.
+    """
+
+    def __init__(self, nordic_path: str, size: int = 1):
+        if size < 1:
+            raise ValueError(f"Engine pool size must be >= 1, got {size}")
+        self.nordic_path = nordic_path
+        self.size = size
+        self._engine_mod = None
+        self._idle: "queue.Queue[_EngineSlot]" = queue.Queue()
+        self._slots: List[_EngineSlot] = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+    @property
+    def engine_module(self):
+        if self._engine_mod is None:
+            self._engine_mod = _import_matlab_engine()
+        return self._engine_mod
+
+    def start(self) -> None:
+        """Start all engines in the background (idempotent)."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MATLAB engine pool has been closed")
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.size):
+                self._idle.put(self._new_slot())
+
+    def _new_slot(self) -> _EngineSlot:
+        slot = _EngineSlot(future=self.engine_module.start_matlab(background=True))
+        self._slots.append(slot)
+        return slot
+
+    def _ready(self, slot: _EngineSlot):
+        if slot.engine is None:
+            slot.engine = slot.future.result()
+            slot.future = None
+            slot.engine.addpath(self.nordic_path, nargout=0)
+        return slot.engine
+
+    @staticmethod
+    def _alive(engine) -> bool:
+        try:
+            engine.eval("1;", nargout=0)
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, slot: _EngineSlot) -> None:
+        with self._lock:
+            if slot in self._slots:
+                self._slots.remove(slot)
+        engine, slot.engine = slot.engine, None
+        if engine is not None:
+            try:
+                engine.quit()
+            except Exception:
+                pass
+        elif slot.future is not None:
+            try:
+                slot.future.cancel()
+            except Exception:
+                pass
+
+    def _replace(self, slot: _EngineSlot) -> _EngineSlot:
+        self._discard(slot)
+        with self._lock:
+            return self._new_slot()
+
+    @contextmanager
+    def engine(self) -> Iterator[Any]:
+        """Borrow a ready engine for the duration of the ``with`` block.
+
+        A MATLAB-side error (``MatlabExecutionError``) leaves the engine in the
+        pool; any other failure is treated as a crashed engine, which is
+        quit and replaced by a freshly started one.
+        """
+        self.start()
+        slot = self._idle.get()
+        try:
+            try:
+                engine = self._ready(slot)
+            except Exception:
+                slot = self._replace(slot)
+                engine = self._ready(slot)
+            if not self._alive(engine):
+                slot = self._replace(slot)
+                engine = self._ready(slot)
+        except BaseException:
+            self._idle.put(self._replace(slot))
+            raise
+
+        try:
+            yield engine
+        except getattr(self.engine_module, "MatlabExecutionError", ()):
+            self._idle.put(slot)
+            raise
+        except BaseException:
+            self._idle.put(self._replace(slot))
+            raise
+        else:
+            self._idle.put(slot)
+
+    def close(self) -> None:
+        """Quit all engines. The pool cannot be used afterwards."""
+        with self._lock:
+            self._closed = True
+            slots, self._slots = list(self._slots), []
+        for slot in slots:
+            if slot.engine is None and slot.future is not None:
+                # A finished start still owns an engine; a pending one is cancelled
+                try:
+                    if slot.future.done():
+                        slot.engine = slot.future.result()
+                    else:
+                        slot.future.cancel()
+                except Exception:
+                    slot.engine = None
+                slot.future = None
+            if slot.engine is not None:
+                try:
+                    slot.engine.quit()
+                except Exception:
+                    pass
+                slot.engine = None
+
+
 class MatlabEngineBackend:
     """Backend that calls MATLAB via matlab.engine.
 
     Note: we import matlab.engine lazily so the package can be installed on
     machines without MATLAB, as long as this backend isn't used.
+
+    Engines are kept in a :class:`MatlabEnginePool` and reused across runs;
+    call ``close()`` (or use the backend as a context manager) when done.
+    With ``prestart=True`` the engines start booting in the background as
+    soon as the backend is created.
+
+    NORDIC is called with ``background=True`` so a hung call can be stopped
+    with :meth:`abort`; the engine it ran on is then replaced.
+
+    With ``array_function`` the backend can also :meth:`denoise` arrays in
+    memory. NIFTI_NORDIC.m only reads and writes NIfTI files, so this needs a
+    MATLAB function on the path with the signature
+    ``denoised = <array_function>(magnitude, phase, ARG)``, taking and
+    returning 4D single arrays (``phase`` is empty for magnitude-only data) and
+    the same ``ARG`` struct as NIFTI_NORDIC (``DIROUT`` unused).
     """
 
-    def __init__(self, nordic_path: str):
+    def __init__(self, nordic_path: str, pool_size: int = 1, prestart: bool = False,
+                 array_function: Optional[str] = None):
         self.nordic_path = nordic_path
+        self.array_function = array_function
+        self.pool = MatlabEnginePool(nordic_path, size=pool_size)
+        # Engine and pending result of the calls in flight, by calling thread
+        self._calls: Dict[int, Tuple[Any, Any]] = {}
+        if prestart:
+            self.pool.start()
 
     def run(self, magnitude_nii: str, phase_nii: str, output_base: str, args: NordicArgs) -> None:
+        with self.pool.engine() as eng:
+            arg_struct = eng.struct(to_matlab_struct_dict(args))
+            future = eng.NIFTI_NORDIC(magnitude_nii, phase_nii, output_base, arg_struct,
+                                      nargout=0, background=True)
+            self._wait(eng, future)
+
+    def denoise(self, magnitude, phase, args: NordicArgs):
+        """Denoise 4D arrays in the engine, without writing any file.
+
+        The arrays are handed over as ``matlab.single`` and the result comes
+        back through the buffer protocol (MATLAB R2022a or later).
+        """
+        import numpy as np
+
+        if self.array_function is None:
+            raise RuntimeError("In-memory NORDIC needs the name of a MATLAB array entry point (array_function)")
+        matlab = _import_matlab()
+        mag = matlab.single(np.asarray(magnitude, dtype=np.float32))
+        ph = matlab.single(np.asarray(phase, dtype=np.float32)) if phase is not None else matlab.single([])
+        with self.pool.engine() as eng:
+            arg_struct = eng.struct(to_matlab_struct_dict(args))
+            future = eng.feval(self.array_function, mag, ph, arg_struct, nargout=1, background=True)
+            del mag, ph
+            denoised = self._wait(eng, future)
+        out = np.asarray(denoised, dtype=np.float32)
+        if out.shape != magnitude.shape:
+            raise RuntimeError(f"{self.array_function} returned shape {out.shape}, expected {magnitude.shape}")
+        return out
+
+    def _wait(self, eng, future):
+        self._calls[threading.get_ident()] = (eng, future)
+        try:
+            return future.result()
+        finally:
+            self._calls.pop(threading.get_ident(), None)
+
+    def abort(self, thread_id: int) -> None:
+        """Stop the call made from thread ``thread_id``; it then fails.
+
+        The call is cancelled if MATLAB allows it, otherwise its engine is quit.
+        """
+        call = self._calls.get(thread_id)
+        if call is None:
+            return
+        eng, future = call
+        try:
+            if future.cancel():
+                return
+        except Exception:
+            pass
         try:
-            import matlab.engine  # type: ignore
-        except Exception as e:  # pragma: no cover
-            raise RuntimeError(
-                "Failed to import matlab.engine. Install/configure the MATLAB Engine API for Python, "
-                "or use the MCR backend."
-            ) from e
-
-        eng = matlab.engine.start_matlab()
-        eng.addpath(self.nordic_path, nargout=0)
-        arg_struct = eng.struct(to_matlab_struct_dict(args))
-        eng.NIFTI_NORDIC(magnitude_nii, phase_nii, output_base, arg_struct, nargout=0)
-        eng.quit()
+            eng.quit()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def __enter__(self) -> "MatlabEngineBackend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,10 +1,163 @@
 from __future__ import annotations
 
+import getpass
+import os
+import signal
+import socket
 import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 
 from . import NordicArgs, to_matlab_struct_dict
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows (the MCR runner needs WSL there anyway)
+    fcntl = None
+
+PIPELINE_SCRIPT = "run_nifti_nordic_pipeline.sh"
+BATCH_SCRIPT = "run_nordic_batch.sh"
+
+
+def _default_cache_base() -> Path:
+    if os.environ.get("MCR_CACHE_ROOT"):
+        return Path(os.environ["MCR_CACHE_ROOT"])
+    return Path(tempfile.gettempdir()) / f"nordic-mcr-cache-{getpass.getuser()}"
+
+
+def claim_cache_root(base: Optional[Path] = None) -> Tuple[Path, Optional[int]]:
+    """Claim a per-worker ``MCR_CACHE_ROOT`` under ``base`` for this process.
+
+    Slots ``<host>-0``, ``<host>-1``, ... are claimed with an exclusive
+    ``flock`` held for the life of the process, so concurrent workers never
+    share a cache (MCR does not support that), while a later worker reuses a
+    slot whose CTF archive is already extracted. Returns the directory and
+    the file descriptor holding the lock.
+    """
+    base = Path(base) if base is not None else _default_cache_base()
+    base.mkdir(parents=True, exist_ok=True)
+    host = socket.gethostname()
+    slot = 0
+    while True:
+        root = base / f"{host}-{slot}"
+        if fcntl is None:
+            root.mkdir(exist_ok=True)
+            return root, None
+        fd = os.open(str(base / f"{host}-{slot}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            slot += 1
+            continue
+        root.mkdir(exist_ok=True)
+        return root, fd
+
+
+def _log_tail(path: Path, lines: int = 40) -> str:
+    try:
+        with open(path, "r", errors="replace") as f:
+            return "".join(deque(f, maxlen=lines))
+    except OSError:
+        return ""
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    """Kill ``proc`` and everything it started (it leads its own session)."""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:  # pragma: no cover
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class _BatchProcess:
+    """One long-lived ``run_nordic_batch.sh`` process fed with jobs on stdin.
+
+    Jobs are handled one at a time; concurrent callers wait their turn.
+    ``owner`` is the thread whose job is running, if any.
+    """
+
+    def __init__(self, script: Path, mcr_path: str, env: Dict[str, str], log_path: Path, poll: float = 0.2):
+        self.script = script
+        self.mcr_path = mcr_path
+        self.env = env
+        self.log_path = log_path
+        self.poll = poll
+        self._proc: Optional[subprocess.Popen] = None
+        self._log = None
+        self._lock = threading.Lock()
+        self.owner: Optional[int] = None
+
+    def start(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        if self._log is None:
+            self._log = open(self.log_path, "a")
+        self._proc = subprocess.Popen(
+            [str(self.script), self.mcr_path],
+            stdin=subprocess.PIPE,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+            env=self.env,
+            text=True,
+            start_new_session=True,
+        )
+
+    def run(self, fields) -> None:
+        with self._lock:
+            self.owner = threading.get_ident()
+            try:
+                self._run(fields)
+            finally:
+                self.owner = None
+
+    def kill(self) -> None:
+        """Kill the process (and its MATLAB runtime); the running job then fails."""
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            _kill_group(proc)
+
+    def _run(self, fields) -> None:
+        self.start()
+        done = Path(tempfile.gettempdir()) / f"nordic-batch-{uuid.uuid4().hex}.done"
+        try:
+            self._proc.stdin.write("\t".join([str(done)] + [str(f) for f in fields]) + "\n")
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise RuntimeError(f"NORDIC (MCR batch) process has exited. Log tail ({self.log_path}):\n"
+                               f"{_log_tail(self.log_path)}") from e
+        while not done.exists():
+            if self._proc.poll() is not None:
+                raise RuntimeError(f"NORDIC (MCR batch) process exited with code {self._proc.returncode}. "
+                                   f"Log tail ({self.log_path}):\n{_log_tail(self.log_path)}")
+            time.sleep(self.poll)
+        status = done.read_text().strip()
+        done.unlink()
+        if status != "ok":
+            raise RuntimeError(f"NORDIC (MCR batch) failed: {status}. See {self.log_path}")
+
+    def close(self, timeout: float = 30.0) -> None:
+        proc, self._proc = self._proc, None
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.stdin.write("quit\n")
+                proc.stdin.close()
+                proc.wait(timeout=timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                proc.kill()
+                proc.wait()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
 
 class MCRBackend:
     """Backend that runs a compiled NORDIC pipeline using MATLAB Compiler Runtime.
@@ -12,19 +165,64 @@ class MCRBackend:
     This mirrors the original preprocess_nordic_mcr.py behavior:
       - calls <nordic_mcr_path>/run_nifti_nordic_pipeline.sh
       - passes MCR directory and other args as positional parameters
+
+    If the compiled distribution also contains ``run_nordic_batch.sh`` (built
+    from ``matlab/nordic_batch.m``), runs are instead sent to one long-lived
+    process, so the MCR starts once per backend rather than once per run
+    (``batch=None`` picks this automatically, ``batch=False`` disables it).
+
+    Each backend claims its own ``MCR_CACHE_ROOT`` slot (see
+    :func:`claim_cache_root`), which stays warm across invocations. The
+    runner's stdout/stderr are appended to a log file in ``log_dir`` rather
+    than kept in memory; errors quote its last lines.
     """
 
-    def __init__(self, mcr_path: str, nordic_mcr_path: str):
+    def __init__(
+        self,
+        mcr_path: str,
+        nordic_mcr_path: str,
+        batch: Optional[bool] = None,
+        log_dir: Optional[Path] = None,
+        cache_base: Optional[Path] = None,
+        prestart: bool = False,
+    ):
         self.mcr_path = mcr_path
         self.nordic_mcr_path = nordic_mcr_path
+        batch_script = Path(nordic_mcr_path) / BATCH_SCRIPT
+        self.batch = batch_script.exists() if batch is None else batch
+        if self.batch and not batch_script.exists():
+            raise FileNotFoundError(f"Could not find the compiled NORDIC batch runner at: {batch_script}")
+
+        self.log_dir = Path(log_dir) if log_dir is not None else Path(tempfile.gettempdir()) / "nordic-mcr-logs"
+        self.cache_base = cache_base
+        self._cache_root: Optional[Path] = None
+        self._cache_lock: Optional[int] = None
+        self._batch_proc: Optional[_BatchProcess] = None
+        # Runner processes of the calls in flight, by calling thread
+        self._procs: Dict[int, subprocess.Popen] = {}
+        if prestart and self.batch:
+            self._batch().start()
+
+    def _env(self) -> Dict[str, str]:
+        if self._cache_root is None:
+            self._cache_root, self._cache_lock = claim_cache_root(self.cache_base)
+        return {**os.environ, "MCR_CACHE_ROOT": str(self._cache_root)}
+
+    @property
+    def log_path(self) -> Path:
+        env = self._env()
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        return self.log_dir / f"nordic-mcr-{Path(env['MCR_CACHE_ROOT']).name}.log"
+
+    def _batch(self) -> _BatchProcess:
+        if self._batch_proc is None:
+            self._batch_proc = _BatchProcess(Path(self.nordic_mcr_path) / BATCH_SCRIPT, self.mcr_path,
+                                             self._env(), self.log_path)
+        return self._batch_proc
 
     def run(self, magnitude_nii: str, phase_nii: str, output_base: str, args: NordicArgs) -> None:
         arg_dict = to_matlab_struct_dict(args)
-        script_path = str(Path(self.nordic_mcr_path) / "run_nifti_nordic_pipeline.sh")
-
-        command = [
-            script_path,
-            self.mcr_path,
+        fields = [
             magnitude_nii,
             phase_nii,
             output_base,
@@ -33,15 +231,52 @@ class MCRBackend:
             str(arg_dict["DIROUT"]),
             str(arg_dict["noise_volume_last"]),
         ]
+        if self.batch:
+            self._batch().run(fields)
+            return
 
+        script_path = str(Path(self.nordic_mcr_path) / PIPELINE_SCRIPT)
+        command = [script_path, self.mcr_path] + fields
+        log_path = self.log_path
         try:
-            subprocess.run(command, check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:  # pragma: no cover
-            raise RuntimeError(
-                "NORDIC (MCR) failed. See captured stdout/stderr for details."
-                f"\nSTDOUT:\n{e.stdout}\nSTDERR:\n{e.stderr}"
-            ) from e
+            with open(log_path, "a") as log:
+                log.write(f"==== {time.strftime('%Y-%m-%d %H:%M:%S')} {output_base}\n")
+                log.flush()
+                proc = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=self._env(),
+                                        start_new_session=True)
+                self._procs[threading.get_ident()] = proc
+                try:
+                    returncode = proc.wait()
+                finally:
+                    self._procs.pop(threading.get_ident(), None)
         except FileNotFoundError as e:  # pragma: no cover
             raise FileNotFoundError(
                 f"Could not find the compiled NORDIC runner script at: {script_path}"
             ) from e
+        if returncode != 0:  # pragma: no cover
+            raise RuntimeError(
+                f"NORDIC (MCR) failed with exit code {returncode}. Log tail ({log_path}):\n"
+                f"{_log_tail(log_path)}"
+            )
+
+    def abort(self, thread_id: int) -> None:
+        """Kill the runner working on the call made from thread ``thread_id``.
+
+        The call then fails. A killed batch process is restarted by the next run.
+        """
+        proc = self._procs.get(thread_id)
+        if proc is not None:
+            _kill_group(proc)
+        batch = self._batch_proc
+        if batch is not None and batch.owner == thread_id:
+            batch.kill()
+
+    def close(self) -> None:
+        """Stop the batch process (if any) and release the MCR cache slot."""
+        if self._batch_proc is not None:
+            self._batch_proc.close()
+            self._batch_proc = None
+        if self._cache_lock is not None:
+            os.close(self._cache_lock)
+            self._cache_lock = None
+            self._cache_root = None
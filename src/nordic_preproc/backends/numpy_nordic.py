@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+
+from . import NordicArgs
+from ..nifti_ops import atomic_path
+
+# Ratio of patch voxels to volumes used to pick the patch size, as in NIFTI_NORDIC.m
+KERNEL_VOXELS_PER_VOLUME = 11
+# Patch batches per thread submitted ahead of the overlap-add
+BATCHES_PER_THREAD = 2
+
+
+class NordicCancelled(RuntimeError):
+    """Raised by :func:`nordic_denoise` when its ``cancel`` event is set."""
+
+
+def scale_phase(phase: np.ndarray) -> np.ndarray:
+    """Map a phase image to radians in [-pi, pi] from its own min/max range.
+
+    Mirrors NIFTI_NORDIC.m, which accepts phase in arbitrary units (e.g. the
+    scanner's integer range) and rescales it by its observed extent.
+    """
+    lo = float(np.min(phase))
+    hi = float(np.max(phase))
+    span = hi - lo
+    if span == 0:
+        return np.zeros(phase.shape, dtype=np.float32)
+    center = (hi + lo) / span / 2
+    return ((phase.astype(np.float32) / span - center) * (2 * np.pi)).astype(np.float32)
+
+
+def lowpass_phase(image: np.ndarray, filter_width: float, chunk: int = 16) -> np.ndarray:
+    """Return the phase of an in-plane low-pass filtered copy of ``image``.
+
+    Each slice of each volume is transformed to k-space, weighted by a Hann
+    (``tukeywin(n, 1)``) window raised to ``filter_width`` along x and y, and
+    transformed back, matching the ``temporal_phase == 1`` map of NORDIC.
+    Volumes are processed ``chunk`` at a time to bound the FFT workspace.
+    """
+    nx, ny = image.shape[:2]
+    window = (np.hanning(nx)[:, None] * np.hanning(ny)[None, :]) ** float(filter_width)
+    window = window.astype(np.float32)[:, :, None, None]
+    out = np.empty(image.shape, dtype=np.float32)
+    axes = (0, 1)
+    for start in range(0, image.shape[3], chunk):
+        block = image[..., start:start + chunk]
+        k = np.fft.ifftshift(np.fft.ifft2(np.fft.ifftshift(block, axes=axes), axes=axes), axes=axes)
+        k *= window
+        smooth = np.fft.fftshift(np.fft.fft2(np.fft.fftshift(k, axes=axes), axes=axes), axes=axes)
+        out[..., start:start + chunk] = np.angle(smooth)
+    return out
+
+
+def estimate_noise(image: np.ndarray, noise_volume_last: int) -> float:
+    """Estimate the noise standard deviation of the complex series.
+
+    With appended noise volumes (``noise_volume_last > 0``) this is the
+    standard deviation of their non-zero complex samples, as in NORDIC. Without
+    them it falls back to a robust (MAD-based) estimate from the temporal
+    differences of the real channel.
+    """
+    if noise_volume_last > 0:
+        noise = image[..., -noise_volume_last:]
+        noise = noise[noise != 0]
+        if noise.size:
+            return float(np.std(noise))
+    diff = np.diff(image.real, axis=3)
+    diff = diff[diff != 0]
+    if diff.size == 0:
+        return 0.0
+    # MAD -> sigma for a Gaussian, diff of two samples doubles the variance,
+    # and a complex sample has the variance of both channels.
+    sigma_real = 1.4826 * float(np.median(np.abs(diff - np.median(diff)))) / np.sqrt(2)
+    return sigma_real * np.sqrt(2)
+
+
+def kernel_size(shape: Sequence[int]) -> Tuple[int, int, int]:
+    """Cubic patch size giving ~11 voxels per volume, clipped to the image."""
+    k = max(2, int(round((shape[3] * KERNEL_VOXELS_PER_VOLUME) ** (1 / 3))))
+    return tuple(min(k, n) for n in shape[:3])  # type: ignore[return-value]
+
+
+def noise_threshold(n_voxels: int, n_volumes: int, sigma: float, repeats: int = 10,
+                    seed: int = 0) -> float:
+    """Largest singular value expected from pure noise in a patch matrix.
+
+    Computed by Monte Carlo over unit-variance complex Gaussian matrices of the
+    patch shape and scaled by the measured noise ``sigma``.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (repeats, n_voxels, n_volumes)
+    noise = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)) / np.sqrt(2)
+    s_max = np.linalg.svd(noise.astype(np.complex64), compute_uv=False)[:, 0]
+    return float(np.mean(s_max)) * float(sigma)
+
+
+def _patch_starts(n: int, k: int) -> List[int]:
+    step = max(1, k // 2)
+    starts = list(range(0, n - k + 1, step))
+    if starts[-1] != n - k:
+        starts.append(n - k)
+    return starts
+
+
+def _patch_batches(shape: Sequence[int], kernel: Sequence[int], batch_size: int) -> Iterator[np.ndarray]:
+    grids = np.meshgrid(*(_patch_starts(n, k) for n, k in zip(shape[:3], kernel)), indexing="ij")
+    starts = np.stack([g.ravel() for g in grids], axis=1)
+    for i in range(0, len(starts), batch_size):
+        yield starts[i:i + batch_size]
+
+
+def _denoise_batch(windows: np.ndarray, starts: np.ndarray, threshold: float) -> np.ndarray:
+    # windows: sliding_window_view of shape (px, py, pz, T, kx, ky, kz)
+    patches = windows[starts[:, 0], starts[:, 1], starts[:, 2]]  # (B, T, kx, ky, kz)
+    b, t = patches.shape[:2]
+    casorati = patches.reshape(b, t, -1).transpose(0, 2, 1)  # (B, voxels, T)
+    u, s, vh = np.linalg.svd(casorati, full_matrices=False)
+    s[s < threshold] = 0
+    denoised = np.matmul(u * s[:, None, :].astype(u.dtype), vh)
+    return denoised.transpose(0, 2, 1).reshape(patches.shape)
+
+
+def nordic_denoise(
+    magnitude: np.ndarray,
+    phase: Optional[np.ndarray],
+    args: NordicArgs,
+    n_threads: Optional[int] = None,
+    batch_size: int = 64,
+    cancel: Optional[threading.Event] = None,
+    on_batch: Optional[Callable[[], None]] = None,
+) -> np.ndarray:
+    """Denoise a 4D magnitude/phase series with locally low-rank patch PCA.
+
+    This follows NIFTI_NORDIC.m: the phase is rescaled to radians, the slowly
+    varying phase is removed with a low-pass filtered map (``temporal_phase``
+    >= 1, width ``phase_filter_width``), overlapping cubic patches are
+    denoised by hard-thresholding their singular values at the level expected
+    from the noise measured in the last ``noise_volume_last`` volumes, and
+    overlapping estimates are averaged. The g-factor normalisation and the
+    secondary phase-spike step of ``temporal_phase == 3`` are not performed.
+
+    Parameters
+    ----------
+    magnitude, phase:
+        4D arrays of the same shape; ``phase`` may be None (magnitude only).
+    args:
+        NordicArgs (``dirout`` is ignored).
+    n_threads:
+        Threads used for the batched SVDs (default: all cores).
+    batch_size:
+        Patches per batched SVD.
+    cancel:
+        Checked between patch batches; once set, the call stops and raises
+        :class:`NordicCancelled`.
+    on_batch:
+        Called after each patch batch has been added to the output.
+
+    Returns
+    -------
+    np.ndarray
+        Denoised magnitude, float32, same shape as the input.
+    """
+    if magnitude.ndim != 4:
+        raise ValueError(f"Expected a 4D magnitude series, got shape {magnitude.shape}")
+
+    def check_cancel() -> None:
+        if cancel is not None and cancel.is_set():
+            raise NordicCancelled("NORDIC was cancelled")
+    mag = np.asarray(magnitude, dtype=np.float32)
+    nonzero = mag[mag != 0]
+    scale = float(np.min(np.abs(nonzero))) if nonzero.size else 1.0
+
+    if phase is not None:
+        if phase.shape != magnitude.shape:
+            raise ValueError(f"Phase shape {phase.shape} does not match magnitude {magnitude.shape}")
+        image = (mag / scale) * np.exp(1j * scale_phase(phase)).astype(np.complex64)
+    else:
+        image = (mag / scale).astype(np.complex64)
+    del mag
+
+    background = None
+    if phase is not None and args.temporal_phase >= 1:
+        background = lowpass_phase(image, args.phase_filter_width)
+        image *= np.exp(-1j * background).astype(np.complex64)
+
+    check_cancel()
+    sigma = estimate_noise(image, int(args.noise_volume_last))
+    kernel = kernel_size(image.shape)
+    threshold = noise_threshold(int(np.prod(kernel)), image.shape[3], sigma)
+
+    windows = np.lib.stride_tricks.sliding_window_view(image, kernel, axis=(0, 1, 2))
+    accum = np.zeros(image.shape, dtype=np.complex64)
+    weights = np.zeros(image.shape[:3], dtype=np.float32)
+    kx, ky, kz = kernel
+
+    def work(starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return starts, _denoise_batch(windows, starts, threshold)
+
+    def add(done: Future) -> None:
+        starts, denoised = done.result()
+        check_cancel()
+        for (x, y, z), patch in zip(starts, denoised):
+            accum[x:x + kx, y:y + ky, z:z + kz, :] += patch.transpose(1, 2, 3, 0)
+            weights[x:x + kx, y:y + ky, z:z + kz] += 1
+        if on_batch is not None:
+            on_batch()
+
+    workers = n_threads or os.cpu_count() or 1
+    pending: Deque[Future] = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # LAPACK releases the GIL, so batches run concurrently; the overlap-add
+        # is done here in the calling thread. At most BATCHES_PER_THREAD batches
+        # per thread are in flight, which bounds the denoised patches waiting
+        # to be added. They are added in submission order, so the output does
+        # not depend on thread timing.
+        try:
+            for starts in _patch_batches(image.shape, kernel, batch_size):
+                if len(pending) >= BATCHES_PER_THREAD * workers:
+                    add(pending.popleft())
+                pending.append(pool.submit(work, starts))
+            while pending:
+                add(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+    del windows, image
+
+    accum /= weights[..., None]
+    if background is not None:
+        accum *= np.exp(1j * background).astype(np.complex64)
+    return (np.abs(accum) * scale).astype(np.float32)
+
+
+class NumpyBackend:
+    """Backend that runs a NumPy implementation of NORDIC in-process.
+
+    No MATLAB or MCR is needed. The output is written as
+    ``<dirout>/<output_base>.nii`` (float32), like NIFTI_NORDIC.m, so the rest
+    of the pipeline is unchanged. :meth:`denoise` works on arrays directly.
+    A call can be stopped with :meth:`abort`; it then fails at the next patch
+    batch, freeing its threads and arrays. :meth:`progress` counts the patch
+    batches a call has finished, for the watchdog.
+    """
+
+    def __init__(self, n_threads: Optional[int] = None, batch_size: int = 64):
+        self.n_threads = n_threads
+        self.batch_size = batch_size
+        self._cancel: Dict[int, threading.Event] = {}
+        self._batches: Dict[int, int] = {}
+
+    @contextlib.contextmanager
+    def _call(self) -> Iterator[dict]:
+        """Keyword arguments of :func:`nordic_denoise` for a call made from this thread."""
+        ident = threading.get_ident()
+        cancel = self._cancel[ident] = threading.Event()
+        self._batches[ident] = 0
+
+        def on_batch() -> None:
+            self._batches[ident] += 1
+
+        try:
+            yield dict(n_threads=self.n_threads, batch_size=self.batch_size, cancel=cancel, on_batch=on_batch)
+        finally:
+            self._cancel.pop(ident, None)
+            self._batches.pop(ident, None)
+
+    def run(self, magnitude_nii: str, phase_nii: str, output_base: str, args: NordicArgs) -> None:
+        with self._call() as kw:
+            mag_img = nib.load(magnitude_nii)
+            magnitude = np.asarray(mag_img.dataobj, dtype=np.float32)
+            phase = np.asarray(nib.load(phase_nii).dataobj, dtype=np.float32) if phase_nii else None
+            denoised = nordic_denoise(magnitude, phase, args, **kw)
+
+        header = mag_img.header.copy()
+        header.set_data_dtype(np.float32)
+        out_img = nib.Nifti1Image(denoised, mag_img.affine, header)
+        out_img.header.set_slope_inter(1, 0)
+        out_path = Path(args.dirout) / f"{output_base}.nii"
+        with atomic_path(out_path) as tmp:
+            nib.save(out_img, str(tmp))
+
+    def denoise(self, magnitude: np.ndarray, phase: Optional[np.ndarray], args: NordicArgs) -> np.ndarray:
+        """Denoise arrays in memory (see :func:`nordic_denoise`)."""
+        with self._call() as kw:
+            return nordic_denoise(magnitude, phase, args, **kw)
+
+    def abort(self, thread_id: int) -> None:
+        """Stop the call made from thread ``thread_id`` at its next patch batch."""
+        cancel = self._cancel.get(thread_id)
+        if cancel is not None:
+            cancel.set()
+
+    def progress(self, thread_id: int) -> int:
+        """Patch batches finished so far by the call made from thread ``thread_id``."""
+        return self._batches.get(thread_id, 0)
+
+    def close(self) -> None:
+        """Nothing is kept alive between runs."""
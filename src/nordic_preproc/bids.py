@@ -1,37 +1,50 @@
 from __future__ import annotations
 
 import json
-import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
-import nibabel as nib
-
-from .noise import find_noise_scans
-from .nifti_ops import split_4d_nifti, save_nifti, gzip_nii
+from .bids_index import BidsIndex, BidsRun
+from .nifti_ops import ImageCache, atomic_path, nifti_complete
 
 
 @dataclass(frozen=True)
 class DerivativePaths:
     out_dir: Path
     base: str
+    ext: str = ".nii.gz"
 
     @property
     def functional_raw(self) -> Path:
-        return self.out_dir / f"{self.base}_desc-functional_bold.nii.gz"
+        return self.out_dir / f"{self.base}_desc-functional_bold{self.ext}"
 
     @property
     def functional_nordic(self) -> Path:
-        return self.out_dir / f"{self.base}_desc-functional-nordic_bold.nii.gz"
+        return self.out_dir / f"{self.base}_desc-functional-nordic_bold{self.ext}"
 
     @property
     def noise_raw(self) -> Path:
-        return self.out_dir / f"{self.base}_desc-noise_bold.nii.gz"
+        return self.out_dir / f"{self.base}_desc-noise_bold{self.ext}"
 
     @property
     def noise_nordic(self) -> Path:
-        return self.out_dir / f"{self.base}_desc-noise-nordic_bold.nii.gz"
+        return self.out_dir / f"{self.base}_desc-noise-nordic_bold{self.ext}"
+
+    def qc_map(self, series: str, name: str) -> Path:
+        """QC map ``name`` ("mean", "std" or "tsnr") of the "raw" or "nordic" functional series."""
+        desc = "functional" if series == "raw" else "functional-nordic"
+        return self.out_dir / f"{self.base}_desc-{desc}_{name}{self.ext}"
+
+    @property
+    def qc_summary(self) -> Path:
+        return self.out_dir / f"{self.base}_desc-nordic_qc.json"
+
+    def expected(self, noise_present: bool) -> list:
+        """NIfTI outputs of a run, depending on whether noise scans were found."""
+        if not noise_present:
+            return [self.functional_nordic]
+        return [self.functional_raw, self.functional_nordic, self.noise_raw, self.noise_nordic]
 
 
 def write_dataset_description(deriv_root: Path) -> None:
@@ -55,31 +68,30 @@ def write_dataset_description(deriv_root: Path) -> None:
         ],
         "SourceDatasets": [{"URL": "file://../..", "Description": "Raw BIDS dataset"}],
     }
-    desc_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(desc_file, "w") as f:
+    with atomic_path(desc_file) as tmp, open(tmp, "w") as f:
         json.dump(desc, f, indent=4)
 
 
-def save_with_json(data, affine, out_path: Path, json_file: Path, description: str) -> None:
-    save_nifti(data, affine, out_path)
-    meta = {}
-    if json_file.exists():
-        with open(json_file, "r") as f:
-            meta = json.load(f)
+def write_sidecar(out_path: Path, json_file: Path, description: str,
+                  cache: Optional[ImageCache] = None) -> Path:
+    """Write the JSON sidecar of ``out_path``: the source sidecar plus a Description."""
+    if cache is not None:
+        meta = cache.sidecar(json_file)
+    else:
+        meta = {}
+        if json_file.exists():
+            with open(json_file, "r") as f:
+                meta = json.load(f)
     meta["Description"] = description
     json_out = out_path.with_suffix("").with_suffix(".json")
-    with open(json_out, "w") as f:
+    with atomic_path(json_out) as tmp, open(tmp, "w") as f:
         json.dump(meta, f, indent=4)
+    return json_out
 
 
 def outputs_exist(paths: DerivativePaths, noise_present: bool) -> bool:
-    expected = [paths.functional_nordic] if not noise_present else [
-        paths.functional_raw,
-        paths.functional_nordic,
-        paths.noise_raw,
-        paths.noise_nordic,
-    ]
-    return all(p.exists() for p in expected)
+    """True if every expected output is present and not truncated (see :func:`nifti_complete`)."""
+    return all(p.exists() and nifti_complete(p) for p in paths.expected(noise_present))
 
 
 from typing import Iterable, Optional, Sequence
@@ -110,34 +122,30 @@ def iter_bids_func_files(
     - Handles datasets with sessions (sub-*/ses-*/func) and without sessions (sub-*/func)
     - Skips phase files (part-phase) automatically
     """
-    subs = _normalize_bids_labels(participant_labels, "sub-")
-    sess = _normalize_bids_labels(session_labels, "ses-")
+    for run in discover_runs(bids_root, participant_labels, session_labels):
+        yield run.magnitude
 
-    # Build candidate patterns
-    patterns: list[str] = []
-
-    if subs is None:
-        sub_patterns = ["sub-*"]
-    else:
-        sub_patterns = subs
-
-    # If session labels not provided, include both "with ses" and "no ses" patterns
-    if sess is None:
-        for s in sub_patterns:
-            patterns.append(f"{s}/ses-*/func/*_bold.nii.gz")
-            patterns.append(f"{s}/func/*_bold.nii.gz")
-    else:
-        for s in sub_patterns:
-            for se in sess:
-                patterns.append(f"{s}/{se}/func/*_bold.nii.gz")
-
-    # Yield files
-    for pat in patterns:
-        for m_im in sorted(bids_root.glob(pat)):
-            if "part-phase" in m_im.name:
-                continue
-            yield m_im
 
+def discover_runs(
+    bids_root: Path,
+    participant_labels: Optional[Sequence[str]] = None,
+    session_labels: Optional[Sequence[str]] = None,
+    cache_file: Optional[Path] = None,
+    save: bool = True,
+) -> list[BidsRun]:
+    """Return the runs of a BIDS dataset (magnitude, phase and sidecar paths).
+
+    With ``cache_file`` the directory listing is kept between invocations and
+    only directories whose mtime changed are listed again (see
+    :class:`~nordic_preproc.bids_index.BidsIndex`). With ``save=False`` an
+    existing cache is used but not updated.
+    """
+    subs = _normalize_bids_labels(participant_labels, "sub-")
+    sess = _normalize_bids_labels(session_labels, "ses-")
+    index = BidsIndex(bids_root, cache_file=cache_file).refresh(subs)
+    if save:
+        index.save()
+    return list(index.runs(subs, sess))
 
 
 def corresponding_phase_file(magnitude_file: Path) -> Path:
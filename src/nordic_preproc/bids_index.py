@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+INDEX_VERSION = 1
+MAGNITUDE_SUFFIX = "_bold.nii.gz"
+PHASE_SUFFIX = "_part-phase_bold.nii.gz"
+
+# Directory mtimes this close to the scan time are not trusted: an entry added
+# in the same timestamp tick would not change the mtime again.
+MTIME_SETTLE_NS = 2_000_000_000
+
+
+@dataclass(frozen=True)
+class BidsRun:
+    """A magnitude BOLD file with its phase file and JSON sidecar, if present."""
+
+    magnitude: Path
+    phase: Optional[Path]
+    sidecar: Optional[Path]
+    entities: Dict[str, str] = field(default_factory=dict, compare=False, hash=False)
+
+
+def parse_entities(name: str) -> Dict[str, str]:
+    """Parse the ``key-value`` entities of a BIDS file name (the suffix is dropped)."""
+    stem = name.split(".", 1)[0]
+    out = {}
+    for part in stem.split("_")[:-1]:
+        key, sep, value = part.partition("-")
+        if sep:
+            out[key] = value
+    return out
+
+
+def _child_dirs(level: str, name: str) -> bool:
+    if level == "root":
+        return name.startswith("sub-")
+    if level == "sub":
+        return name.startswith("ses-") or name == "func"
+    if level == "ses":
+        return name == "func"
+    return False
+
+
+def _next_level(level: str, name: str) -> str:
+    if name == "func":
+        return "func"
+    return {"root": "sub", "sub": "ses"}[level]
+
+
+class BidsIndex:
+    """In-memory index of the magnitude/phase/JSON triples of a BIDS dataset.
+
+    The dataset is read with one ``os.scandir`` walk over ``sub-*``,
+    ``sub-*/ses-*`` and their ``func`` directories only. The listing is kept as
+    a tree of directories, each with the mtime it had when it was listed, and can
+    be saved to ``cache_file``. On the next :meth:`refresh` each directory is
+    only ``stat``-ed, and listed again only if its mtime changed, so an
+    unchanged dataset costs one stat per directory and no listings. Filtering by
+    participant or session only visits the selected subtrees. :attr:`changed`
+    holds the ``func`` directories the last refresh listed, i.e. those that are
+    new or whose entries may have changed.
+    """
+
+    def __init__(self, bids_root: Path, cache_file: Optional[Path] = None):
+        self.bids_root = Path(bids_root)
+        self.cache_file = Path(cache_file) if cache_file is not None else None
+        self._tree: Optional[Dict[str, Any]] = None
+        self.listed = 0  # directories listed by the last refresh, for reporting
+        self.changed: Set[Path] = set()
+        if self.cache_file is not None:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.cache_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("root") == str(self.bids_root.resolve()):
+            self._tree = data.get("tree")
+
+    def save(self) -> None:
+        """Write the index to ``cache_file`` atomically (no-op without one)."""
+        if self.cache_file is None or self._tree is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_file.with_name(self.cache_file.name + f".tmp{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump({"version": INDEX_VERSION, "root": str(self.bids_root.resolve()), "tree": self._tree}, f)
+        os.replace(tmp, self.cache_file)
+
+    def _scan(self, path: str, level: str, old: Optional[Dict[str, Any]],
+              only: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """Return the up-to-date node for ``path``, reusing ``old`` where valid.
+
+        ``only`` restricts which children are visited; the others are kept from
+        ``old`` unchanged.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        if old is not None and old.get("mtime_ns") == mtime:
+            node = {"mtime_ns": mtime, "files": old.get("files", []), "dirs": dict(old.get("dirs", {}))}
+            names = list(node["dirs"])
+        else:
+            self.listed += 1
+            if level == "func":
+                self.changed.add(Path(path))
+            files, names = [], []
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if _child_dirs(level, entry.name):
+                            names.append(entry.name)
+                    elif level == "func" and (entry.name.endswith(MAGNITUDE_SUFFIX)
+                                              or entry.name.endswith(".json")):
+                        files.append(entry.name)
+            trusted = time.time_ns() - mtime > MTIME_SETTLE_NS
+            node = {"mtime_ns": mtime if trusted else None, "files": sorted(files), "dirs": {}}
+            old_dirs = (old or {}).get("dirs", {})
+            node["dirs"] = {n: old_dirs.get(n) for n in sorted(names)}
+
+        for name in names:
+            if only is not None and name not in only:
+                continue
+            child = self._scan(os.path.join(path, name), _next_level(level, name), node["dirs"].get(name))
+            if child is None:
+                del node["dirs"][name]
+            else:
+                node["dirs"][name] = child
+        return node
+
+    def refresh(self, participant_labels: Optional[Sequence[str]] = None) -> "BidsIndex":
+        """Bring the index up to date, for the given ``sub-*`` labels or all subjects."""
+        self.listed = 0
+        self.changed = set()
+        # Unselected subjects are neither visited nor dropped from the cache
+        only = list(participant_labels) if participant_labels is not None else None
+        tree = self._scan(str(self.bids_root), "root", self._tree, only=only)
+        self._tree = tree or {"mtime_ns": None, "files": [], "dirs": {}}
+        return self
+
+    def _func_runs(self, func_dir: Path, node: Optional[Dict[str, Any]]) -> List[BidsRun]:
+        if node is None:
+            return []
+        files = set(node.get("files", []))
+        runs = []
+        for name in sorted(files):
+            if not name.endswith(MAGNITUDE_SUFFIX) or "part-phase" in name:
+                continue
+            phase = name[: -len(MAGNITUDE_SUFFIX)] + PHASE_SUFFIX
+            sidecar = name[: -len(".nii.gz")] + ".json"
+            runs.append(BidsRun(
+                magnitude=func_dir / name,
+                phase=func_dir / phase if phase in files else None,
+                sidecar=func_dir / sidecar if sidecar in files else None,
+                entities=parse_entities(name),
+            ))
+        return runs
+
+    def _collect(self, subjects: Sequence[str], session: Optional[str]) -> List[BidsRun]:
+        """Runs of ``subjects`` in ``session``: a ``ses-*`` label, "*" for every
+        session, or None for runs outside any session; sorted by path."""
+        runs = []
+        for sub in subjects:
+            node = (self._tree or {}).get("dirs", {}).get(sub)
+            if node is None:
+                continue
+            sub_dir = self.bids_root / sub
+            if session is None:
+                runs.extend(self._func_runs(sub_dir / "func", node["dirs"].get("func")))
+                continue
+            sessions = sorted(d for d in node["dirs"] if d != "func") if session == "*" else [session]
+            for ses in sessions:
+                ses_node = node["dirs"].get(ses)
+                if ses_node is not None:
+                    runs.extend(self._func_runs(sub_dir / ses / "func", ses_node["dirs"].get("func")))
+        return sorted(runs, key=lambda r: str(r.magnitude))
+
+    def runs(
+        self,
+        participant_labels: Optional[Sequence[str]] = None,
+        session_labels: Optional[Sequence[str]] = None,
+    ) -> Iterator[BidsRun]:
+        """Yield indexed runs, filtered by normalised ``sub-*``/``ses-*`` labels.
+
+        The order matches the former glob-based discovery: for each subject
+        label (or all subjects at once), runs in sessions first, then runs
+        without a session; with session labels, one session after the other.
+        """
+        if self._tree is None:
+            self.refresh(participant_labels)
+        groups = [sorted(self._tree["dirs"])] if participant_labels is None else [[s] for s in participant_labels]
+        for subjects in groups:
+            if session_labels is None:
+                yield from self._collect(subjects, "*")
+                yield from self._collect(subjects, None)
+            else:
+                for ses in session_labels:
+                    yield from self._collect(subjects, ses)
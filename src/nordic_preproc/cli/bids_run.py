@@ -1,24 +1,35 @@
 from __future__ import annotations
 
 import argparse
+import multiprocessing.util
 import os
+import shutil
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-
-import nibabel as nib
+from typing import TYPE_CHECKING, Optional, Union
 
 from ..backends import NordicArgs
-from ..backends.matlab_engine import MatlabEngineBackend
-from ..backends.mcr import MCRBackend
-from ..noise import find_noise_scans
-from ..nifti_ops import split_4d_nifti, gzip_nii
-from ..bids import (
-    write_dataset_description,
-    iter_bids_func_files,
-    corresponding_phase_file,
-    DerivativePaths,
-    outputs_exist,
-    save_with_json,
-)
+from ..bids_index import BidsRun
+from ..gzip_index import GzipIndex, index_file_for, load_index
+from ..leases import DEFAULT_LEASE_TTL, Lease, LeaseManager
+from ..manifest import WORK_DIR, Checkpoints, Manifest, file_fingerprint, reached, run_key
+from ..pipeline import advise_willneed, run_pipeline
+from ..preflight import DEFAULT_PREFLIGHT_THREADS, PreflightResult, format_report, preflight_runs
+from ..profiling import NULL_PROFILER, Profiler, format_bytes, load_trace, summarize_records
+from ..staging import ScratchDir, remove_stale
+from ..scheduler import Job, estimate_run_memory, parse_memory, run_jobs, summarize, RunOutcome
+from ..watch import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_TIME
+from ..watchdog import (DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF, DEFAULT_STALL_TIMEOUT, DEFAULT_TIMEOUT,
+                        DEFAULT_TIMEOUT_PER_VOLUME)
+
+# Modules that load NumPy/nibabel (noise detection, NIfTI I/O, backends, BIDS
+# outputs) are imported where they are used, so --help and --dry-run start fast.
+if TYPE_CHECKING:
+    import numpy as np
+
+    from ..bids import DerivativePaths
+    from ..nifti_ops import ImageCache
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -28,6 +39,8 @@ def build_parser() -> argparse.ArgumentParser:
     backend = p.add_mutually_exclusive_group(required=True)
     backend.add_argument("--matlab", action="store_true", help="Use MATLAB engine backend")
     backend.add_argument("--mcr", action="store_true", help="Use MATLAB Compiler Runtime backend")
+    backend.add_argument("--numpy", action="store_true",
+                         help="Use the built-in NumPy implementation of NORDIC (no MATLAB needed)")
 
     p.add_argument("--participant-label", nargs="+", default=None,
                    help="One or more participant labels (e.g., 01 02 or sub-01 sub-02). If omitted, processes all participants.")
@@ -36,100 +49,963 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument("--nordic_path", default="", help="Path to the NORDIC MATLAB scripts (for --matlab)")
     p.add_argument("--mcr_path", default="", help="Path to MATLAB Compiler Runtime directory (for --mcr)")
     p.add_argument("--nordic_mcr_path", default="./nordic_mcr/", help="Path to compiled NORDIC directory (for --mcr)")
+    p.add_argument("--no-mcr-batch", action="store_true",
+                   help="Start the compiled runner once per run even if run_nordic_batch.sh is available (for --mcr)")
+    p.add_argument("--mcr-cache-root", default=None,
+                   help="Directory holding one MCR_CACHE_ROOT per worker, kept warm between invocations "
+                        "(for --mcr; default: $MCR_CACHE_ROOT or a per-user temporary directory)")
+    p.add_argument("--threads", type=int, default=None,
+                   help="Threads for patch SVDs (for --numpy; default: all cores divided by --n-jobs)")
+    p.add_argument("--engine-pool-size", type=int, default=1,
+                   help="Number of MATLAB engines kept alive and reused across runs (for --matlab)")
 
     p.add_argument("--temporal_phase", type=int, default=1, help="Temporal phase argument for NORDIC")
     p.add_argument("--phase_filter_width", type=float, default=10.0, help="Phase filter width argument for NORDIC")
     p.add_argument("--mad_thresh", type=float, default=50, help="MAD multiplier for noise scan detection")
-    p.add_argument("--overwrite", action="store_true", help="Overwrite existing outputs")
+    p.add_argument("--overwrite", action="store_true",
+                   help="Recompute every run, even if the manifest shows its outputs are up to date")
+    p.add_argument("--compress-level", type=int, default=None, choices=range(1, 10),
+                   metavar="{1..9}", help="gzip level for .nii.gz outputs (compressed in parallel; default 1)")
+    p.add_argument("--no-compress", action="store_true", help="Write uncompressed .nii outputs")
+    p.add_argument("--output-dtype", choices=["float32", "int16"], default="float32",
+                   help="On-disk type of NORDIC outputs (int16 is rescaled via scl_slope/scl_inter). "
+                        "Raw outputs always keep the input's type and scaling")
+    p.add_argument("--n-jobs", type=int, default=1,
+                   help="Number of runs processed in parallel (separate worker processes)")
+    p.add_argument("--pipeline-depth", type=int, default=1,
+                   help="Without --n-jobs: runs prepared ahead of (and written behind) the backend, which "
+                        "overlaps noise detection and output writing with NORDIC. Each run in flight can hold "
+                        "up to --cache-gb of decoded data. 0 processes runs strictly one after another")
+    p.add_argument("--shared", action="store_true",
+                   help="Share the dataset with other nordic-bids processes (any node with the same "
+                        "derivatives directory): each run is claimed through a lease file, so workers "
+                        "pull the next unclaimed run until none are left")
+    p.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL,
+                   help="Seconds without a heartbeat after which another worker takes over a claimed run "
+                        "(for --shared)")
+    p.add_argument("--max-memory", type=parse_memory, default=None,
+                   help="Memory budget shared by parallel runs, e.g. 200G. A run starts only when its "
+                        "estimated peak memory (from the NIfTI header) fits under the budget")
+    p.add_argument("--slab-memory", type=parse_memory, default=None,
+                   help="Memory budget for one NORDIC call, e.g. 32G. Runs that do not fit are cut into "
+                        "overlapping slabs along z, denoised slab by slab and stitched back together")
+    p.add_argument("--slab-size", type=int, default=None,
+                   help="Slices per slab (overrides the size derived from --slab-memory)")
+    p.add_argument("--slab-overlap", type=int, default=None,
+                   help="Slices shared by neighbouring slabs (default: one NORDIC patch width)")
+    p.add_argument("--slab-jobs", type=int, default=1,
+                   help="Slabs of one run processed at once; --slab-memory is shared between them")
+    p.add_argument("--in-memory", action="store_true",
+                   help="Hand each run's decoded magnitude and phase to the backend as arrays and split its "
+                        "result directly, without writing or re-reading the full NORDIC output (for --numpy, "
+                        "and for --matlab with --matlab-array-function). A run then holds its magnitude, "
+                        "phase and result in memory")
+    p.add_argument("--matlab-array-function", default=None, metavar="NAME",
+                   help="MATLAB function used by --matlab --in-memory, called as "
+                        "denoised = NAME(magnitude, phase, ARG)")
+    p.add_argument("--backend-timeout", type=float, default=DEFAULT_TIMEOUT,
+                   help="Seconds a NORDIC call may take, plus --backend-timeout-per-volume for each volume; "
+                        "a call that runs longer is killed (0 together with a per-volume value of 0: no limit)")
+    p.add_argument("--backend-timeout-per-volume", type=float, default=DEFAULT_TIMEOUT_PER_VOLUME,
+                   help="Seconds added to --backend-timeout per volume of the run")
+    p.add_argument("--stall-timeout", type=float, default=DEFAULT_STALL_TIMEOUT,
+                   help="Kill a NORDIC call that neither used CPU nor grew its output for this many "
+                        "seconds (0: never)")
+    p.add_argument("--backend-retries", type=int, default=DEFAULT_RETRIES,
+                   help="Times a failed or killed NORDIC call is retried before the run counts as failed")
+    p.add_argument("--retry-backoff", type=float, default=DEFAULT_RETRY_BACKOFF,
+                   help="Seconds before the first retry; doubled for each further retry")
+    p.add_argument("--profile", nargs="?", const="", default=None, metavar="TRACE",
+                   help="Record wall/CPU time, peak memory and I/O of each stage of each run to a JSON-lines "
+                        "trace (default: derivatives/nordic/.nordic/profile/trace-<time>.jsonl) and print "
+                        "a summary table at the end")
+    p.add_argument("--scratch-dir", default=None,
+                   help="Fast local directory (e.g. node-local SSD or /dev/shm) where each run's inputs are "
+                        "staged uncompressed and the backend writes its full output; only the split "
+                        "derivatives are written to derivatives/nordic. Needs about twice the uncompressed "
+                        "run size per run in flight (on /dev/shm this counts as memory)")
+    p.add_argument("--cache-gb", type=float, default=4.0,
+                   help="Memory budget (GB) for keeping decoded images between detection, splitting and saving")
+    p.add_argument("--preflight", choices=["exclude", "abort", "off"], default="exclude",
+                   help="Check every run's magnitude/phase headers (matrix, voxel size, affine, volume count, "
+                        "data type, phase range) and sidecar before any backend call. 'exclude' reports "
+                        "runs that fail as failed and processes the rest, 'abort' stops if any run fails")
+    p.add_argument("--preflight-threads", type=int, default=DEFAULT_PREFLIGHT_THREADS,
+                   help="Threads reading headers during preflight")
+    p.add_argument("--dry-run", action="store_true",
+                   help="Print which runs would be processed, skipped or lack a phase file, with estimated "
+                        "peak memory and output size, then exit. Reads NIfTI headers only and writes nothing")
+    p.add_argument("--qc", action="store_true",
+                   help="While splitting, also compute per-voxel mean, std and tSNR maps of the raw and NORDIC "
+                        "functional series and the noise level of the noise volumes, and write them with a "
+                        "JSON summary (_desc-nordic_qc.json) next to the derivatives")
+    p.add_argument("--watch", action="store_true",
+                   help="Keep running: process the dataset, then poll it for new or changed runs and "
+                        "process each as soon as its files are complete, with the backend kept running "
+                        "between runs. Stop with Ctrl-C or SIGTERM")
+    p.add_argument("--watch-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                   help="Seconds between scans of the dataset in --watch mode")
+    p.add_argument("--settle-time", type=float, default=DEFAULT_SETTLE_TIME,
+                   help="Seconds a run's files must go unchanged before --watch processes it")
+    p.add_argument("--watch-idle-exit", type=float, default=0.0,
+                   help="Leave --watch mode after this many seconds without new or changed runs "
+                        "(0 = never)")
     return p
 
 
-def main(argv=None) -> None:
-    args = build_parser().parse_args(argv)
-    bids_root = Path(args.bids_root)
-    deriv_root = bids_root / "derivatives" / "nordic"
-    deriv_root.mkdir(parents=True, exist_ok=True)
-    write_dataset_description(deriv_root)
-
+def make_backend(args, prestart: bool = True, log_dir: Optional[Path] = None):
     if args.matlab:
-        backend = MatlabEngineBackend(nordic_path=args.nordic_path)
+        from ..backends.matlab_engine import MatlabEngineBackend
+
+        backend = MatlabEngineBackend(nordic_path=args.nordic_path, pool_size=args.engine_pool_size,
+                                      prestart=prestart, array_function=args.matlab_array_function)
+    elif args.numpy:
+        from ..backends.numpy_nordic import NumpyBackend
+
+        threads = args.threads or max(1, (os.cpu_count() or 1) // max(1, args.n_jobs))
+        backend = NumpyBackend(n_threads=threads)
     else:
-        backend = MCRBackend(mcr_path=args.mcr_path, nordic_mcr_path=args.nordic_mcr_path)
+        from ..backends.mcr import MCRBackend
 
-    func_files = list(
-        iter_bids_func_files(
-            bids_root,
-            participant_labels=args.participant_label,
-            session_labels=args.session_label,
-        )
-    )
+        backend = MCRBackend(mcr_path=args.mcr_path, nordic_mcr_path=args.nordic_mcr_path,
+                             batch=False if args.no_mcr_batch else None, log_dir=log_dir,
+                             cache_base=args.mcr_cache_root, prestart=prestart)
+    return with_slabs(with_watchdog(backend, args), args)
 
-    if not func_files:
-        print("No functional files found matching: sub-*/ses-*/func/*_bold.nii.gz")
-        return
 
-    for m_im in func_files:
+def with_watchdog(backend, args):
+    """Wrap ``backend`` in a :class:`~nordic_preproc.watchdog.SupervisedBackend` unless every limit is off.
+
+    A backend without ``abort()`` is not wrapped: a call over its limit could
+    only be left running, holding its memory while the next runs start.
+    """
+    if getattr(backend, "abort", None) is None:
+        return backend
+    if (args.backend_timeout <= 0 and args.backend_timeout_per_volume <= 0 and args.stall_timeout <= 0
+            and args.backend_retries <= 0):
+        return backend
+    from ..watchdog import SupervisedBackend
+
+    return SupervisedBackend(backend, timeout=args.backend_timeout,
+                             timeout_per_volume=args.backend_timeout_per_volume,
+                             stall_timeout=args.stall_timeout, retries=args.backend_retries,
+                             backoff=args.retry_backoff)
+
+
+def with_slabs(backend, args):
+    """Wrap ``backend`` in a :class:`~nordic_preproc.slabs.SlabBackend` if slabs were requested."""
+    if args.slab_memory is None and args.slab_size is None:
+        return backend
+    from ..slabs import SlabBackend
+
+    return SlabBackend(backend, memory=args.slab_memory, slab_size=args.slab_size, overlap=args.slab_overlap,
+                       jobs=args.slab_jobs)
+
+
+def backend_name(args) -> str:
+    return "matlab" if args.matlab else "numpy" if args.numpy else "mcr"
+
+
+def run_params(args) -> dict:
+    """Parameters that change a run's outputs; part of its manifest key."""
+    return {
+        "backend": backend_name(args),
+        "temporal_phase": args.temporal_phase,
+        "phase_filter_width": args.phase_filter_width,
+        "mad_thresh": args.mad_thresh,
+        "output_dtype": args.output_dtype,
+        "ext": ".nii" if args.no_compress else ".nii.gz",
+        **slab_params(args),
+        # A MATLAB array entry point is different code from NIFTI_NORDIC
+        **({"array_function": args.matlab_array_function} if args.in_memory and args.matlab else {}),
+        **({"qc": True} if args.qc else {}),
+    }
+
+
+def slab_params(args) -> dict:
+    """Slab settings, which change the stitched output slightly; empty for whole runs."""
+    if args.slab_memory is None and args.slab_size is None:
+        return {}
+    return {"slabs": {"memory": args.slab_memory, "size": args.slab_size, "overlap": args.slab_overlap}}
+
+
+@dataclass
+class RunPlan:
+    """A run that needs computing, with everything the later stages need."""
+
+    m_im: Path
+    ph_im: Path
+    json_file: Path
+    rel_path: Path
+    label: str
+    base: str
+    paths: DerivativePaths
+    cache: ImageCache
+    noise_inds: np.ndarray
+    key: str
+    inputs: dict
+    params: dict
+    nordic_file: Optional[Path] = None
+    lease: Optional[Lease] = None
+    scratch: Optional[ScratchDir] = None
+    staged: Optional[tuple] = None
+    checkpoints: Optional[Checkpoints] = None
+    state: dict = field(default_factory=dict)
+    index: Optional[GzipIndex] = None
+    # Denoised series of an --in-memory run, used instead of nordic_file
+    nordic_data: Optional[np.ndarray] = None
+
+    def checkpoint(self, stage: str, **data) -> None:
+        """Record that ``stage`` of this run finished (see :class:`~nordic_preproc.manifest.Checkpoints`).
+
+        Nothing is recorded once the lease is lost: the checkpoint is the new owner's.
+        """
+        if self.checkpoints is not None and not (self.lease is not None and self.lease.lost):
+            self.state = self.checkpoints.save(self.rel_path, self.key, stage, **data)
+
+    def lease_lost(self) -> bool:
+        """True if another worker took this run over (see :meth:`~nordic_preproc.leases.Lease.check`)."""
+        if self.lease is None:
+            return False
+        noticed = self.lease.lost
+        if not self.lease.check():
+            return False
+        if not noticed:
+            print(f"Stopping {self.label}: its lease was taken over by another worker")
+        return True
+
+    def release(self) -> None:
+        """Free the run's decoded data, scratch directory and lease, if any."""
+        self.cache.clear()
+        self.nordic_data = None
+        if self.scratch is not None:
+            # The new owner of a lost run keeps its own checkpoints
+            if self.lease is None or not self.lease.lost:
+                self._keep_backend_output()
+            self.scratch.cleanup()
+        if self.lease is not None:
+            self.lease.release()
+
+    def _keep_backend_output(self) -> None:
+        # A run that fails after the backend keeps its NORDIC output next to the
+        # derivatives, so a restart resumes from it instead of losing it with
+        # the scratch directory.
+        from ..nifti_ops import atomic_path
+
+        nordic = self.nordic_file
+        if self.checkpoints is None or nordic is None or not nordic.exists() or nordic.parent != self.scratch.path:
+            return
+        dest = self.paths.out_dir / nordic.name
+        with atomic_path(dest) as tmp:
+            shutil.move(str(nordic), str(tmp))
+        self.nordic_file = dest
+        self.checkpoint(self.state.get("stage", "backend"),
+                        nordic_file={"path": str(dest), "size": dest.stat().st_size})
+
+    @property
+    def magnitude(self) -> Path:
+        """The magnitude file read by the backend and the raw split (staged copy, if any)."""
+        return self.staged[0] if self.staged else self.m_im
+
+    @property
+    def phase(self) -> Path:
+        return self.staged[1] if self.staged else self.ph_im
+
+    @property
+    def work_dir(self) -> Path:
+        """Where the backend writes its full output."""
+        return self.scratch.path if self.scratch is not None else self.paths.out_dir
+
+    @property
+    def noise_present(self) -> bool:
+        return len(self.noise_inds) > 0
+
+
+def prepare_run(m_im: Path, args, bids_root: Path, deriv_root: Path, run: Optional[BidsRun] = None,
+                profiler: Profiler = NULL_PROFILER, leases: Optional[LeaseManager] = None) -> Union[RunPlan, str]:
+    """First stage of a run: decide whether it is needed and detect noise scans.
+
+    With ``leases`` the run is claimed first and the lease is kept in the
+    returned plan until :meth:`RunPlan.release`. Returns a :class:`RunPlan`, or
+    the final status ("skipped", "no-phase", or "claimed" when another worker
+    holds the run) if there is nothing to compute.
+    """
+    from ..bids import corresponding_phase_file
+
+    json_file = m_im.with_suffix("").with_suffix(".json")
+    if run is not None:
+        ph_im = run.phase
+        has_sidecar = run.sidecar is not None
+    else:
         ph_im = corresponding_phase_file(m_im)
-        if not ph_im.exists():
-            print(f"Skipping {m_im}, no phase file found")
-            continue
+        ph_im = ph_im if ph_im.exists() else None
+        has_sidecar = json_file.exists()
+    if ph_im is None:
+        print(f"Skipping {m_im}, no phase file found")
+        return "no-phase"
+
+    rel_path = m_im.relative_to(bids_root)
+    out_dir = deriv_root / rel_path.parent
+    label = str(rel_path)
 
-        rel_path = m_im.relative_to(bids_root)
-        out_dir = deriv_root / rel_path.parent
-        out_dir.mkdir(parents=True, exist_ok=True)
+    lease = None
+    if leases is not None:
+        lease = leases.acquire(rel_path)
+        if lease is None:
+            print(f"Skipping {m_im}, claimed by another worker")
+            return "claimed"
+    try:
+        plan = _prepare_claimed(m_im, ph_im, json_file, has_sidecar, rel_path, out_dir, label,
+                                args, deriv_root, profiler)
+    except BaseException:
+        if lease is not None:
+            lease.release()
+        raise
+    if isinstance(plan, str):
+        if lease is not None:
+            lease.release()
+        return plan
+    plan.lease = lease
+    return plan
 
-        base = m_im.name.replace("_bold.nii.gz", "")
-        paths = DerivativePaths(out_dir=out_dir, base=base)
 
-        det = find_noise_scans(str(m_im), mad_thresh=args.mad_thresh)
-        noise_inds = det.noise_indices
+def _prepare_claimed(m_im: Path, ph_im: Path, json_file: Path, has_sidecar: bool, rel_path: Path,
+                     out_dir: Path, label: str, args, deriv_root: Path,
+                     profiler: Profiler) -> Union[RunPlan, str]:
+    import numpy as np
+
+    from ..bids import DerivativePaths, outputs_exist
+    from ..nifti_ops import ImageCache
+    from ..noise import find_noise_scans
+
+    # The manifest decides from input fingerprints and parameters alone, before any
+    # image data is read. Runs without an entry (older derivatives) fall back to
+    # checking that the output files exist, and are then adopted into the manifest.
+    manifest = Manifest(deriv_root)
+    params = run_params(args)
+    with profiler.stage("manifest-check", run=label):
+        inputs = {
+            "magnitude": file_fingerprint(m_im),
+            "phase": file_fingerprint(ph_im),
+            "sidecar": file_fingerprint(json_file) if has_sidecar else None,
+        }
+        key = run_key(inputs, params)
+        entry = manifest.load(rel_path)
+        current = not args.overwrite and manifest.is_current(entry, key)
+    if current:
+        print(f"Skipping {m_im}, outputs are up to date.")
+        return "skipped"
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base = m_im.name.replace("_bold.nii.gz", "")
+    paths = DerivativePaths(out_dir=out_dir, base=base, ext=params["ext"])
+    # An interrupted earlier attempt resumes after its last finished stage
+    checkpoints = Checkpoints(deriv_root)
+    state = {} if args.overwrite else checkpoints.load(rel_path, key)
+
+    # The magnitude is staged before detection, so it reads the uncompressed copy;
+    # the phase only once the run is known to need computing
+    scratch, staged = None, None
+    if args.scratch_dir:
+        scratch = ScratchDir(Path(args.scratch_dir), tag=base)
+    try:
+        if scratch is not None:
+            with profiler.stage("stage", run=label):
+                staged = (scratch.stage(m_im), None)
+        # Decoded images are shared by detection, splitting and saving for this run
+        cache = ImageCache(max_bytes=int(args.cache_gb * 1024**3))
+        # A compressed magnitude is read through its seek-point index, which the
+        # detection pass builds the first time and later reads reuse
+        index, index_dir = None, deriv_root / WORK_DIR / "gzindex"
+        if staged is None and m_im.name.endswith(".gz"):
+            index = load_index(m_im, cache_dir=index_dir)
+        if reached(state, "detected"):
+            noise_inds = np.asarray(state["noise_indices"], dtype=np.int64)
+        else:
+            with profiler.stage("detect", run=label):
+                det = find_noise_scans(str(staged[0] if staged else m_im), mad_thresh=args.mad_thresh,
+                                       cache=cache, index=index)
+            noise_inds = det.noise_indices
+        if index is not None and index.dirty and len(index.points) > 1:
+            index.save(index_file_for(m_im, cache_dir=index_dir))
         noise_present = len(noise_inds) > 0
 
-        if (not args.overwrite) and outputs_exist(paths, noise_present=noise_present):
+        if state:
+            print(f"Resuming {m_im} after stage '{state['stage']}'.")
+        elif entry is not None and not args.overwrite:
+            print(f"Inputs or parameters changed for {m_im}, recomputing.")
+        elif (not args.overwrite) and outputs_exist(paths, noise_present=noise_present):
             print(f"Skipping {m_im}, outputs already exist.")
-            continue
+            existing = paths.expected(noise_present)
+            existing += [p.with_suffix("").with_suffix(".json") for p in existing]
+            manifest.record(rel_path, key, inputs, params, noise_inds,
+                            {p: None for p in existing if p.exists()})
+            cache.clear()
+            if scratch is not None:
+                scratch.cleanup()
+            return "skipped"
+
+        if scratch is not None:
+            with profiler.stage("stage", run=label):
+                staged = (staged[0], scratch.stage(ph_im))
+    except BaseException:
+        if scratch is not None:
+            scratch.cleanup()
+        raise
+
+    plan = RunPlan(m_im=m_im, ph_im=ph_im, json_file=json_file, rel_path=rel_path, label=label, base=base,
+                   paths=paths, cache=cache, noise_inds=noise_inds, key=key, inputs=inputs, params=params,
+                   scratch=scratch, staged=staged, checkpoints=checkpoints, state=state, index=index)
+    if not state:
+        plan.checkpoint("detected", noise_indices=[int(i) for i in noise_inds])
+    return plan
+
+
+def _intact(record: Optional[dict]) -> bool:
+    """True if a checkpointed file (``{"path", "size"}``) still exists with its recorded size."""
+    if not record:
+        return False
+    try:
+        return Path(record["path"]).stat().st_size == record["size"]
+    except OSError:
+        return False
 
+
+def compute_run(plan: RunPlan, args, backend, profiler: Profiler = NULL_PROFILER) -> RunPlan:
+    """Second stage of a run: call the NORDIC backend and locate its output.
+
+    An output checkpointed by an earlier attempt is reused if it is intact.
+    With ``--in-memory`` the backend denoises the decoded arrays instead and
+    the result is kept in ``plan.nordic_data``; nothing is written.
+    A run whose lease was taken over is left to its new owner (see
+    :func:`finish_run`).
+    """
+    if plan.lease_lost():
+        return plan
+    if args.in_memory:
+        import numpy as np
+
+        from ..nifti_ops import split_4d_nifti
+
+        with profiler.stage("load", run=plan.label):
+            magnitude = split_4d_nifti(str(plan.magnitude), [], cache=plan.cache, dtype=np.float32,
+                                       index=plan.index)[0]
+            phase = split_4d_nifti(str(plan.phase), [], dtype=np.float32)[0]
         nordic_args = NordicArgs(
             temporal_phase=args.temporal_phase,
             phase_filter_width=args.phase_filter_width,
-            noise_volume_last=int(len(noise_inds)),
-            dirout=str(out_dir) + "/",
+            noise_volume_last=int(len(plan.noise_inds)),
         )
+        with profiler.stage("backend", run=plan.label):
+            plan.nordic_data = backend.denoise(magnitude, phase, nordic_args)
+        return plan
+
+    if reached(plan.state, "backend") and _intact(plan.state.get("nordic_file")):
+        plan.nordic_file = Path(plan.state["nordic_file"]["path"])
+        print(f"Reusing NORDIC output {plan.nordic_file}")
+        return plan
 
-        backend.run(str(m_im), str(ph_im), base, nordic_args)
+    out_dir = plan.work_dir
+    nordic_args = NordicArgs(
+        temporal_phase=args.temporal_phase,
+        phase_filter_width=args.phase_filter_width,
+        noise_volume_last=int(len(plan.noise_inds)),
+        dirout=str(out_dir) + "/",
+    )
+
+    with profiler.stage("backend", run=plan.label):
+        backend.run(str(plan.magnitude), str(plan.phase), plan.base, nordic_args)
+
+    # The full NORDIC output is deleted after splitting, so an uncompressed .nii is
+    # read as-is rather than recompressed first.
+    nordic_out_gz = out_dir / f"{plan.base}.nii.gz"
+    nordic_out = out_dir / f"{plan.base}.nii"
+    if nordic_out.exists():
+        plan.nordic_file = nordic_out
+    elif nordic_out_gz.exists():
+        plan.nordic_file = nordic_out_gz
+    else:
+        raise FileNotFoundError(f"No NORDIC output found for {plan.base}")
+    if plan.lease_lost():
+        return plan
+    plan.checkpoint("backend", nordic_file={"path": str(plan.nordic_file), "size": plan.nordic_file.stat().st_size})
+    return plan
 
-        nordic_out_gz = out_dir / f"{base}.nii.gz"
-        nordic_out = out_dir / f"{base}.nii"
-        if nordic_out.exists():
-            nordic_file = gzip_nii(nordic_out)
-        elif nordic_out_gz.exists():
-            nordic_file = nordic_out_gz
+
+def finish_run(plan: RunPlan, args, deriv_root: Path, profiler: Profiler = NULL_PROFILER) -> str:
+    """Last stage of a run: write the split derivatives, sidecars and manifest entry.
+
+    Splits checkpointed by an earlier attempt are kept if they are intact. The
+    full NORDIC output is only removed once the manifest entry is written.
+    With ``--qc`` the statistics for the QC maps are gathered by the splits.
+    A run whose lease was taken over by another worker writes and records
+    nothing and returns "claimed".
+    """
+    from ..bids import write_sidecar
+    from ..nifti_ops import stream_split_nifti
+    from ..qc import QC_MAPS, SplitStats, series_stats, write_qc
+
+    m_im, paths, cache, json_file, label = plan.magnitude, plan.paths, plan.cache, plan.json_file, plan.label
+    noise_inds, nordic_file = plan.noise_inds, plan.nordic_file
+    if plan.lease_lost():
+        plan.release()
+        return "claimed"
+    nordic_src = plan.nordic_data if plan.nordic_data is not None else nordic_file
+
+    # Raw splits keep the source encoding (dtype, scl_slope/scl_inter); NORDIC splits are
+    # stored as --output-dtype. Both keep the source header (TR, units, qform/sform) and are
+    # streamed a few volumes at a time straight into the functional/noise outputs.
+    split_kw = dict(header=cache.header(m_im), affine=cache.affine(m_im), cache=cache,
+                    compress_level=args.compress_level)
+    # Splits are compressed while they are written, so "split" includes gzip and save
+    outputs = {}
+    raw_stats, nordic_stats = (SplitStats(), SplitStats()) if args.qc else (None, None)
+    done = plan.state.get("outputs", {}) if reached(plan.state, "split") else {}
+    if done and all(_intact({"path": p, "size": rec["size"]}) for p, rec in done.items()):
+        outputs = {Path(p): rec["sha256"] for p, rec in done.items()}
+    elif plan.noise_present:
+        with profiler.stage("split-raw", run=label):
+            outputs.update(stream_split_nifti(m_im, noise_inds, paths.functional_raw, paths.noise_raw,
+                                              index=plan.index, stats=raw_stats, **split_kw))
+        with profiler.stage("split-nordic", run=label):
+            outputs.update(stream_split_nifti(nordic_src, noise_inds, paths.functional_nordic,
+                                              paths.noise_nordic, dtype=args.output_dtype, stats=nordic_stats,
+                                              **split_kw))
+    else:
+        print(f"No noise scans detected for {plan.m_im}")
+        with profiler.stage("split-nordic", run=label):
+            outputs.update(stream_split_nifti(nordic_src, noise_inds, paths.functional_nordic,
+                                              dtype=args.output_dtype, stats=nordic_stats, **split_kw))
+    if args.qc and not done:
+        # QC maps are checkpointed with the splits they were computed from
+        with profiler.stage("qc", run=label):
+            if not plan.noise_present:
+                # No raw split to piggyback on: one read of the magnitude (or its cached decode)
+                raw_stats.functional = series_stats(m_im, cache=cache, index=plan.index)
+            maps = {series: {name: paths.qc_map(series, name) for name in QC_MAPS}
+                    for series in ("raw", "nordic")}
+            outputs.update(write_qc(raw_stats, nordic_stats, maps, paths.qc_summary, header=split_kw["header"],
+                                    affine=split_kw["affine"], compress_level=args.compress_level))
+    if not done:
+        plan.checkpoint("split", outputs={str(p): {"size": p.stat().st_size, "sha256": sha}
+                                          for p, sha in outputs.items()})
+
+    with profiler.stage("sidecars", run=label):
+        if plan.noise_present:
+            sidecars = [
+                write_sidecar(paths.functional_raw, json_file, "Functional volumes (noise removed, raw)",
+                              cache=cache),
+                write_sidecar(paths.functional_nordic, json_file,
+                              "Functional volumes (noise removed, NORDIC denoised)", cache=cache),
+                write_sidecar(paths.noise_raw, json_file, "Noise volumes (raw, split by variance threshold)",
+                              cache=cache),
+                write_sidecar(paths.noise_nordic, json_file, "Noise volumes (NORDIC denoised)", cache=cache),
+            ]
         else:
-            raise FileNotFoundError(f"No NORDIC output found for {base}")
-
-        func_data, noise_data = split_4d_nifti(str(m_im), noise_inds)
-        func_data_nordic, noise_data_nordic = split_4d_nifti(str(nordic_file), noise_inds)
-
-        # Remove full NORDIC file after splitting (preserves original behavior)
-        if nordic_file.exists():
-            nordic_file.unlink()
-
-        affine = nib.load(str(m_im)).affine
-        json_file = m_im.with_suffix("").with_suffix(".json")
-
-        if noise_data is not None:
-            save_with_json(func_data, affine, paths.functional_raw, json_file,
-                           "Functional volumes (noise removed, raw)")
-            save_with_json(func_data_nordic, affine, paths.functional_nordic, json_file,
-                           "Functional volumes (noise removed, NORDIC denoised)")
-            save_with_json(noise_data, affine, paths.noise_raw, json_file,
-                           "Noise volumes (raw, split by variance threshold)")
-            save_with_json(noise_data_nordic, affine, paths.noise_nordic, json_file,
-                           "Noise volumes (NORDIC denoised)")
+            sidecars = [write_sidecar(paths.functional_nordic, json_file,
+                                      "Functional volumes (NORDIC denoised, no noise scans detected)",
+                                      cache=cache)]
+    outputs.update({p: None for p in sidecars})
+
+    del nordic_src
+    if nordic_file is not None:
+        cache.discard(nordic_file)
+    cache.clear()
+    # The splits were renamed into place whole; the new owner writes the same files
+    if plan.lease_lost():
+        plan.release()
+        return "claimed"
+    with profiler.stage("manifest-write", run=label):
+        Manifest(deriv_root).record(plan.rel_path, plan.key, plan.inputs, plan.params, noise_inds, outputs)
+    # The run is now saved: the manifest entry replaces the checkpoint, and the
+    # full NORDIC output is removed (preserves original behavior)
+    if plan.checkpoints is not None:
+        plan.checkpoints.clear(plan.rel_path)
+    plan.state = {}
+    if nordic_file is not None and nordic_file.exists():
+        nordic_file.unlink()
+    plan.release()
+    return "done"
+
+
+@dataclass(frozen=True)
+class PlannedRun:
+    """What ``nordic-bids`` would do with one run, as shown by ``--dry-run``."""
+
+    name: str
+    action: str  # "process", "skip", "no-phase" or "invalid" (failed preflight)
+    reason: str = ""
+    memory: Optional[int] = None
+    output_bytes: Optional[int] = None
+
+
+def estimate_output_size(magnitude_file: Path, output_dtype: str) -> int:
+    """Uncompressed size of a run's split outputs, from the magnitude header.
+
+    Assumes noise scans are found, so the raw splits (input type) are written
+    next to the NORDIC splits (``output_dtype``); compression only shrinks it.
+    """
+    import nibabel as nib
+    import numpy as np
+
+    hdr = nib.load(str(magnitude_file)).header
+    n_voxels = int(np.prod(hdr.get_data_shape()))
+    return n_voxels * (hdr.get_data_dtype().itemsize + np.dtype(output_dtype).itemsize)
+
+
+def plan_run(run: BidsRun, args, bids_root: Path, deriv_root: Path,
+             check: Optional[PreflightResult] = None) -> PlannedRun:
+    """Decide what :func:`prepare_run` would do with ``run`` without reading image data.
+
+    Runs without a manifest entry are skipped when their outputs exist (noise
+    detection would be needed to tell which outputs to expect, so either set
+    counts). A run whose preflight ``check`` failed is "invalid".
+    """
+    from ..bids import DerivativePaths, outputs_exist
+
+    rel_path = run.magnitude.relative_to(bids_root)
+    name = str(rel_path)
+    if run.phase is None:
+        return PlannedRun(name, "no-phase")
+    if check is not None and not check.ok:
+        return PlannedRun(name, "invalid", "; ".join(check.errors))
+
+    params = run_params(args)
+    if not args.overwrite:
+        json_file = run.sidecar
+        inputs = {
+            "magnitude": file_fingerprint(run.magnitude),
+            "phase": file_fingerprint(run.phase),
+            "sidecar": file_fingerprint(json_file) if json_file is not None else None,
+        }
+        manifest = Manifest(deriv_root)
+        entry = manifest.load(rel_path)
+        if manifest.is_current(entry, run_key(inputs, params)):
+            return PlannedRun(name, "skip", "up to date")
+        if entry is not None:
+            reason = "inputs or parameters changed"
+        else:
+            paths = DerivativePaths(out_dir=deriv_root / rel_path.parent,
+                                    base=run.magnitude.name.replace("_bold.nii.gz", ""), ext=params["ext"])
+            if outputs_exist(paths, noise_present=True) or outputs_exist(paths, noise_present=False):
+                return PlannedRun(name, "skip", "outputs exist")
+            reason = "new"
+    else:
+        reason = "--overwrite"
+    return PlannedRun(name, "process", reason,
+                      memory=estimate_run_memory(run.magnitude, run.phase, backend_memory=args.slab_memory),
+                      output_bytes=estimate_output_size(run.magnitude, args.output_dtype))
+
+
+def format_plan(planned) -> str:
+    """Table of planned runs followed by totals for the runs to process."""
+    width = max([len("run")] + [len(p.name) for p in planned])
+    lines = [f"{'run':<{width}}  {'action':<9}{'memory':>9}{'output':>9}  reason"]
+    for p in planned:
+        lines.append(f"{p.name:<{width}}  {p.action:<9}{format_bytes(p.memory):>9}"
+                     f"{format_bytes(p.output_bytes):>9}  {p.reason}".rstrip())
+    todo = [p for p in planned if p.action == "process"]
+    counts = {a: sum(p.action == a for p in planned) for a in ("process", "skip", "no-phase", "invalid")}
+    lines.append(f"Plan: {len(planned)} run(s): " + ", ".join(f"{n} {a}" for a, n in counts.items()))
+    if todo:
+        lines.append(f"To process: peak memory per run up to {format_bytes(max(p.memory for p in todo))}, "
+                     f"outputs up to {format_bytes(sum(p.output_bytes for p in todo))} uncompressed")
+    return "\n".join(lines)
+
+
+def dry_run(args, bids_root: Path, deriv_root: Path) -> None:
+    """Print the plan for ``args`` without writing anything (``--dry-run``)."""
+    from ..bids import discover_runs
+
+    runs = discover_runs(
+        bids_root,
+        participant_labels=args.participant_label,
+        session_labels=args.session_label,
+        cache_file=deriv_root / WORK_DIR / "bids_index.json",
+        save=False,
+    )
+    if not runs:
+        print("No functional files found matching: sub-*/ses-*/func/*_bold.nii.gz")
+        return
+    checks = [None] * len(runs)
+    if args.preflight != "off":
+        checks = preflight_runs(runs, bids_root, threads=args.preflight_threads)
+    print(format_plan([plan_run(run, args, bids_root, deriv_root, check) for run, check in zip(runs, checks)]))
+
+
+def process_run(m_im: Path, args, bids_root: Path, deriv_root: Path, backend,
+                run: Optional[BidsRun] = None, profiler: Profiler = NULL_PROFILER,
+                leases: Optional[LeaseManager] = None) -> str:
+    """Run NORDIC on one magnitude file and write its split derivatives.
+
+    ``run`` is the file's entry in the BIDS index; without it the phase file and
+    sidecar are looked up on disk. Each stage is timed with ``profiler``; with
+    ``leases`` the run is claimed for the duration. Returns the run status:
+    "done", "skipped" (outputs up to date), "no-phase" or "claimed".
+    """
+    plan = prepare_run(m_im, args, bids_root, deriv_root, run=run, profiler=profiler, leases=leases)
+    if isinstance(plan, str):
+        return plan
+    try:
+        compute_run(plan, args, backend, profiler=profiler)
+        return finish_run(plan, args, deriv_root, profiler=profiler)
+    finally:
+        plan.release()
+
+
+# Backend and profiler owned by a worker process in --n-jobs mode (see _init_worker)
+_worker_backend = None
+_worker_profiler = NULL_PROFILER
+_worker_leases = None
+
+
+def _init_worker(args, deriv_root: Path) -> None:
+    global _worker_backend, _worker_profiler, _worker_leases
+    _worker_backend = make_backend(args, log_dir=deriv_root / WORK_DIR / "logs")
+    if args.shared:
+        _worker_leases = LeaseManager(deriv_root, ttl=args.lease_ttl)
+    if args.profile is not None:
+        _worker_profiler = Profiler(trace_file=args.profile)
+    # Worker processes do not run atexit handlers; Finalize hooks do run
+    multiprocessing.util.Finalize(None, _worker_backend.close, exitpriority=10)
+
+
+def _process_run_in_worker(run: BidsRun, args, bids_root: Path, deriv_root: Path) -> str:
+    return process_run(run.magnitude, args, bids_root, deriv_root, _worker_backend, run=run,
+                       profiler=_worker_profiler, leases=_worker_leases)
+
+
+def _run_serial(runs, args, bids_root: Path, deriv_root: Path, backend,
+                profiler: Profiler = NULL_PROFILER, leases: Optional[LeaseManager] = None) -> list:
+    outcomes = []
+    for run in runs:
+        m_im = run.magnitude
+        start = time.perf_counter()
+        try:
+            status = process_run(m_im, args, bids_root, deriv_root, backend, run=run, profiler=profiler,
+                                 leases=leases)
+            error = None
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+            print(f"Failed {m_im}: {error}")
+        outcomes.append(RunOutcome(name=str(m_im.relative_to(bids_root)), status=status,
+                                   error=error, seconds=time.perf_counter() - start))
+    return outcomes
+
+
+def _run_pipelined(runs, args, bids_root: Path, deriv_root: Path, backend,
+                   profiler: Profiler = NULL_PROFILER, leases: Optional[LeaseManager] = None) -> list:
+    """Serial backend calls, with the next run prepared and the previous one
+    written in background threads (see :func:`~nordic_preproc.pipeline.run_pipeline`)."""
+
+    def prepare(run: BidsRun):
+        plan = prepare_run(run.magnitude, args, bids_root, deriv_root, run=run, profiler=profiler,
+                           leases=leases)
+        if isinstance(plan, RunPlan):
+            # The backend reads the phase file itself; start pulling it into the page cache
+            advise_willneed(plan.ph_im)
+        return plan
+
+    return run_pipeline(
+        runs,
+        prepare=prepare,
+        compute=lambda plan: compute_run(plan, args, backend, profiler=profiler),
+        finish=lambda plan: finish_run(plan, args, deriv_root, profiler=profiler),
+        name=lambda run: str(run.magnitude.relative_to(bids_root)),
+        discard=lambda plan: plan.release(),
+        depth=args.pipeline_depth,
+    )
+
+
+def _run_parallel(runs, args, bids_root: Path, deriv_root: Path) -> list:
+    jobs = [
+        Job(
+            name=str(run.magnitude.relative_to(bids_root)),
+            memory=estimate_run_memory(run.magnitude, run.phase, backend_memory=args.slab_memory),
+            fn=_process_run_in_worker,
+            args=(run, args, bids_root, deriv_root),
+        )
+        for run in runs
+    ]
+    return run_jobs(jobs, n_jobs=args.n_jobs, max_memory=args.max_memory,
+                    initializer=_init_worker, initargs=(args, deriv_root))
+
+
+def _watch(args, bids_root: Path, deriv_root: Path, check, process, retry_args) -> list:
+    """``--watch`` mode: process runs in batches as they become complete, until stopped.
+
+    ``check`` and ``process`` are the preflight and processing steps of
+    :func:`main`; the backend they use stays up between batches. Runs claimed
+    by another worker (``--shared``) are offered again at the next poll.
+    SIGTERM stops watching like Ctrl-C: the run in progress is interrupted and
+    left to its checkpoint. Returns the outcomes of every batch.
+    """
+    import signal
+    import threading
+
+    from ..watch import RunWatcher, watch
+
+    watcher = RunWatcher(bids_root, participant_labels=args.participant_label,
+                         session_labels=args.session_label,
+                         cache_file=deriv_root / WORK_DIR / "bids_index.json", settle_time=args.settle_time)
+    outcomes = []
+    batches = 0
+
+    def handle(batch) -> None:
+        nonlocal batches
+        # --overwrite applies to the runs present at startup only
+        passed, rejected = check(batch)
+        done = process(passed, args if batches == 0 else retry_args)
+        batches += 1
+        for run, out in zip(passed, done):
+            if out.status == "claimed":
+                watcher.forget(run)
+        outcomes.extend(rejected + done)
+        print(summarize(rejected + done))
+
+    def terminate(signum, frame) -> None:
+        raise KeyboardInterrupt
+
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, terminate)
+    print(f"Watching {bids_root} for new runs (every {args.watch_interval:g}s; stop with Ctrl-C)")
+    try:
+        watch(watcher, handle, interval=args.watch_interval, idle_exit=args.watch_idle_exit)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+        watcher.close()
+    print("Stopped watching")
+    return outcomes
+
+
+def main(argv=None, backend=None) -> None:
+    """Entry point of ``nordic-bids``.
+
+    ``backend`` replaces the one selected on the command line (any
+    :class:`~nordic_preproc.backends.NordicBackend`, e.g. a stand-in used by the
+    benchmarks); it is only supported without ``--n-jobs``. Slab options
+    still apply to it, the timeout and retry options do not.
+    """
+    args = build_parser().parse_args(argv)
+    if backend is not None and args.n_jobs > 1:
+        raise ValueError("A custom backend cannot be used with --n-jobs")
+    if args.in_memory:
+        if backend is not None and not hasattr(backend, "denoise"):
+            raise ValueError("--in-memory needs a backend with a denoise() method")
+        if backend is None and args.mcr:
+            raise SystemExit("--in-memory is not available with --mcr, whose compiled runner works on files")
+        if backend is None and args.matlab and not args.matlab_array_function:
+            raise SystemExit("--in-memory with --matlab needs --matlab-array-function")
+        if args.slab_memory is not None or args.slab_size is not None:
+            raise SystemExit("--in-memory cannot be combined with --slab-memory or --slab-size")
+    if args.watch and args.n_jobs > 1:
+        raise SystemExit("--watch keeps one backend running between runs and cannot be combined with --n-jobs")
+    if args.watch and args.dry_run:
+        raise SystemExit("--watch cannot be combined with --dry-run")
+    bids_root = Path(args.bids_root)
+    deriv_root = bids_root / "derivatives" / "nordic"
+    if args.dry_run:
+        dry_run(args, bids_root, deriv_root)
+        return
+
+    from ..bids import discover_runs, write_dataset_description
+    from ..nifti_ops import DEFAULT_COMPRESS_LEVEL
+
+    if args.compress_level is None:
+        args.compress_level = DEFAULT_COMPRESS_LEVEL
+    deriv_root.mkdir(parents=True, exist_ok=True)
+    write_dataset_description(deriv_root)
+
+    profiler = NULL_PROFILER
+    if args.profile is not None:
+        if not args.profile:
+            args.profile = str(deriv_root / WORK_DIR / "profile" / time.strftime("trace-%Y%m%d-%H%M%S.jsonl"))
+        # Workers append to the same trace; start it empty
+        Path(args.profile).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.profile).write_text("")
+        profiler = Profiler(trace_file=args.profile)
+
+    if args.scratch_dir:
+        for stale in remove_stale(Path(args.scratch_dir)):
+            print(f"Removed stale scratch directory {stale}")
+
+    # In serial mode the backend is created first so MATLAB can boot during discovery;
+    # with --n-jobs each worker process creates its own.
+    if backend is None:
+        backend = make_backend(args, log_dir=deriv_root / WORK_DIR / "logs") if args.n_jobs <= 1 else None
+    else:
+        backend = with_slabs(backend, args)
+    try:
+        leases = LeaseManager(deriv_root, ttl=args.lease_ttl) if args.shared else None
+
+        def check(batch):
+            """Preflight ``batch``: the runs that passed and outcomes for those that failed."""
+            # Header problems are found here rather than after an expensive backend call
+            if args.preflight == "off":
+                return batch, []
+            with profiler.stage("preflight"):
+                checks = preflight_runs(batch, bids_root, threads=args.preflight_threads)
+            print(format_report(checks))
+            if args.preflight == "abort" and not all(c.ok for c in checks):
+                raise SystemExit("Preflight failed; fix the runs above or use --preflight exclude")
+            rejected = [RunOutcome(name=c.name, status="failed", error="preflight: " + "; ".join(c.errors))
+                        for c in checks if not c.ok]
+            return [run for run, c in zip(batch, checks) if c.ok], rejected
+
+        def process(batch, run_args):
+            if backend is None:
+                return _run_parallel(batch, run_args, bids_root, deriv_root)
+            if run_args.pipeline_depth > 0:
+                return _run_pipelined(batch, run_args, bids_root, deriv_root, backend, profiler=profiler,
+                                      leases=leases)
+            return _run_serial(batch, run_args, bids_root, deriv_root, backend, profiler=profiler,
+                               leases=leases)
+
+        # Outputs another worker has just written are not redone, even with --overwrite
+        retry_args = argparse.Namespace(**{**vars(args), "overwrite": False})
+        if args.watch:
+            outcomes = _watch(args, bids_root, deriv_root, check, process, retry_args)
         else:
-            print(f"No noise scans detected for {m_im}")
-            save_with_json(func_data_nordic, affine, paths.functional_nordic, json_file,
-                           "Functional volumes (NORDIC denoised, no noise scans detected)")
+            with profiler.stage("discover"):
+                runs = discover_runs(
+                    bids_root,
+                    participant_labels=args.participant_label,
+                    session_labels=args.session_label,
+                    cache_file=deriv_root / WORK_DIR / "bids_index.json",
+                )
+
+            if not runs:
+                print("No functional files found matching: sub-*/ses-*/func/*_bold.nii.gz")
+                return
+
+            runs, rejected = check(runs)
+            outcomes = process(runs, args)
+            # With --shared, keep coming back to runs other workers hold until they are
+            # finished (then skipped via the manifest) or their lease expires (taken over).
+            while leases is not None:
+                waiting = [i for i, out in enumerate(outcomes) if out.status == "claimed"]
+                if not waiting:
+                    break
+                print(f"Waiting for {len(waiting)} run(s) claimed by other workers")
+                time.sleep(min(30.0, args.lease_ttl / 4))
+                for i, out in zip(waiting, process([runs[i] for i in waiting], retry_args)):
+                    outcomes[i] = out
+            outcomes = rejected + outcomes
+    finally:
+        if backend is not None:
+            backend.close()
+
+    print(summarize(outcomes))
+    if args.profile is not None:
+        print(summarize_records(load_trace(Path(args.profile))))
+        print(f"Profile trace written to {args.profile}")
+    if any(out.failed for out in outcomes):
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
     main()
@@ -2,15 +2,18 @@ from __future__ import annotations
 
 import argparse
 import os
+import shutil
 from pathlib import Path
 
-import nibabel as nib
-
-from ..noise import find_noise_scans
-from ..nifti_ops import split_4d_nifti, save_nifti, gzip_nii
+from ..profiling import NULL_PROFILER, Profiler
+from ..scheduler import parse_memory
+from ..staging import ScratchDir
 from ..backends import NordicArgs
-from ..backends.matlab_engine import MatlabEngineBackend
-from ..backends.mcr import MCRBackend
+from ..watchdog import (DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF, DEFAULT_STALL_TIMEOUT, DEFAULT_TIMEOUT,
+                        DEFAULT_TIMEOUT_PER_VOLUME)
+
+# NumPy/nibabel-based modules and the backends are imported in main(), so
+# --help does not load them.
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -21,23 +24,98 @@ def build_parser() -> argparse.ArgumentParser:
     backend = p.add_mutually_exclusive_group(required=True)
     backend.add_argument("--matlab", action="store_true", help="Use MATLAB engine backend")
     backend.add_argument("--mcr", action="store_true", help="Use MATLAB Compiler Runtime backend")
+    backend.add_argument("--numpy", action="store_true",
+                         help="Use the built-in NumPy implementation of NORDIC (no MATLAB needed)")
 
     p.add_argument("--nordic_path", default="", help="Path to NORDIC MATLAB scripts (for --matlab)")
     p.add_argument("--mcr_path", default="", help="Path to MATLAB Compiler Runtime directory (for --mcr)")
     p.add_argument("--nordic_mcr_path", default="./nordic_mcr/", help="Path to compiled NORDIC directory (for --mcr)")
+    p.add_argument("--mcr-cache-root", default=None,
+                   help="Directory holding one MCR_CACHE_ROOT per worker, kept warm between invocations "
+                        "(for --mcr; default: $MCR_CACHE_ROOT or a per-user temporary directory)")
+    p.add_argument("--threads", type=int, default=None,
+                   help="Threads for patch SVDs (for --numpy; default: all cores)")
 
     p.add_argument("--temporal_phase", type=int, default=1, help="Temporal phase argument for NORDIC")
     p.add_argument("--phase_filter_width", type=float, default=10.0, help="Phase filter width argument for NORDIC")
     p.add_argument("--mad_thresh", type=float, default=50, help="MAD multiplier for noise scan detection")
+    p.add_argument("--cache-gb", type=float, default=4.0,
+                   help="Memory budget (GB) for keeping decoded images between detection, splitting and saving")
+
+    p.add_argument("--slab-memory", type=parse_memory, default=None,
+                   help="Memory budget for the NORDIC call, e.g. 32G. A run that does not fit is cut into "
+                        "overlapping slabs along z, denoised slab by slab and stitched back together")
+    p.add_argument("--slab-size", type=int, default=None,
+                   help="Slices per slab (overrides the size derived from --slab-memory)")
+    p.add_argument("--slab-overlap", type=int, default=None,
+                   help="Slices shared by neighbouring slabs (default: one NORDIC patch width)")
+    p.add_argument("--slab-jobs", type=int, default=1,
+                   help="Slabs processed at once; --slab-memory is shared between them")
+
+    p.add_argument("--backend-timeout", type=float, default=DEFAULT_TIMEOUT,
+                   help="Seconds a NORDIC call may take, plus --backend-timeout-per-volume for each volume; "
+                        "a call that runs longer is killed (0 together with a per-volume value of 0: no limit)")
+    p.add_argument("--backend-timeout-per-volume", type=float, default=DEFAULT_TIMEOUT_PER_VOLUME,
+                   help="Seconds added to --backend-timeout per volume of the run")
+    p.add_argument("--stall-timeout", type=float, default=DEFAULT_STALL_TIMEOUT,
+                   help="Kill a NORDIC call that neither used CPU nor grew its output for this many "
+                        "seconds (0: never)")
+    p.add_argument("--backend-retries", type=int, default=DEFAULT_RETRIES,
+                   help="Times a failed or killed NORDIC call is retried before the run counts as failed")
+    p.add_argument("--retry-backoff", type=float, default=DEFAULT_RETRY_BACKOFF,
+                   help="Seconds before the first retry; doubled for each further retry")
 
+    p.add_argument("--in-memory", action="store_true",
+                   help="Hand the decoded magnitude and phase to the backend as arrays and split its result "
+                        "directly, without writing the full NORDIC output (for --numpy, and for --matlab "
+                        "with --matlab-array-function)")
+    p.add_argument("--matlab-array-function", default=None, metavar="NAME",
+                   help="MATLAB function used by --matlab --in-memory, called as "
+                        "denoised = NAME(magnitude, phase, ARG)")
+
+    p.add_argument("--qc", action="store_true",
+                   help="While splitting, also compute per-voxel mean, std and tSNR maps of the raw and NORDIC "
+                        "functional series and the noise level of the noise volumes, and write them with a "
+                        "JSON summary (qc_summary.json) to --output_dir")
+
+    p.add_argument("--scratch-dir", default=None,
+                   help="Fast local directory (e.g. node-local SSD or /dev/shm) where the inputs are staged "
+                        "uncompressed and the backend writes its output; only the final outputs are "
+                        "written to --output_dir")
     p.add_argument("--output_dir", default=None, help="Output directory (default: magnitude image directory)")
     p.add_argument("--output_prefix", default="NORDIC_", help="Prefix for NORDIC base output name")
+    p.add_argument("--compress-level", type=int, default=None, choices=range(1, 10),
+                   metavar="{1..9}", help="gzip level for .nii.gz outputs (compressed in parallel; default 1)")
+    p.add_argument("--no-compress", action="store_true", help="Write uncompressed .nii outputs")
+    p.add_argument("--output-dtype", choices=["float32", "int16"], default="float32",
+                   help="On-disk type of NORDIC outputs (int16 is rescaled via scl_slope/scl_inter). "
+                        "Raw outputs always keep the input's type and scaling")
+    p.add_argument("--profile", nargs="?", const="", default=None, metavar="TRACE",
+                   help="Record wall/CPU time, peak memory and I/O of each stage to a JSON-lines trace "
+                        "(default: <output_dir>/<base>_profile.jsonl) and print a summary table at the end")
     return p
 
 
 def main(argv=None) -> None:
     args = build_parser().parse_args(argv)
 
+    import numpy as np
+
+    from ..nifti_ops import DEFAULT_COMPRESS_LEVEL, ImageCache, gzip_nii, split_4d_nifti, stream_split_nifti
+    from ..noise import find_noise_scans
+    from ..qc import QC_MAPS, SplitStats, series_stats, write_qc
+
+    if args.compress_level is None:
+        args.compress_level = DEFAULT_COMPRESS_LEVEL
+
+    if args.in_memory:
+        if args.mcr:
+            raise SystemExit("--in-memory is not available with --mcr, whose compiled runner works on files")
+        if args.matlab and not args.matlab_array_function:
+            raise SystemExit("--in-memory with --matlab needs --matlab-array-function")
+        if args.slab_memory is not None or args.slab_size is not None:
+            raise SystemExit("--in-memory cannot be combined with --slab-memory or --slab-size")
+
     m_im = args.magnitude_image
     ph_im = args.phase_image
 
@@ -48,47 +126,143 @@ def main(argv=None) -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
 
     base = args.output_prefix + Path(m_im).name.replace(".nii.gz", "").replace(".nii", "")
-    # Detect noise scans from magnitude
-    det = find_noise_scans(m_im, mad_thresh=args.mad_thresh)
-    noise_inds = det.noise_indices
-    print(f"Found {len(noise_inds)} noise scans: {noise_inds}")
-
-    nordic_args = NordicArgs(
-        temporal_phase=args.temporal_phase,
-        phase_filter_width=args.phase_filter_width,
-        noise_volume_last=int(len(noise_inds)),
-        dirout=str(out_dir) + "/",
-    )
-
-    if args.matlab:
-        backend = MatlabEngineBackend(nordic_path=args.nordic_path)
-    else:
-        backend = MCRBackend(mcr_path=args.mcr_path, nordic_mcr_path=args.nordic_mcr_path)
+    # Decoded images are shared by detection, splitting and saving
+    cache = ImageCache(max_bytes=int(args.cache_gb * 1024**3))
 
-    backend.run(m_im, ph_im, base, nordic_args)
+    profiler = NULL_PROFILER
+    if args.profile is not None:
+        trace = Path(args.profile or out_dir / f"{base}_profile.jsonl")
+        trace.parent.mkdir(parents=True, exist_ok=True)
+        trace.write_text("")
+        profiler = Profiler(trace_file=trace)
 
-    # NORDIC output may be .nii or .nii.gz depending on MATLAB script settings
-    nordic_nii = out_dir / f"{base}.nii"
-    nordic_niigz = out_dir / f"{base}.nii.gz"
-    if nordic_nii.exists():
-        nordic_file = gzip_nii(nordic_nii)
-    elif nordic_niigz.exists():
-        nordic_file = nordic_niigz
-    else:
-        raise FileNotFoundError(f"Expected NORDIC output not found at {nordic_nii} or {nordic_niigz}")
+    scratch = ScratchDir(Path(args.scratch_dir), tag=base) if args.scratch_dir else None
+    work_dir = scratch.path if scratch is not None else out_dir
+    try:
+        m_src, ph_src = m_im, ph_im
+        if scratch is not None:
+            with profiler.stage("stage", run=base):
+                m_src, ph_src = scratch.stage(m_im), scratch.stage(ph_im)
 
-    functional_raw, noise_raw = split_4d_nifti(m_im, noise_inds)
-    functional_nordic, noise_nordic = split_4d_nifti(str(nordic_file), noise_inds)
+        # Detect noise scans from magnitude
+        with profiler.stage("detect", run=base):
+            det = find_noise_scans(str(m_src), mad_thresh=args.mad_thresh, cache=cache)
+        noise_inds = det.noise_indices
+        print(f"Found {len(noise_inds)} noise scans: {noise_inds}")
 
-    affine = nib.load(m_im).affine
-    if noise_raw is not None:
-        save_nifti(functional_raw, affine, out_dir / "functional_data_raw.nii.gz")
-        save_nifti(functional_nordic, affine, out_dir / "functional_data_nordic.nii.gz")
-        save_nifti(noise_raw, affine, out_dir / "noise_data_raw.nii.gz")
-        save_nifti(noise_nordic, affine, out_dir / "noise_data_nordic.nii.gz")
-    else:
-        print("No noise scans detected; outputs will contain only NORDIC functional split.")
-        save_nifti(functional_nordic, affine, out_dir / "functional_data_nordic.nii.gz")
+        nordic_args = NordicArgs(
+            temporal_phase=args.temporal_phase,
+            phase_filter_width=args.phase_filter_width,
+            noise_volume_last=int(len(noise_inds)),
+            dirout=str(work_dir) + "/",
+        )
+
+        if args.matlab:
+            from ..backends.matlab_engine import MatlabEngineBackend
+
+            backend = MatlabEngineBackend(nordic_path=args.nordic_path,
+                                          array_function=args.matlab_array_function)
+        elif args.numpy:
+            from ..backends.numpy_nordic import NumpyBackend
+
+            backend = NumpyBackend(n_threads=args.threads)
+        else:
+            from ..backends.mcr import MCRBackend
+
+            # A single run gains nothing from the batch runner's long-lived process
+            backend = MCRBackend(mcr_path=args.mcr_path, nordic_mcr_path=args.nordic_mcr_path, batch=False,
+                                 log_dir=out_dir, cache_base=args.mcr_cache_root)
+        # A backend that cannot be aborted is not supervised (see bids_run.with_watchdog)
+        if getattr(backend, "abort", None) is not None and (
+                args.backend_timeout > 0 or args.backend_timeout_per_volume > 0 or args.stall_timeout > 0
+                or args.backend_retries > 0):
+            from ..watchdog import SupervisedBackend
+
+            backend = SupervisedBackend(backend, timeout=args.backend_timeout,
+                                        timeout_per_volume=args.backend_timeout_per_volume,
+                                        stall_timeout=args.stall_timeout, retries=args.backend_retries,
+                                        backoff=args.retry_backoff)
+        if args.slab_memory is not None or args.slab_size is not None:
+            from ..slabs import SlabBackend
+
+            backend = SlabBackend(backend, memory=args.slab_memory, slab_size=args.slab_size,
+                                  overlap=args.slab_overlap, jobs=args.slab_jobs)
+
+        nordic_file = nordic_data = None
+        try:
+            if args.in_memory:
+                with profiler.stage("load", run=base):
+                    magnitude = split_4d_nifti(str(m_src), [], cache=cache, dtype=np.float32)[0]
+                    phase = split_4d_nifti(str(ph_src), [], dtype=np.float32)[0]
+                with profiler.stage("backend", run=base):
+                    nordic_data = backend.denoise(magnitude, phase, nordic_args)
+                del magnitude, phase
+            else:
+                with profiler.stage("backend", run=base):
+                    backend.run(str(m_src), str(ph_src), base, nordic_args)
+        finally:
+            backend.close()
+
+        # NORDIC output may be .nii or .nii.gz depending on MATLAB script settings
+        nordic_nii = work_dir / f"{base}.nii"
+        nordic_niigz = work_dir / f"{base}.nii.gz"
+        if nordic_data is None:
+            if nordic_nii.exists():
+                nordic_file = nordic_nii
+            elif nordic_niigz.exists():
+                nordic_file = nordic_niigz
+            else:
+                raise FileNotFoundError(f"Expected NORDIC output not found at {nordic_nii} or {nordic_niigz}")
+        nordic_src = nordic_data if nordic_data is not None else nordic_file
+
+        # Raw splits keep the source encoding; NORDIC splits are stored as --output-dtype.
+        # Volumes are streamed a few at a time straight into the functional/noise outputs.
+        ext = ".nii" if args.no_compress else ".nii.gz"
+        split_kw = dict(header=cache.header(m_src), affine=cache.affine(m_src), cache=cache,
+                        compress_level=args.compress_level)
+        raw_stats, nordic_stats = (SplitStats(), SplitStats()) if args.qc else (None, None)
+        if len(noise_inds) > 0:
+            with profiler.stage("split-raw", run=base):
+                stream_split_nifti(m_src, noise_inds, out_dir / f"functional_data_raw{ext}",
+                                   out_dir / f"noise_data_raw{ext}", stats=raw_stats, **split_kw)
+            with profiler.stage("split-nordic", run=base):
+                stream_split_nifti(nordic_src, noise_inds, out_dir / f"functional_data_nordic{ext}",
+                                   out_dir / f"noise_data_nordic{ext}", dtype=args.output_dtype,
+                                   stats=nordic_stats, **split_kw)
+        else:
+            print("No noise scans detected; outputs will contain only NORDIC functional split.")
+            with profiler.stage("split-nordic", run=base):
+                stream_split_nifti(nordic_src, noise_inds, out_dir / f"functional_data_nordic{ext}",
+                                   dtype=args.output_dtype, stats=nordic_stats, **split_kw)
+        del nordic_src, nordic_data
+
+        if args.qc:
+            with profiler.stage("qc", run=base):
+                if len(noise_inds) == 0:
+                    raw_stats.functional = series_stats(m_src, cache=cache)
+                maps = {series: {name: out_dir / f"functional_data_{series}_{name}{ext}" for name in QC_MAPS}
+                        for series in ("raw", "nordic")}
+                write_qc(raw_stats, nordic_stats, maps, out_dir / "qc_summary.json", header=split_kw["header"],
+                         affine=split_kw["affine"], compress_level=args.compress_level)
+
+        # Compress the full output only after splitting, which reads the .nii directly
+        # (an in-memory run has no full output file)
+        if nordic_file is not None:
+            cache.discard(nordic_file)
+            if nordic_file == nordic_nii and not args.no_compress:
+                with profiler.stage("gzip", run=base):
+                    nordic_file = gzip_nii(nordic_nii, compress_level=args.compress_level,
+                                           gz_path=out_dir / f"{base}.nii.gz")
+            elif scratch is not None:
+                nordic_file = Path(shutil.move(str(nordic_file), str(out_dir / nordic_file.name)))
+    finally:
+        cache.clear()
+        if scratch is not None:
+            scratch.cleanup()
+
+    if args.profile is not None:
+        print(profiler.summary())
+        print(f"Profile trace written to {profiler.trace_file}")
 
     # Optional: remove the full NORDIC output after splitting (BIDS script did this)
     # Commented out by default for single-run mode to aid debugging.
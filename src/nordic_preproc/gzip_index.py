@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import bisect
+import hashlib
+import io
+import json
+import os
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+# Uncompressed bytes between seek points; a seek decompresses at most this much to discard
+INDEX_SPACING = 32 * 1024**2
+# Compressed bytes read from the file per step
+READ_CHUNK = 256 * 1024
+# Decompressed bytes produced per step (bounds memory for highly compressible data)
+OUTPUT_CHUNK = 4 * 1024**2
+# History a raw deflate stream may refer back to; stored with each mid-member seek point
+WINDOW_SIZE = 32 * 1024
+# Bytes a candidate seek point must reproduce before it is trusted
+VALIDATE_BYTES = 64 * 1024
+# An empty stored block, which pigz (and any Z_SYNC_FLUSH) leaves at byte-aligned block boundaries
+SYNC_MARKER = b"\x00\x00\xff\xff"
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".gzidx"
+
+
+@dataclass(frozen=True)
+class SeekPoint:
+    """A place where decompression can start without reading what comes before.
+
+    ``window`` is empty at the start of a gzip member; otherwise it holds the
+    last 32 KiB of output, the history the raw deflate stream may refer to.
+    """
+
+    uncompressed: int
+    compressed: int
+    window: bytes = b""
+
+
+@dataclass
+class GzipIndex:
+    """Seek points of one .gz file, identified by its size and mtime.
+
+    An index starts with the file's first byte and grows while an
+    :class:`IndexedGzipReader` decompresses past its last point; ``dirty``
+    tells whether it changed since it was loaded.
+    """
+
+    size: int
+    mtime_ns: int
+    points: List[SeekPoint] = field(default_factory=lambda: [SeekPoint(0, 0)])
+    spacing: int = INDEX_SPACING
+    dirty: bool = False
+
+    @classmethod
+    def for_file(cls, path, spacing: int = INDEX_SPACING) -> "GzipIndex":
+        """An empty index (only the start of the file) for ``path``."""
+        st = os.stat(path)
+        return cls(size=st.st_size, mtime_ns=st.st_mtime_ns, spacing=spacing)
+
+    def matches(self, path) -> bool:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+    def point_before(self, offset: int) -> SeekPoint:
+        """The last seek point at or before uncompressed ``offset``."""
+        i = bisect.bisect_right([p.uncompressed for p in self.points], offset)
+        return self.points[max(0, i - 1)]
+
+    def wants_point(self, uncompressed: int) -> bool:
+        """True if a point at ``uncompressed`` would extend the index by at least ``spacing``."""
+        return uncompressed - self.points[-1].uncompressed >= self.spacing
+
+    def add(self, point: SeekPoint) -> None:
+        if point.uncompressed > self.points[-1].uncompressed:
+            self.points.append(point)
+            self.dirty = True
+
+    def save(self, index_file) -> None:
+        """Write the index to ``index_file`` (atomically) and mark it clean."""
+        from .nifti_ops import atomic_path
+
+        windows = [zlib.compress(p.window, 1) if p.window else b"" for p in self.points]
+        header = {
+            "version": INDEX_VERSION,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "spacing": self.spacing,
+            "points": [[p.uncompressed, p.compressed, len(w)] for p, w in zip(self.points, windows)],
+        }
+        index_file = Path(index_file)
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_path(index_file) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(json.dumps(header).encode() + b"\n")
+                for w in windows:
+                    f.write(w)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, index_file) -> Optional["GzipIndex"]:
+        """Read an index written by :meth:`save`; None if missing or unreadable."""
+        try:
+            with open(index_file, "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION:
+                    return None
+                points = []
+                for uncompressed, compressed, n in header["points"]:
+                    blob = f.read(n)
+                    if len(blob) != n:
+                        return None
+                    points.append(SeekPoint(uncompressed, compressed, zlib.decompress(blob) if n else b""))
+        except (OSError, ValueError, KeyError, TypeError, zlib.error):
+            return None
+        if not points or points[0].uncompressed != 0:
+            return None
+        return cls(size=header["size"], mtime_ns=header["mtime_ns"], points=points, spacing=header["spacing"])
+
+
+def index_file_for(path, cache_dir=None) -> Path:
+    """Where the index of ``path`` is kept: next to it, or in ``cache_dir`` if given."""
+    path = Path(path)
+    if cache_dir is None:
+        return path.with_name(path.name + INDEX_SUFFIX)
+    digest = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"{digest}-{path.name}{INDEX_SUFFIX}"
+
+
+def load_index(path, cache_dir=None, spacing: int = INDEX_SPACING) -> GzipIndex:
+    """The cached index of ``path`` if it is still valid, otherwise a new empty one."""
+    index = GzipIndex.load(index_file_for(path, cache_dir))
+    if index is not None and index.matches(path):
+        return index
+    fresh = GzipIndex.for_file(path, spacing=spacing)
+    fresh.dirty = True
+    return fresh
+
+
+class _Candidate:
+    """A possible seek point after a sync marker, checked against the main stream."""
+
+    def __init__(self, point: SeekPoint):
+        self.point = point
+        self.decomp = zlib.decompressobj(-zlib.MAX_WBITS, zdict=point.window)
+        self.verified = 0
+
+
+class IndexedGzipReader(io.RawIOBase):
+    """Seekable, read-only view of a .gz file that uses and extends a :class:`GzipIndex`.
+
+    A seek restarts decompression at the nearest seek point before the target
+    (instead of at the start of the file, as :mod:`gzip` does for backward or
+    far forward seeks) and decompresses only the rest of the way. Reading
+    forward records new seek points every ``index.spacing`` bytes: at gzip
+    member starts (every block of the block-parallel writer), and in
+    single-member files at sync markers (pigz output), each checked by
+    decompressing :data:`VALIDATE_BYTES` from it. Files with neither are read
+    correctly, but seeking in them still starts from the beginning.
+    """
+
+    def __init__(self, path, index: Optional[GzipIndex] = None):
+        super().__init__()
+        self.path = Path(path)
+        if index is None or not index.matches(path):
+            index = GzipIndex.for_file(path) if index is None else GzipIndex.for_file(path, spacing=index.spacing)
+            index.dirty = True
+        self.index = index
+        self._file = open(path, "rb")
+        self._start(index.points[0])
+
+    def _start(self, point: SeekPoint) -> None:
+        if point.window:
+            self._decomp = zlib.decompressobj(-zlib.MAX_WBITS, zdict=point.window)
+        else:
+            self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._raw = bool(point.window)
+        self._cpos = point.compressed        # next compressed byte to read from the file
+        self._upos = point.uncompressed      # uncompressed bytes produced so far
+        self._out = b""                      # produced but not yet returned
+        self._out_pos = 0
+        self._window = point.window
+        self._candidate: Optional[_Candidate] = None
+        self._at_marker = False
+        self._eof = False
+
+    @property
+    def _pos(self) -> int:
+        return self._upos - (len(self._out) - self._out_pos)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("IndexedGzipReader cannot seek relative to the end")
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        point = self.index.point_before(offset)
+        if offset < self._pos or point.uncompressed > self._pos:
+            self._start(point)
+        while self._pos < offset:
+            buffered = len(self._out) - self._out_pos
+            if buffered:
+                self._out_pos += min(buffered, offset - self._pos)
+            elif not self._decode():
+                break
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size < 0 or size > 0:
+            buffered = len(self._out) - self._out_pos
+            if buffered == 0:
+                if not self._decode():
+                    break
+                continue
+            n = buffered if size < 0 else min(size, buffered)
+            parts.append(memoryview(self._out)[self._out_pos:self._out_pos + n])
+            self._out_pos += n
+            if size > 0:
+                size -= n
+        return b"".join(parts)
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def _indexing(self) -> bool:
+        return self.index.wants_point(self._upos)
+
+    def _decode(self) -> bool:
+        """Decompress the next piece into ``self._out``; False at the end of the data."""
+        if self._eof:
+            return False
+        if self._decomp.eof:
+            self._next_member()
+            return not self._eof
+
+        tail = self._decomp.unconsumed_tail
+        if tail:
+            piece = tail
+        else:
+            self._file.seek(self._cpos)
+            piece = self._file.read(READ_CHUNK)
+            if not piece:
+                raise EOFError(f"{self.path} is truncated (compressed data ended early)")
+            if self._candidate is None and self._indexing():
+                at = piece.find(SYNC_MARKER)
+                if at >= 0:
+                    piece = piece[:at + len(SYNC_MARKER)]
+                    self._at_marker = True
+            self._cpos += len(piece)
+
+        out = self._decomp.decompress(piece, OUTPUT_CHUNK)
+        self._check_candidate(piece, out)
+        self._upos += len(out)
+        self._out, self._out_pos = out, 0
+        self._window = (self._window + out)[-WINDOW_SIZE:] if len(out) < WINDOW_SIZE else out[-WINDOW_SIZE:]
+
+        if self._at_marker and not self._decomp.unconsumed_tail:
+            self._at_marker = False
+            if not self._decomp.eof and self._candidate is None and self._indexing():
+                self._candidate = _Candidate(SeekPoint(self._upos, self._cpos, bytes(self._window)))
+        if not out and self._decomp.eof:
+            return self._decode()
+        return True
+
+    def _check_candidate(self, piece: bytes, out: bytes) -> None:
+        cand = self._candidate
+        if cand is None:
+            return
+        # A true seek point decodes the same input to the same output as the main stream
+        try:
+            test_input = cand.decomp.unconsumed_tail or piece
+            same = cand.decomp.decompress(test_input, OUTPUT_CHUNK) == out
+        except zlib.error:
+            same = False
+        if not same:
+            self._candidate = None
+            return
+        cand.verified += len(out)
+        if cand.verified >= VALIDATE_BYTES or self._decomp.eof:
+            self.index.add(cand.point)
+            self._candidate = None
+
+    def _next_member(self) -> None:
+        """Move past the end of a gzip member (or of a raw stream and its trailer)."""
+        member_end = self._cpos - len(self._decomp.unused_data)
+        start = member_end + (8 if self._raw else 0)
+        self._candidate = None
+        self._file.seek(start)
+        magic = self._file.read(2)
+        if magic != b"\x1f\x8b":
+            # End of file, or padding after the last member (which gzip also ignores)
+            self._eof = True
+            return
+        self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._raw = False
+        self._cpos = start
+        if self._indexing():
+            self.index.add(SeekPoint(self._upos, start))
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+        super().close()
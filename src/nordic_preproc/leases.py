@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .manifest import WORK_DIR
+
+DEFAULT_LEASE_TTL = 600.0
+
+# A takeover lock older than this belongs to a worker that died mid-takeover
+TAKEOVER_LOCK_TTL = 60.0
+
+
+def _create_exclusive(path: Path, content: str) -> bool:
+    """Atomically create ``path`` with ``content``; False if it already exists.
+
+    The content is written to a unique temporary file which is then hard-linked
+    to ``path``. Unlike ``O_EXCL``, this is atomic on NFS as well; the link count
+    of the temporary file tells whether the link was made even if the server's
+    reply was lost.
+    """
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w") as f:
+        f.write(content)
+    try:
+        try:
+            os.link(tmp, path)
+        except OSError:
+            pass
+        return os.stat(tmp).st_nlink == 2
+    finally:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Lease:
+    """A claim on one run, kept alive by a heartbeat thread until released.
+
+    The heartbeat refreshes the lease file's mtime every ``ttl / 4`` seconds.
+    If the file is found to belong to another worker (after this worker was
+    stalled past the expiry and the run was taken over), :attr:`lost` is set
+    and the heartbeat stops. :meth:`check` looks right away, for use before
+    steps that must not be done twice.
+    """
+
+    def __init__(self, path: Path, owner: str, ttl: float):
+        self.path = path
+        self.owner = owner
+        self.ttl = ttl
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="nordic-lease", daemon=True)
+        self._thread.start()
+
+    def _owned(self) -> bool:
+        info = _read_json(self.path)
+        return info is not None and info.get("owner") == self.owner
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.ttl / 4):
+            if not self._owned():
+                self.lost = True
+                print(f"Warning: lost lease {self.path} to another worker")
+                return
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+
+    def check(self) -> bool:
+        """True (and :attr:`lost` set) if the lease file no longer belongs to this worker."""
+        if not self.lost and not self._owned():
+            self.lost = True
+        return self.lost
+
+    def release(self) -> None:
+        """Stop the heartbeat and remove the lease file if it is still ours."""
+        self._stop.set()
+        self._thread.join()
+        if self._owned():
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class LeaseManager:
+    """Claims runs through lease files under ``<deriv_root>/.nordic/leases``.
+
+    Workers on any number of nodes that share the derivatives directory
+    coordinate through these files only. A run is claimed by atomically
+    creating its lease file, which records the owner, host and TTL. The owner
+    keeps it alive with a heartbeat (see :class:`Lease`). A lease whose mtime
+    is older than its TTL is considered abandoned and can be taken over by
+    another worker. Takeovers are serialised through a short-lived
+    ``.takeover`` lock, so only one worker wins.
+
+    Expiry compares the file server's mtime with the local clock, so the TTL
+    should comfortably exceed any clock skew between nodes.
+    """
+
+    def __init__(self, deriv_root: Path, ttl: float = DEFAULT_LEASE_TTL, owner: Optional[str] = None):
+        if ttl <= 0:
+            raise ValueError(f"Lease TTL must be > 0, got {ttl}")
+        self.root = Path(deriv_root) / WORK_DIR / "leases"
+        self.ttl = float(ttl)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def lease_path(self, rel_path: Path) -> Path:
+        return self.root / Path(rel_path).parent / (Path(rel_path).name + ".lease")
+
+    def _content(self) -> str:
+        return json.dumps({"owner": self.owner, "host": socket.gethostname(), "pid": os.getpid(),
+                           "ttl": self.ttl, "acquired": time.time()})
+
+    def _expired(self, path: Path, ttl: Optional[float] = None) -> bool:
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            return True
+        if ttl is None:
+            info = _read_json(path) or {}
+            ttl = float(info.get("ttl", self.ttl))
+        return age > ttl
+
+    def acquire(self, rel_path: Path) -> Optional[Lease]:
+        """Claim a run; returns None if another live worker holds it."""
+        path = self.lease_path(rel_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if _create_exclusive(path, self._content()):
+            return Lease(path, self.owner, self.ttl)
+        if not self._expired(path):
+            return None
+
+        lock = path.with_name(path.name + ".takeover")
+        if not _create_exclusive(lock, self.owner):
+            if self._expired(lock, ttl=TAKEOVER_LOCK_TTL):
+                try:
+                    os.unlink(lock)
+                except OSError:
+                    pass
+            return None
+        try:
+            # Re-check under the lock: the owner may have heartbeated or released meanwhile
+            if not self._expired(path):
+                return None
+            info = _read_json(path) or {}
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            if not _create_exclusive(path, self._content()):
+                return None
+            print(f"Took over expired lease of {rel_path} from {info.get('owner', 'unknown worker')}")
+            return Lease(path, self.owner, self.ttl)
+        finally:
+            try:
+                os.unlink(lock)
+            except OSError:
+                pass
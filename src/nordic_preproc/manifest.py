@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+from . import __version__
+
+# Hidden work directory under derivatives/nordic for pipeline bookkeeping
+WORK_DIR = ".nordic"
+MANIFEST_VERSION = 1
+
+# Bytes hashed from each end of an input file by file_fingerprint
+FINGERPRINT_BYTES = 1024 * 1024
+
+
+def file_fingerprint(path, sample_bytes: int = FINGERPRINT_BYTES) -> Dict[str, Any]:
+    """Cheap content fingerprint of a file: its size plus a SHA-256 of both ends.
+
+    For ``.nii.gz`` inputs the tail holds the gzip trailer (CRC32 and length of
+    the uncompressed data), so any change to the image data changes the
+    fingerprint without reading the whole file. Files up to ``2 * sample_bytes``
+    are hashed in full. The modification time is recorded for reference only and
+    is not part of the content hash, so copying a dataset does not invalidate it.
+    """
+    path = Path(path)
+    st = path.stat()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        if st.st_size <= 2 * sample_bytes:
+            h.update(f.read())
+        else:
+            h.update(f.read(sample_bytes))
+            f.seek(-sample_bytes, os.SEEK_END)
+            h.update(f.read(sample_bytes))
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sample_sha256": h.hexdigest()}
+
+
+def file_sha256(path, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a whole file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def run_key(inputs: Mapping[str, Optional[Mapping[str, Any]]], params: Mapping[str, Any]) -> str:
+    """Hash the input fingerprints and processing parameters into a run key.
+
+    ``inputs`` maps a role ("magnitude", "phase", ...) to a fingerprint from
+    :func:`file_fingerprint`, or None for a missing optional input.
+    """
+    content = {
+        role: None if fp is None else {"size": fp["size"], "sample_sha256": fp["sample_sha256"]}
+        for role, fp in inputs.items()
+    }
+    blob = json.dumps({"inputs": content, "params": dict(params), "version": __version__},
+                      sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class Manifest:
+    """Per-run records of what was computed, under ``<deriv_root>/.nordic/manifest``.
+
+    Each run has one JSON file, named after the run's path relative to the BIDS
+    root. It holds the run key (see :func:`run_key`), the input fingerprints and
+    parameters it was computed from, the detected noise indices and the size and
+    SHA-256 of every output. A run whose key matches and whose outputs are all
+    present with their recorded sizes is up to date and can be skipped without
+    reading any image data.
+    """
+
+    def __init__(self, deriv_root: Path):
+        self.deriv_root = Path(deriv_root)
+        self.root = self.deriv_root / WORK_DIR / "manifest"
+
+    def entry_path(self, rel_path: Path) -> Path:
+        return self.root / Path(rel_path).parent / (Path(rel_path).name + ".json")
+
+    def load(self, rel_path: Path) -> Optional[Dict[str, Any]]:
+        """Return the recorded entry of a run, or None if missing or unreadable."""
+        try:
+            with open(self.entry_path(rel_path), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("manifest_version") != MANIFEST_VERSION:
+            return None
+        return entry
+
+    def is_current(self, entry: Optional[Mapping[str, Any]], key: str, verify: bool = False) -> bool:
+        """True if ``entry`` was made with ``key`` and its outputs are intact.
+
+        Outputs are checked by size; with ``verify=True`` their SHA-256 is
+        recomputed as well.
+        """
+        if entry is None or entry.get("key") != key:
+            return False
+        for rel, rec in entry.get("outputs", {}).items():
+            path = self.deriv_root / rel
+            try:
+                if path.stat().st_size != rec["size"]:
+                    return False
+            except OSError:
+                return False
+            if verify and file_sha256(path) != rec["sha256"]:
+                return False
+        return True
+
+    def record(
+        self,
+        rel_path: Path,
+        key: str,
+        inputs: Mapping[str, Optional[Mapping[str, Any]]],
+        params: Mapping[str, Any],
+        noise_indices: Sequence[int],
+        outputs: Mapping[Path, Optional[str]],
+    ) -> Path:
+        """Write the entry of a run, replacing any previous one atomically.
+
+        ``outputs`` maps each output path to its SHA-256, or None to have it
+        computed here.
+        """
+        out_records = {}
+        for path, sha in outputs.items():
+            path = Path(path)
+            out_records[os.path.relpath(path, self.deriv_root)] = {
+                "size": path.stat().st_size,
+                "sha256": sha if sha is not None else file_sha256(path),
+            }
+        entry = {
+            "manifest_version": MANIFEST_VERSION,
+            "key": key,
+            "inputs": dict(inputs),
+            "params": dict(params),
+            "noise_indices": [int(i) for i in noise_indices],
+            "outputs": out_records,
+        }
+        dest = self.entry_path(rel_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + f".tmp{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(entry, f, indent=2, default=str)
+        os.replace(tmp, dest)
+        return dest
+
+
+# Stages of a run recorded by Checkpoints, in order. "saved" is never stored:
+# once the outputs are saved the manifest entry is the record of the run.
+CHECKPOINT_STAGES = ("detected", "backend", "split", "saved")
+
+
+class Checkpoints:
+    """Progress of unfinished runs, under ``<deriv_root>/.nordic/checkpoints``.
+
+    Each run being computed has one JSON file holding its run key, the last
+    finished stage (see ``CHECKPOINT_STAGES``) and what that stage produced:
+    the noise indices after detection, the path and size of the full NORDIC
+    output after the backend, and the split outputs with their sizes and
+    SHA-256. A restarted job resumes after the last stage whose products are
+    still intact, so the backend is not rerun just to redo the split. The
+    file is removed once the run's manifest entry is written.
+    """
+
+    def __init__(self, deriv_root: Path):
+        self.deriv_root = Path(deriv_root)
+        self.root = self.deriv_root / WORK_DIR / "checkpoints"
+
+    def entry_path(self, rel_path: Path) -> Path:
+        return self.root / Path(rel_path).parent / (Path(rel_path).name + ".json")
+
+    def load(self, rel_path: Path, key: str) -> Dict[str, Any]:
+        """The recorded state of a run, or ``{}`` if there is none for ``key``."""
+        try:
+            with open(self.entry_path(rel_path), "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(state, dict) or state.get("key") != key or state.get("stage") not in CHECKPOINT_STAGES:
+            return {}
+        return state
+
+    def save(self, rel_path: Path, key: str, stage: str, **data: Any) -> Dict[str, Any]:
+        """Record that ``stage`` finished, adding ``data`` to the run's state atomically."""
+        if stage not in CHECKPOINT_STAGES:
+            raise ValueError(f"Unknown checkpoint stage {stage!r}")
+        state = self.load(rel_path, key)
+        state.update(data, key=key, stage=stage)
+        dest = self.entry_path(rel_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + f".tmp{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2, default=str)
+        os.replace(tmp, dest)
+        return state
+
+    def clear(self, rel_path: Path) -> None:
+        try:
+            self.entry_path(rel_path).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def reached(state: Mapping[str, Any], stage: str) -> bool:
+    """True if the checkpoint ``state`` records ``stage`` or a later one as finished."""
+    recorded = state.get("stage")
+    return recorded in CHECKPOINT_STAGES and CHECKPOINT_STAGES.index(recorded) >= CHECKPOINT_STAGES.index(stage)
@@ -1,15 +1,357 @@
 from __future__ import annotations
 
+import contextlib
+import hashlib
+import io
+import json
+import mmap
+import os
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Deque, Dict, Iterator, Optional, Sequence, Tuple
 
 import gzip
 import nibabel as nib
 import numpy as np
 import shutil
+import struct
 
+from .gzip_index import GzipIndex, IndexedGzipReader
 
-def split_4d_nifti(nifti_file: str, noise_inds: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+# nibabel writes .nii.gz at level 1; keep that as the default for all outputs
+DEFAULT_COMPRESS_LEVEL = 1
+# Uncompressed bytes per gzip member written by ParallelGzipWriter
+GZIP_BLOCK_SIZE = 1024 * 1024
+# Gzip extra subfield in which ParallelGzipWriter stores each member's compressed size
+# (like the "BC" field of BGZF), so the members can be walked without decompressing
+MEMBER_SIZE_FIELD = b"NS"
+# Gzip header with FEXTRA set, 6 bytes of extra field, the subfield ID and its 4-byte length
+_MEMBER_HEADER = struct.Struct("<4sIBBH2sHI")
+
+
+def temp_path(path: Path) -> Path:
+    """A hidden, unique name next to ``path`` with the same extension."""
+    path = Path(path)
+    return path.with_name(f".tmp{os.getpid()}-{uuid.uuid4().hex[:8]}-{path.name}")
+
+
+@contextlib.contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Yield a temporary path that is renamed onto ``path`` when the block succeeds.
+
+    If the block raises, the temporary file is removed. ``path`` therefore
+    holds either its previous content or the complete new file, never a
+    partial write.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(path)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            tmp.unlink()
+        raise
+
+
+def _gzip_member(block: bytes, compress_level: int) -> bytes:
+    """``block`` as one gzip member whose header records the member's compressed size."""
+    deflate = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = deflate.compress(block) + deflate.flush()
+    xfl = 2 if compress_level == 9 else 4 if compress_level == 1 else 0
+    size = _MEMBER_HEADER.size + len(body) + 8
+    header = _MEMBER_HEADER.pack(b"\x1f\x8b\x08\x04", 0, xfl, 255, 8, MEMBER_SIZE_FIELD, 4, size)
+    return header + body + struct.pack("<II", zlib.crc32(block), len(block) % 2**32)
+
+
+def _member_sizes_total(f, size: int) -> Optional[int]:
+    """Sum of the ISIZE trailers of a gzip file written by :class:`ParallelGzipWriter`.
+
+    The members are walked through the compressed sizes in their headers,
+    reading one header and one trailer per member. Returns None if the first
+    member records no size (another writer), and -1 if the members do not
+    end exactly at the end of the file.
+    """
+    total = pos = 0
+    while pos < size:
+        f.seek(pos)
+        head = f.read(_MEMBER_HEADER.size)
+        if len(head) < _MEMBER_HEADER.size:
+            return -1
+        magic, _, _, _, xlen, field, field_len, member = _MEMBER_HEADER.unpack(head)
+        if magic != b"\x1f\x8b\x08\x04" or xlen != 8 or field != MEMBER_SIZE_FIELD or field_len != 4:
+            return None if pos == 0 else -1
+        if member < _MEMBER_HEADER.size + 8 or pos + member > size:
+            return -1
+        f.seek(pos + member - 4)
+        total += int.from_bytes(f.read(4), "little")
+        pos += member
+    return total
+
+
+def nifti_complete(path) -> bool:
+    """Cheap check that a NIfTI file holds all the data its header announces.
+
+    A .nii must be at least header offset plus data size long. For a .nii.gz
+    written by :class:`ParallelGzipWriter`, the uncompressed sizes in the
+    trailers of all members must add up to that size; the members are found
+    through the sizes recorded in their headers. Otherwise (single-member
+    gzip, e.g. nibabel) the trailer of the file must hold the whole size. A
+    file cut anywhere, including between two members, fails. Only the NIfTI
+    header and the gzip headers and trailers are read.
+    """
+    path = Path(path)
+    try:
+        img = nib.load(str(path))
+        expected = int(img.dataobj.offset) + int(np.prod(img.shape)) * img.get_data_dtype().itemsize
+        size = path.stat().st_size
+        if not str(path).endswith(".gz"):
+            return size >= expected
+        if size < 18:
+            return False
+        with open(path, "rb") as f:
+            total = _member_sizes_total(f, size)
+            if total is not None:
+                return total == expected
+            f.seek(-4, os.SEEK_END)
+            isize = int.from_bytes(f.read(4), "little")
+    except Exception:
+        return False
+    return isize == expected % 2**32
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Write-only file object producing gzip output compressed in parallel.
+
+    Data is cut into blocks of ``block_size`` bytes and each block is
+    compressed as an independent gzip member by a thread pool (zlib releases
+    the GIL), similar to pigz. Concatenated members form a standard gzip file
+    that gzip, zlib and nibabel read transparently. Members are written in
+    order, and at most ``2 * threads`` compressed blocks are held in memory.
+    The SHA-256 of the compressed output is available as :attr:`sha256`.
+    Each member's header records its compressed size (see
+    :data:`MEMBER_SIZE_FIELD`), which :func:`nifti_complete` uses to check
+    that no member is missing.
+    """
+
+    def __init__(
+        self,
+        path,
+        compress_level: int = DEFAULT_COMPRESS_LEVEL,
+        threads: Optional[int] = None,
+        block_size: int = GZIP_BLOCK_SIZE,
+    ):
+        super().__init__()
+        if not 0 <= compress_level <= 9:
+            raise ValueError(f"compress_level must be between 0 and 9, got {compress_level}")
+        self.compress_level = compress_level
+        self.block_size = int(block_size)
+        self._threads = threads or os.cpu_count() or 1
+        self._file = open(path, "wb")
+        self._pool = ThreadPoolExecutor(max_workers=self._threads)
+        self._pending: Deque = deque()
+        self._buffer = bytearray()
+        self._pos = 0
+        self._members = 0
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        """Hex SHA-256 of the compressed bytes written so far."""
+        return self._hash.hexdigest()
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # Only "seeking" to the current position is possible; nibabel falls
+        # back to writing zero padding when this raises.
+        if whence == io.SEEK_SET and offset == self._pos:
+            return self._pos
+        raise io.UnsupportedOperation("ParallelGzipWriter cannot seek")
+
+    def _emit(self, member: bytes) -> None:
+        self._file.write(member)
+        self._hash.update(member)
+
+    def write(self, data) -> int:
+        view = memoryview(data).cast("B")
+        self._buffer += view
+        self._pos += len(view)
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(view)
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(self._pool.submit(_gzip_member, block, self.compress_level))
+        self._members += 1
+        while len(self._pending) > 2 * self._threads:
+            self._emit(self._pending.popleft().result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or self._members == 0:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._emit(self._pending.popleft().result())
+        finally:
+            self._pool.shutdown()
+            self._file.close()
+            super().close()
+
+
+def stored_data(img) -> np.ndarray:
+    """Return the values of ``img`` as stored on disk (no scl_slope/scl_inter)."""
+    dataobj = img.dataobj
+    if hasattr(dataobj, "get_unscaled"):
+        return np.asanyarray(dataobj.get_unscaled())
+    return np.asanyarray(dataobj)
+
+
+def slope_inter(img) -> Tuple[float, float]:
+    """Return the (scl_slope, scl_inter) of a loaded image, (1, 0) if unscaled.
+
+    nibabel moves the scaling of a loaded file into its array proxy and
+    resets it in ``img.header``, so it is read from ``img.dataobj``.
+    """
+    dataobj = img.dataobj
+    if hasattr(dataobj, "slope"):
+        return float(dataobj.slope), float(dataobj.inter)
+    return 1.0, 0.0
+
+
+def apply_scaling(data: np.ndarray, img, dtype=np.float64) -> np.ndarray:
+    """Convert stored values of ``img`` to real-world values in ``dtype``.
+
+    No copy is made if the data is unscaled and already in ``dtype``.
+    """
+    slope, inter = slope_inter(img)
+    out = np.asarray(data, dtype=dtype)
+    if slope != 1.0 or inter != 0.0:
+        if out is data:
+            out = out.copy()
+        out *= slope
+        out += inter
+    return out
+
+
+class ImageCache:
+    """Per-run cache of loaded NIfTI images, bounded by a byte budget.
+
+    One run reads the magnitude series for noise detection, splitting and its
+    affine, and the JSON sidecar once per output. The cache keeps each image
+    (header and affine are cheap) and its decoded data in the on-disk dtype,
+    so the .nii.gz is decompressed only once. Decoded arrays are evicted least-recently-used
+    first when the total exceeds ``max_bytes``; an array larger than the whole
+    budget is returned without being cached.
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024**3):
+        self.max_bytes = int(max_bytes)
+        self._images: Dict[str, Any] = {}
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._sidecars: Dict[str, Dict[str, Any]] = {}
+        self._nbytes = 0
+
+    @staticmethod
+    def _key(path) -> str:
+        return str(Path(path).resolve())
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes currently held by decoded arrays."""
+        return self._nbytes
+
+    def image(self, path):
+        """Return the (lazily loaded) nibabel image for ``path``."""
+        key = self._key(path)
+        img = self._images.get(key)
+        if img is None:
+            img = nib.load(str(path))
+            self._images[key] = img
+        return img
+
+    def header(self, path):
+        return self.image(path).header
+
+    def affine(self, path) -> np.ndarray:
+        return self.image(path).affine
+
+    def decoded_nbytes(self, path) -> int:
+        """Size of the decoded (stored-dtype) array for ``path``, from the header."""
+        img = self.image(path)
+        return int(np.prod(img.shape)) * img.get_data_dtype().itemsize
+
+    def fits(self, path) -> bool:
+        """True if the decoded data of ``path`` is, or could be, cached."""
+        return self._key(path) in self._data or self.decoded_nbytes(path) <= self.max_bytes
+
+    def data(self, path) -> np.ndarray:
+        """Return the stored values of ``path`` (on-disk dtype, before
+        ``scl_slope``/``scl_inter``), decoding at most once."""
+        key = self._key(path)
+        data = self._data.get(key)
+        if data is not None:
+            self._data.move_to_end(key)
+            return data
+        data = stored_data(self.image(path))
+        if data.nbytes <= self.max_bytes:
+            while self._data and self._nbytes + data.nbytes > self.max_bytes:
+                _, old = self._data.popitem(last=False)
+                self._nbytes -= old.nbytes
+            self._data[key] = data
+            self._nbytes += data.nbytes
+        return data
+
+    def cached_data(self, path) -> Optional[np.ndarray]:
+        """Return the decoded data of ``path`` if it is cached, without decoding."""
+        return self._data.get(self._key(path))
+
+    def sidecar(self, json_file) -> Dict[str, Any]:
+        """Return the parsed JSON sidecar (empty dict if it does not exist)."""
+        key = self._key(json_file)
+        meta = self._sidecars.get(key)
+        if meta is None:
+            meta = {}
+            if Path(json_file).exists():
+                with open(json_file, "r") as f:
+                    meta = json.load(f)
+            self._sidecars[key] = meta
+        return dict(meta)
+
+    def discard(self, path) -> None:
+        """Forget everything cached for ``path``."""
+        key = self._key(path)
+        self._images.pop(key, None)
+        data = self._data.pop(key, None)
+        if data is not None:
+            self._nbytes -= data.nbytes
+
+    def clear(self) -> None:
+        self._images.clear()
+        self._data.clear()
+        self._sidecars.clear()
+        self._nbytes = 0
+
+
+def split_4d_nifti(
+    nifti_file: str,
+    noise_inds: np.ndarray,
+    cache: Optional[ImageCache] = None,
+    dtype=np.float64,
+    index: Optional[GzipIndex] = None,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
     """Split a 4D NIfTI into functional volumes and noise volumes.
 
     The original scripts assume noise volumes (if present) are appended at the end.
@@ -21,13 +363,34 @@ def split_4d_nifti(nifti_file: str, noise_inds: np.ndarray) -> Tuple[np.ndarray,
         Path to 4D NIfTI.
     noise_inds:
         Indices of noise volumes along the 4th dimension.
+    cache:
+        Optional ImageCache; if given, the decoded data is taken from (and
+        kept in) the cache instead of being decoded again.
+    dtype:
+        dtype of the returned real-world values (``scl_slope``/``scl_inter``
+        applied); float64 by default, like ``get_fdata()``. ``None`` returns
+        the stored values in the on-disk dtype, which ``save_nifti`` can write
+        back unchanged given the source header and its scaling.
+    index:
+        Optional :class:`~nordic_preproc.gzip_index.GzipIndex` of a .nii.gz;
+        the file is then read through it (and the index extended) instead of
+        through nibabel. Ignored if the data is cached.
 
     Returns
     -------
     (functional_data, noise_data or None)
     """
-    img = nib.load(nifti_file)
-    data = img.get_fdata()
+    img = cache.image(nifti_file) if cache is not None else nib.load(nifti_file)
+    data = cache.cached_data(nifti_file) if cache is not None else None
+    if data is None and index is not None and str(nifti_file).endswith(".gz"):
+        with VolumeReader(nifti_file, index=index) as reader:
+            data = reader.read(0, reader.n_volumes)
+        if len(img.shape) == 3:
+            data = data[..., 0]
+    elif data is None:
+        data = cache.data(nifti_file) if cache is not None else stored_data(img)
+    if dtype is not None:
+        data = apply_scaling(data, img, dtype=dtype)
     if len(noise_inds) > 0:
         noise_start_index = int(noise_inds[0])
         functional_data = data[..., :noise_start_index]
@@ -36,17 +399,390 @@ def split_4d_nifti(nifti_file: str, noise_inds: np.ndarray) -> Tuple[np.ndarray,
     return data, None
 
 
-def save_nifti(data: np.ndarray, affine, out_path: Path) -> None:
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    nib.save(nib.Nifti1Image(data, affine), str(out_path))
+def save_nifti(
+    data: np.ndarray,
+    affine,
+    out_path: Path,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+    threads: Optional[int] = None,
+    header=None,
+    dtype=None,
+    scaling: Optional[Tuple[float, float]] = None,
+) -> None:
+    """Save ``data`` as a NIfTI; ``.nii.gz`` paths use the parallel gzip writer.
+
+    Parameters
+    ----------
+    header:
+        Source header to keep (TR, units, qform/sform codes, on-disk dtype).
+        The shape is taken from ``data``.
+    dtype:
+        On-disk dtype; defaults to the header's dtype, or to ``data.dtype``
+        without a header. Integer dtypes get a slope/intercept computed by
+        nibabel unless ``scaling`` is given.
+    scaling:
+        ``(scl_slope, scl_inter)`` mapping ``data`` (already in the on-disk
+        dtype) to real-world values; written as-is, without rescaling.
+    """
+    img = nib.Nifti1Image(data, affine, header)
+    if dtype is not None:
+        img.set_data_dtype(dtype)
+    if scaling is not None:
+        img.header.set_slope_inter(*scaling)
+    with atomic_path(out_path) as tmp:
+        if not str(out_path).endswith(".gz"):
+            nib.save(img, str(tmp))
+            return
+        with ParallelGzipWriter(tmp, compress_level=compress_level, threads=threads) as f_out:
+            img.to_file_map(img.make_file_map({"image": f_out}))
+
 
+def gzip_nii(
+    nii_path: Path,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+    threads: Optional[int] = None,
+    gz_path: Optional[Path] = None,
+) -> Path:
+    """Compress a .nii file to .nii.gz and remove the original .nii.
 
-def gzip_nii(nii_path: Path) -> Path:
-    """Compress a .nii file to .nii.gz and remove the original .nii."""
+    The output goes next to the input unless ``gz_path`` is given.
+    """
     if str(nii_path).endswith(".gz"):
         return nii_path
-    gz_path = Path(str(nii_path) + ".gz")
-    with open(nii_path, "rb") as f_in, gzip.open(gz_path, "wb") as f_out:
-        shutil.copyfileobj(f_in, f_out)
+    gz_path = Path(gz_path) if gz_path is not None else Path(str(nii_path) + ".gz")
+    with atomic_path(gz_path) as tmp, open(nii_path, "rb") as f_in, \
+            ParallelGzipWriter(tmp, compress_level=compress_level, threads=threads) as f_out:
+        shutil.copyfileobj(f_in, f_out, GZIP_BLOCK_SIZE)
     nii_path.unlink()
     return gz_path
+
+
+class VolumeReader:
+    """Read stored volumes of a 4D .nii / .nii.gz straight from the file.
+
+    Volumes are returned in the on-disk dtype (no ``scl_slope``/``scl_inter``)
+    as ``(x, y, z, n)`` arrays. Reading forward through a .nii.gz continues
+    from the current position, so a sequential pass decompresses the file
+    once. An uncompressed .nii is memory-mapped and volumes are returned as
+    read-only views of the mapping, without copying.
+
+    With a :class:`~nordic_preproc.gzip_index.GzipIndex` a .nii.gz is read
+    through an :class:`~nordic_preproc.gzip_index.IndexedGzipReader`: reading
+    volumes out of order, or starting far into the series, decompresses only
+    from the nearest seek point. Reading also extends the index
+    (:attr:`index`), which the caller can save for the next reader.
+    """
+
+    def __init__(self, path, index: Optional[GzipIndex] = None):
+        self.path = Path(path)
+        img = nib.load(str(path))
+        proxy = img.dataobj
+        self.shape = tuple(int(n) for n in img.shape)
+        if len(self.shape) == 3:
+            self.shape = self.shape + (1,)
+        self.dtype = np.dtype(proxy.dtype)
+        self.offset = int(proxy.offset)
+        self.slope, self.inter = slope_inter(img)
+        self.volume_bytes = int(np.prod(self.shape[:3])) * self.dtype.itemsize
+        self._mmap = None
+        self.index: Optional[GzipIndex] = None
+        if str(path).endswith(".gz") and index is not None:
+            self._file = IndexedGzipReader(path, index)
+            self.index = self._file.index
+        elif str(path).endswith(".gz"):
+            self._file = gzip.open(str(path), "rb")
+        else:
+            self._file = open(str(path), "rb")
+            if os.fstat(self._file.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def n_volumes(self) -> int:
+        return self.shape[3]
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        stop = min(stop, self.n_volumes)
+        pos = self.offset + start * self.volume_bytes
+        n_bytes = (stop - start) * self.volume_bytes
+        if self._mmap is not None:
+            if pos + n_bytes > len(self._mmap):
+                raise EOFError(f"{self.path} is truncated: expected {n_bytes} bytes at volume {start}")
+            buf = memoryview(self._mmap)[pos:pos + n_bytes]
+        else:
+            self._file.seek(pos)
+            buf = self._file.read(n_bytes)
+            if len(buf) != n_bytes:
+                raise EOFError(f"{self.path} is truncated: expected {n_bytes} bytes at volume {start}")
+        return np.frombuffer(buf, dtype=self.dtype).reshape(self.shape[:3] + (stop - start,), order="F")
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Arrays returned by read() still reference the mapping; it is
+                # unmapped when the last of them is garbage collected.
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self) -> "VolumeReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_stored_volumes(
+    nifti_file,
+    start: int = 0,
+    stop: Optional[int] = None,
+    chunk_volumes: int = 8,
+    cache: Optional[ImageCache] = None,
+    index: Optional[GzipIndex] = None,
+) -> Iterator[np.ndarray]:
+    """Yield stored values of volumes ``start:stop`` in chunks of ``chunk_volumes``.
+
+    ``nifti_file`` may also be an array, which is sliced. Data already
+    decoded in ``cache`` is sliced without touching the file; otherwise the
+    file is streamed with a :class:`VolumeReader` (through ``index``, if
+    given, so a late ``start`` skips most of a .nii.gz).
+    """
+    if isinstance(nifti_file, np.ndarray):
+        data = nifti_file
+    else:
+        data = cache.cached_data(nifti_file) if cache is not None else None
+    if data is not None:
+        if data.ndim == 3:
+            data = data[..., None]
+        stop = data.shape[3] if stop is None else stop
+        for i in range(start, stop, chunk_volumes):
+            yield data[..., i:min(i + chunk_volumes, stop)]
+        return
+    with VolumeReader(nifti_file, index=index) as reader:
+        stop = reader.n_volumes if stop is None else stop
+        for i in range(start, stop, chunk_volumes):
+            yield reader.read(i, min(i + chunk_volumes, stop))
+
+
+class NiftiStreamWriter:
+    """Write a 4D NIfTI volume by volume, without holding the series in memory.
+
+    The header (taken from ``header`` with the given shape, dtype and
+    scaling) is written first, then each chunk passed to :meth:`write` is
+    appended in Fortran order. ``.nii.gz`` paths go through
+    :class:`ParallelGzipWriter`. The file is written under a temporary name
+    and renamed to ``out_path`` only when it is complete (see
+    :func:`atomic_path`). The SHA-256 of the file as written is available as
+    :attr:`sha256` after closing.
+    """
+
+    def __init__(
+        self,
+        out_path: Path,
+        shape: Sequence[int],
+        affine,
+        header=None,
+        dtype=None,
+        scaling: Optional[Tuple[float, float]] = None,
+        compress_level: int = DEFAULT_COMPRESS_LEVEL,
+        threads: Optional[int] = None,
+    ):
+        self.out_path = Path(out_path)
+        dtype = np.dtype(dtype if dtype is not None else header.get_data_dtype())
+        # A zero-strided stand-in lets nibabel fill in the header for the full shape
+        img = nib.Nifti1Image(np.broadcast_to(np.zeros((), dtype=dtype), tuple(shape)), affine, header)
+        img.set_data_dtype(dtype)
+        img.update_header()
+        hdr = img.header
+        hdr.set_slope_inter(*(scaling if scaling is not None else (1.0, 0.0)))
+        self.header = hdr
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = hdr.get_data_dtype()
+        self._written = 0
+
+        self.sha256: Optional[str] = None
+        self._hash = None if str(self.out_path).endswith(".gz") else hashlib.sha256()
+
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = temp_path(self.out_path)
+        if self._hash is None:
+            self._file = ParallelGzipWriter(self._tmp_path, compress_level=compress_level, threads=threads)
+        else:
+            self._file = open(self._tmp_path, "wb")
+        buf = io.BytesIO()
+        hdr.write_to(buf)
+        pad = hdr.get_data_offset() - buf.tell()
+        if pad > 0:
+            buf.write(b"\x00" * pad)
+        self._write(buf.getvalue())
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        if self._hash is not None:
+            self._hash.update(data)
+
+    def write(self, volumes: np.ndarray) -> None:
+        """Append ``(x, y, z, n)`` volumes, already in the on-disk encoding."""
+        if volumes.ndim == 3:
+            volumes = volumes[..., None]
+        self._write(np.asarray(volumes, dtype=self.dtype).tobytes(order="F"))
+        self._written += volumes.shape[3]
+
+    def close(self) -> None:
+        self._file.close()
+        self.sha256 = self._hash.hexdigest() if self._hash is not None else self._file.sha256
+        expected = self.shape[3] if len(self.shape) > 3 else 1
+        if self._written != expected:
+            self._discard()
+            raise ValueError(f"{self.out_path}: wrote {self._written} volumes, header says {expected}")
+        os.replace(self._tmp_path, self.out_path)
+
+    def _discard(self) -> None:
+        with contextlib.suppress(OSError):
+            self._tmp_path.unlink()
+
+    def __enter__(self) -> "NiftiStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self._discard()
+
+
+def _int_scaling(nifti_file, dtype, cache: Optional[ImageCache], chunk_volumes: int,
+                 index: Optional[GzipIndex] = None) -> Tuple[float, float]:
+    """Slope mapping the real-world range of ``nifti_file`` onto integer ``dtype``."""
+    if isinstance(nifti_file, np.ndarray):
+        slope, inter = 1.0, 0.0
+    else:
+        img = cache.image(nifti_file) if cache is not None else nib.load(str(nifti_file))
+        slope, inter = slope_inter(img)
+    peak = 0.0
+    for chunk in iter_stored_volumes(nifti_file, chunk_volumes=chunk_volumes, cache=cache, index=index):
+        if chunk.size:
+            values = chunk.astype(np.float32) * slope + inter
+            peak = max(peak, float(np.abs(values).max()))
+    return (peak / np.iinfo(dtype).max if peak > 0 else 1.0), 0.0
+
+
+def stream_split_nifti(
+    nifti_file,
+    noise_inds: np.ndarray,
+    functional_out: Path,
+    noise_out: Optional[Path] = None,
+    header=None,
+    affine=None,
+    dtype=None,
+    cache: Optional[ImageCache] = None,
+    chunk_volumes: int = 8,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+    threads: Optional[int] = None,
+    index: Optional[GzipIndex] = None,
+    stats=None,
+) -> Dict[Path, str]:
+    """Split a 4D NIfTI into functional and noise files, streaming the volumes.
+
+    Like :func:`split_4d_nifti` (noise volumes start at ``noise_inds[0]``),
+    but each chunk of ``chunk_volumes`` is read and written straight to the
+    output it belongs to, so only a few volumes are in memory at a time.
+
+    Parameters
+    ----------
+    nifti_file:
+        Source file, or a 4D array of real-world values (e.g. denoised in
+        memory), in which case ``header`` and ``affine`` are required.
+    header, affine:
+        Header/affine written to both outputs (default: those of the source).
+    dtype:
+        ``None`` copies the stored values with the source's dtype and
+        ``scl_slope``/``scl_inter`` (bit-identical). A float dtype writes the
+        real-world values in that type; an integer dtype rescales them to
+        its range, which costs one extra pass over the source.
+    noise_out:
+        Where to write the noise volumes; they are dropped if None.
+    index:
+        Optional :class:`~nordic_preproc.gzip_index.GzipIndex` of a .nii.gz
+        source, used (and extended) while reading it.
+    stats:
+        Optional :class:`~nordic_preproc.qc.SplitStats`, fed the real-world
+        values of each output's volumes as they pass (for QC maps without a
+        second read).
+
+    Returns
+    -------
+    dict
+        SHA-256 of each written file, keyed by path.
+    """
+    if isinstance(nifti_file, np.ndarray):
+        if header is None or affine is None:
+            raise ValueError("header and affine are needed to write an in-memory array")
+        shape = nifti_file.shape
+        src_dtype, (src_slope, src_inter) = nifti_file.dtype, (1.0, 0.0)
+    else:
+        img = cache.image(nifti_file) if cache is not None else nib.load(str(nifti_file))
+        shape = img.shape
+        header = img.header if header is None else header
+        affine = img.affine if affine is None else affine
+        src_dtype, (src_slope, src_inter) = img.get_data_dtype(), slope_inter(img)
+    shape = tuple(int(n) for n in shape)
+    if len(shape) == 3:
+        shape = shape + (1,)
+
+    if dtype is None:
+        out_dtype, scaling = src_dtype, (src_slope, src_inter)
+    else:
+        out_dtype = np.dtype(dtype)
+        if np.issubdtype(out_dtype, np.integer):
+            scaling = _int_scaling(nifti_file, out_dtype, cache, chunk_volumes, index=index)
+        else:
+            scaling = (1.0, 0.0)
+
+    def real(chunk: np.ndarray) -> np.ndarray:
+        values = chunk.astype(np.float32)
+        if src_slope != 1.0 or src_inter != 0.0:
+            values = values * src_slope + src_inter
+        return values
+
+    def encode(chunk: np.ndarray) -> np.ndarray:
+        if dtype is None:
+            return chunk
+        values = real(chunk)
+        if np.issubdtype(out_dtype, np.integer):
+            info = np.iinfo(out_dtype)
+            values = np.clip(np.rint((values - scaling[1]) / scaling[0]), info.min, info.max)
+        return values
+
+    split = int(noise_inds[0]) if len(noise_inds) > 0 else shape[3]
+    parts = [(functional_out, 0, split)]
+    if noise_out is not None and split < shape[3]:
+        parts.append((noise_out, split, shape[3]))
+    end = parts[-1][2]
+    accumulators = [stats.functional, stats.noise][:len(parts)] if stats is not None else [None] * len(parts)
+    # Float outputs are already the real-world values the statistics need
+    encoded_is_real = dtype is not None and not np.issubdtype(out_dtype, np.integer)
+
+    kw = dict(affine=affine, header=header, dtype=out_dtype, scaling=scaling,
+              compress_level=compress_level, threads=threads)
+    with contextlib.ExitStack() as stack:
+        writers = [
+            (stack.enter_context(NiftiStreamWriter(path, shape[:3] + (stop - start,), **kw)), start, stop)
+            for path, start, stop in parts
+        ]
+        # One pass over the source; a chunk straddling the split feeds both outputs
+        pos = 0
+        for chunk in iter_stored_volumes(nifti_file, 0, end, chunk_volumes, cache=cache, index=index):
+            chunk_stop = pos + chunk.shape[3]
+            for (writer, start, stop), acc in zip(writers, accumulators):
+                lo, hi = max(pos, start), min(chunk_stop, stop)
+                if lo < hi:
+                    part = chunk[..., lo - pos:hi - pos]
+                    values = encode(part)
+                    writer.write(values)
+                    if acc is not None:
+                        acc.update(values if encoded_is_real else real(part))
+            pos = chunk_stop
+    return {writer.out_path: writer.sha256 for writer, _, _ in writers}
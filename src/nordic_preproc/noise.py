@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Sequence
+from typing import Optional, Sequence
 
 import nibabel as nib
 import numpy as np
 
+from .gzip_index import GzipIndex
+from .nifti_ops import ImageCache, iter_stored_volumes, slope_inter
+
 
 @dataclass(frozen=True)
 class NoiseDetectionResult:
@@ -16,7 +19,50 @@ class NoiseDetectionResult:
     median_variance: float
 
 
-def find_noise_scans(nifti_file: str, mad_thresh: float = 50) -> NoiseDetectionResult:
+def volume_variances(dataobj, batch_size: int = 8) -> np.ndarray:
+    """Compute the spatial variance of each volume of a 4D image.
+
+    Volumes are read from ``dataobj`` in batches of ``batch_size`` and
+    converted to float32, so memory use is bounded by the batch rather than
+    by the length of the series.
+
+    Parameters
+    ----------
+    dataobj:
+        ``img.dataobj`` of a nibabel image (typically loaded with
+        ``keep_file_open=True`` so that a compressed file is decompressed only
+        once while streaming), or an already decoded array.
+    batch_size:
+        Number of volumes read per step.
+
+    Returns
+    -------
+    np.ndarray
+        One variance per volume (float64 array of length n_volumes).
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+    shape = dataobj.shape
+    if len(shape) < 4:
+        data = np.asarray(dataobj, dtype=np.float32)
+        return np.atleast_1d(np.var(data, dtype=np.float32)).astype(np.float64)
+
+    n_vols = shape[3]
+    variances = np.empty(n_vols, dtype=np.float64)
+    for start in range(0, n_vols, batch_size):
+        stop = min(start + batch_size, n_vols)
+        batch = np.asarray(dataobj[..., start:stop], dtype=np.float32)
+        variances[start:stop] = np.var(batch, axis=(0, 1, 2), dtype=np.float32)
+    return variances
+
+
+def find_noise_scans(
+    nifti_file: str,
+    mad_thresh: float = 50,
+    batch_size: Optional[int] = 8,
+    cache: Optional[ImageCache] = None,
+    index: Optional[GzipIndex] = None,
+) -> NoiseDetectionResult:
     """Detect noise scans in a 4D NIfTI by low variance.
 
     This implements the logic used in the original scripts:
@@ -31,15 +77,50 @@ def find_noise_scans(nifti_file: str, mad_thresh: float = 50) -> NoiseDetectionR
         Path to a 4D NIfTI (typically the magnitude BOLD series).
     mad_thresh:
         Multiplier on MAD for the detection threshold.
+    batch_size:
+        Number of volumes decoded at a time. The series is streamed through
+        ``img.dataobj`` so memory stays roughly constant regardless of run
+        length. Pass ``None`` to decode the whole series at once in float64
+        (the original behaviour).
+    cache:
+        Optional :class:`~nordic_preproc.nifti_ops.ImageCache`. If the decoded
+        series fits in the cache budget it is decoded once and kept there, so
+        the later split of the same file does not decompress it again.
+    index:
+        Optional :class:`~nordic_preproc.gzip_index.GzipIndex` of a .nii.gz.
+        The streamed pass then reads through it and records seek points, so
+        later reads of the same file can start anywhere (save the index
+        afterwards to keep it). Not used when the series is cached.
 
     Returns
     -------
     NoiseDetectionResult
         Includes noise indices and diagnostic values.
     """
-    img = nib.load(nifti_file)
-    data = img.get_fdata()
-    variances = np.var(data, axis=(0, 1, 2))
+    if cache is not None and cache.fits(nifti_file):
+        # Cached data holds stored values; var(slope * x + inter) = slope**2 * var(x)
+        slope, _ = slope_inter(cache.image(nifti_file))
+        variances = volume_variances(cache.data(nifti_file), batch_size=batch_size or 8) * slope**2
+    elif index is not None and batch_size is not None and nifti_file.endswith(".gz"):
+        slope, _ = slope_inter(nib.load(nifti_file))
+        variances = np.concatenate([
+            np.var(chunk.astype(np.float32), axis=(0, 1, 2), dtype=np.float32)
+            for chunk in iter_stored_volumes(nifti_file, chunk_volumes=batch_size, index=index)
+        ]).astype(np.float64) * slope**2
+    elif batch_size is None:
+        img = nib.load(nifti_file)
+        variances = np.var(img.get_fdata(), axis=(0, 1, 2))
+    else:
+        # keep_file_open lets successive batches continue from the current
+        # position in a .nii.gz instead of decompressing from the start again.
+        img = nib.load(nifti_file, keep_file_open=True)
+        variances = volume_variances(img.dataobj, batch_size=batch_size)
+    return detect_from_variances(variances, mad_thresh=mad_thresh)
+
+
+def detect_from_variances(variances: np.ndarray, mad_thresh: float = 50) -> NoiseDetectionResult:
+    """Apply the MAD threshold to precomputed per-volume variances."""
+    variances = np.asarray(variances)
     median_variance = float(np.median(variances))
     mad = float(np.median(np.abs(variances - median_variance)))
     threshold = median_variance - float(mad_thresh) * mad
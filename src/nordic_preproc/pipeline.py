@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Callable, List, Optional, Sequence
+
+from .scheduler import RunOutcome
+
+_DONE = object()
+
+
+def advise_willneed(path) -> None:
+    """Ask the kernel to start reading ``path`` into the page cache (best effort).
+
+    Used to prefetch inputs that another process (MATLAB, the MCR runner)
+    will read, so that its reads come from memory.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def run_pipeline(
+    items: Sequence[Any],
+    prepare: Callable[[Any], Any],
+    compute: Callable[[Any], Any],
+    finish: Callable[[Any], str],
+    name: Callable[[Any], str] = str,
+    discard: Optional[Callable[[Any], None]] = None,
+    depth: int = 1,
+    writers: int = 1,
+) -> List[RunOutcome]:
+    """Run items through prepare -> compute -> finish with the stages overlapped.
+
+    ``prepare(item)`` runs in a prefetch thread and returns a plan, or a
+    status string if there is nothing to compute. ``compute(plan)`` runs in
+    the calling thread, one item at a time and in order (this is where the
+    backend is called). ``finish(plan)`` runs in ``writers`` background
+    threads and returns the final status. While item N is being computed,
+    item N+1 is prepared and item N-1 is finished.
+
+    The stages are connected by queues holding at most ``depth`` plans each,
+    so at most ``2 * depth + writers + 2`` plans (and the memory they hold)
+    exist at any time. ``discard(plan)`` is called for plans that fail after
+    being prepared. Failures are recorded and do not stop the other items.
+
+    Returns the outcomes in item order.
+    """
+    if depth < 1 or writers < 1:
+        raise ValueError("depth and writers must be >= 1")
+    outcomes: List[Optional[RunOutcome]] = [None] * len(items)
+    started = [0.0] * len(items)
+    ready: "queue.Queue" = queue.Queue(maxsize=depth)
+    to_write: "queue.Queue" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def record(i: int, status: str, error: Optional[str] = None) -> None:
+        outcomes[i] = RunOutcome(name=name(items[i]), status=status, error=error,
+                                 seconds=time.perf_counter() - started[i])
+        if error is not None:
+            print(f"Failed {name(items[i])}: {error}")
+
+    def failed(i: int, e: BaseException, plan: Any = None) -> None:
+        traceback.print_exc()
+        if plan is not None and discard is not None:
+            try:
+                discard(plan)
+            except Exception:
+                pass
+        record(i, "failed", f"{type(e).__name__}: {e}")
+
+    def prefetch() -> None:
+        for i, item in enumerate(items):
+            if stop.is_set():
+                break
+            started[i] = time.perf_counter()
+            try:
+                plan = prepare(item)
+            except Exception as e:
+                failed(i, e)
+                continue
+            if isinstance(plan, str):
+                record(i, plan)
+                continue
+            ready.put((i, plan))
+        ready.put(_DONE)
+
+    def write() -> None:
+        while True:
+            job = to_write.get()
+            if job is _DONE:
+                return
+            i, plan = job
+            try:
+                record(i, finish(plan))
+            except Exception as e:
+                failed(i, e, plan)
+
+    threads = [threading.Thread(target=prefetch, name="nordic-prefetch", daemon=True)]
+    threads += [threading.Thread(target=write, name=f"nordic-write-{n}", daemon=True) for n in range(writers)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            job = ready.get()
+            if job is _DONE:
+                break
+            i, plan = job
+            try:
+                plan = compute(plan)
+            except Exception as e:
+                failed(i, e, plan)
+                continue
+            to_write.put((i, plan))
+    finally:
+        stop.set()
+        # Unblock the prefetcher if we are leaving early, then let the writers drain
+        while threads[0].is_alive():
+            try:
+                job = ready.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if job is not _DONE and discard is not None:
+                discard(job[1])
+        for _ in range(writers):
+            to_write.put(_DONE)
+        for t in threads:
+            t.join()
+
+    return [out if out is not None else RunOutcome(name=name(items[i]), status="failed", error="not run")
+            for i, out in enumerate(outcomes)]
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from .bids_index import BidsRun
+
+# Threads reading headers; on a network filesystem each read is mostly waiting
+DEFAULT_PREFLIGHT_THREADS = 16
+
+# Voxel sizes (mm) and affines may differ this much between magnitude and phase
+ZOOM_TOLERANCE = 1e-3
+AFFINE_TOLERANCE = 1e-3
+
+
+@dataclass(frozen=True)
+class PreflightResult:
+    """Problems found in one run's headers; the run is usable if ``errors`` is empty."""
+
+    name: str
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _describe(img) -> dict:
+    hdr = img.header
+    shape = tuple(int(n) for n in img.shape)
+    return {
+        "shape": shape,
+        "zooms": tuple(float(z) for z in hdr.get_zooms()[:3]),
+        "affine": img.affine,
+        "dtype": hdr.get_data_dtype(),
+        "cal": (float(hdr["cal_min"]), float(hdr["cal_max"])),
+    }
+
+
+def check_headers(magnitude, phase, sidecar: Optional[Path] = None) -> tuple:
+    """Compare the magnitude and phase headers; returns ``(errors, warnings)``.
+
+    Only the NIfTI headers are read, never image data. Errors are problems that
+    would make NORDIC fail or produce a wrong result (mismatched grids or
+    volume counts, non-real data types); warnings are worth a look but do not
+    stop a run (missing sidecar, 8-bit phase).
+    """
+    import nibabel as nib
+    import numpy as np
+
+    errors: List[str] = []
+    warnings: List[str] = []
+    if sidecar is None:
+        warnings.append("no JSON sidecar (outputs will only carry a Description)")
+
+    try:
+        mag = _describe(nib.load(str(magnitude)))
+    except Exception as e:
+        return [f"cannot read magnitude header: {type(e).__name__}: {e}"], warnings
+    try:
+        ph = _describe(nib.load(str(phase)))
+    except Exception as e:
+        return [f"cannot read phase header: {type(e).__name__}: {e}"], warnings
+
+    for label, d in (("magnitude", mag), ("phase", ph)):
+        if len(d["shape"]) != 4:
+            errors.append(f"{label} is {len(d['shape'])}D {d['shape']}, expected a 4D series")
+        if d["dtype"].kind not in "iuf":
+            errors.append(f"{label} has data type {d['dtype']}, expected real integers or floats")
+    if errors:
+        return errors, warnings
+
+    if mag["shape"][:3] != ph["shape"][:3]:
+        errors.append(f"matrix size differs: magnitude {mag['shape'][:3]}, phase {ph['shape'][:3]}")
+    if mag["shape"][3] != ph["shape"][3]:
+        errors.append(f"volume count differs: magnitude {mag['shape'][3]}, phase {ph['shape'][3]}")
+    if not np.allclose(mag["zooms"], ph["zooms"], rtol=0, atol=ZOOM_TOLERANCE):
+        errors.append(f"voxel size differs: magnitude {mag['zooms']}, phase {ph['zooms']}")
+    if not np.allclose(mag["affine"], ph["affine"], rtol=0, atol=AFFINE_TOLERANCE):
+        errors.append("affine differs between magnitude and phase")
+
+    # NORDIC rescales the phase by its observed min/max, so any real range works
+    # as long as it is not degenerate or too coarse to carry the phase.
+    cal_min, cal_max = ph["cal"]
+    if cal_min == cal_max != 0:
+        errors.append(f"phase display range is a single value ({cal_min}); the phase looks constant")
+    if ph["dtype"].kind in "iu" and ph["dtype"].itemsize == 1:
+        warnings.append(f"phase is stored as {ph['dtype']}; 8-bit phase is very coarse for NORDIC")
+    if mag["shape"][3] < 2:
+        errors.append("only one volume; NORDIC needs a time series")
+    return errors, warnings
+
+
+def check_run(run: BidsRun, name: str) -> PreflightResult:
+    """Preflight one discovered run (see :func:`check_headers`)."""
+    if run.phase is None:
+        return PreflightResult(name, warnings=["no phase file"])
+    errors, warnings = check_headers(run.magnitude, run.phase, run.sidecar)
+    return PreflightResult(name, errors=errors, warnings=warnings)
+
+
+def preflight_runs(runs: Sequence[BidsRun], bids_root: Path,
+                   threads: int = DEFAULT_PREFLIGHT_THREADS) -> List[PreflightResult]:
+    """Check every run's headers in a thread pool; results are in the order of ``runs``."""
+    names = [str(run.magnitude.relative_to(bids_root)) for run in runs]
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        return list(pool.map(check_run, runs, names))
+
+
+def format_report(results: Sequence[PreflightResult]) -> str:
+    """Report of the runs with problems, followed by a one-line count."""
+    lines = []
+    for r in results:
+        if r.errors or r.warnings:
+            lines.append(f"{'FAIL' if r.errors else 'WARN'} {r.name}")
+            lines.extend(f"    error: {msg}" for msg in r.errors)
+            lines.extend(f"    warning: {msg}" for msg in r.warnings)
+    failed = sum(not r.ok for r in results)
+    warned = sum(r.ok and bool(r.warnings) for r in results)
+    lines.append(f"Preflight: {len(results)} run(s) checked, {failed} failed, {warned} with warnings")
+    return "\n".join(lines)
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+@dataclass(frozen=True)
+class StageRecord:
+    """Resources used by one stage of one run.
+
+    ``cpu_s`` includes all threads of this process and any child processes
+    (e.g. the MCR runner) that finished during the stage. ``peak_rss`` is the
+    peak resident memory of this process during the stage where the kernel
+    allows resetting the high-water mark, otherwise the process peak so far;
+    ``child_peak_rss`` is the largest finished child so far. I/O counts are
+    bytes passed through read/write calls (``/proc/self/io`` rchar/wchar) and
+    are None where unavailable.
+    """
+
+    run: str
+    stage: str
+    wall_s: float
+    cpu_s: float
+    peak_rss: int
+    child_peak_rss: int
+    read_bytes: Optional[int]
+    write_bytes: Optional[int]
+    pid: int
+    start: float
+
+
+def _io_counters() -> Optional[Dict[str, int]]:
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"read": int(fields["rchar"]), "write": int(fields["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _maxrss_bytes(who: str) -> int:
+    if resource is None:
+        return 0
+    rss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS mark (Linux); False if not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> int:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return _maxrss_bytes("RUSAGE_SELF")
+
+
+def _cpu_seconds() -> float:
+    if resource is None:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class Profiler:
+    """Record wall/CPU time, peak memory and I/O of named pipeline stages.
+
+    Use :meth:`stage` around each step of a run::
+
+        prof = Profiler(trace_file="trace.jsonl")
+        with prof.stage("detect", run="sub-01_bold"):
+            ...
+        print(prof.summary())
+
+    Each finished stage is appended to ``trace_file`` as one JSON line, so
+    several processes can share a trace. A disabled profiler (the default for
+    library calls) does nothing. Stages may be nested; the outer stage's
+    figures include the inner ones. Stages may run in several threads at once,
+    in which case CPU time, peak RSS and I/O are those of the whole process.
+    """
+
+    def __init__(self, trace_file: Optional[Path] = None, enabled: bool = True):
+        self.trace_file = Path(trace_file) if trace_file is not None else None
+        self.enabled = enabled
+        self.records: List[StageRecord] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, run: str = "") -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        # Only the outermost stage resets the peak-RSS mark, so nested stages
+        # do not hide the peak of the stage around them
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            _reset_peak_rss()
+        self._local.depth = depth + 1
+        io_start = _io_counters()
+        cpu_start = _cpu_seconds()
+        wall_start = time.perf_counter()
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            wall = time.perf_counter() - wall_start
+            cpu = _cpu_seconds() - cpu_start
+            io_end = _io_counters()
+            record = StageRecord(
+                run=run,
+                stage=name,
+                wall_s=wall,
+                cpu_s=cpu,
+                peak_rss=_peak_rss(),
+                child_peak_rss=_maxrss_bytes("RUSAGE_CHILDREN"),
+                read_bytes=io_end["read"] - io_start["read"] if io_start and io_end else None,
+                write_bytes=io_end["write"] - io_start["write"] if io_start and io_end else None,
+                pid=os.getpid(),
+                start=start,
+            )
+            with self._lock:
+                self.records.append(record)
+                self._append(record)
+
+    def _append(self, record: StageRecord) -> None:
+        if self.trace_file is None:
+            return
+        self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+        # One write per line in append mode, so lines from parallel workers do not interleave
+        with open(self.trace_file, "a") as f:
+            f.write(json.dumps(asdict(record)) + "\n")
+
+    def summary(self) -> str:
+        return summarize_records(self.records)
+
+
+# Shared do-nothing profiler for callers that do not profile
+NULL_PROFILER = Profiler(enabled=False)
+
+
+def load_trace(trace_file: Path) -> List[StageRecord]:
+    """Read the records of a JSON-lines trace written by :class:`Profiler`."""
+    records = []
+    with open(trace_file, "r") as f:
+        for line in f:
+            if line.strip():
+                records.append(StageRecord(**json.loads(line)))
+    return records
+
+
+def format_bytes(n: Optional[int]) -> str:
+    """Short human-readable size (``"512B"``, ``"1.5G"``); ``"-"`` for None."""
+    if n is None:
+        return "-"
+    for unit in ("B", "K", "M", "G"):
+        if abs(n) < 1024 or unit == "G":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return str(n)
+
+
+def summarize_records(records: Iterable[StageRecord]) -> str:
+    """Table of totals per stage, sorted by total wall time (largest first)."""
+    stages: Dict[str, Dict[str, float]] = {}
+    for r in records:
+        s = stages.setdefault(r.stage, {"n": 0, "wall": 0.0, "max_wall": 0.0, "cpu": 0.0, "rss": 0,
+                                        "read": None, "write": None})
+        s["n"] += 1
+        s["wall"] += r.wall_s
+        s["max_wall"] = max(s["max_wall"], r.wall_s)
+        s["cpu"] += r.cpu_s
+        s["rss"] = max(s["rss"], r.peak_rss)
+        if r.read_bytes is not None:
+            s["read"] = (s["read"] or 0) + r.read_bytes
+            s["write"] = (s["write"] or 0) + r.write_bytes
+    header = f"{'stage':<16}{'runs':>6}{'wall s':>10}{'max s':>9}{'cpu s':>10}{'peak rss':>10}{'read':>9}{'written':>9}"
+    lines = ["Profile:", header]
+    for name, s in sorted(stages.items(), key=lambda kv: -kv[1]["wall"]):
+        lines.append(f"{name:<16}{s['n']:>6}{s['wall']:>10.2f}{s['max_wall']:>9.2f}{s['cpu']:>10.2f}"
+                     f"{format_bytes(s['rss']):>10}{format_bytes(s['read']):>9}{format_bytes(s['write']):>9}")
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+
+from .nifti_ops import DEFAULT_COMPRESS_LEVEL, atomic_path, iter_stored_volumes, save_nifti, slope_inter
+
+# Maps written per functional series
+QC_MAPS = ("mean", "std", "tsnr")
+# Voxels whose raw temporal mean exceeds this fraction of the 98th percentile form the tSNR mask
+MASK_FRACTION = 0.1
+
+
+class SeriesStats:
+    """Per-voxel temporal mean and variance of a 4D series, fed a chunk of volumes at a time.
+
+    Chunk moments are merged into float64 running totals with the pairwise
+    update of Chan et al., which stays accurate over long series without
+    holding more than one chunk. The standard deviation is the sample one
+    (``ddof=1``).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean: Optional[np.ndarray] = None
+        self._m2: Optional[np.ndarray] = None
+
+    def update(self, volumes: np.ndarray) -> None:
+        """Add the volumes of a 4D chunk (real-world values)."""
+        k = volumes.shape[3] if volumes.ndim > 3 else 1
+        if k == 0:
+            return
+        volumes = volumes.reshape(volumes.shape[:3] + (k,))
+        mean = volumes.mean(axis=3, dtype=np.float64)
+        m2 = np.square(volumes - mean[..., None], dtype=np.float64).sum(axis=3)
+        if self.n == 0:
+            self.n, self.mean, self._m2 = k, mean, m2
+            return
+        total = self.n + k
+        delta = mean - self.mean
+        self.mean += delta * (k / total)
+        self._m2 += m2 + np.square(delta) * (self.n * k / total)
+        self.n = total
+
+    @property
+    def var(self) -> np.ndarray:
+        return self._m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self._m2)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+    @property
+    def tsnr(self) -> np.ndarray:
+        """Temporal mean over standard deviation; 0 where the voxel does not vary."""
+        std = self.std
+        return np.divide(self.mean, std, out=np.zeros_like(self.mean), where=std > 0)
+
+    @property
+    def sigma(self) -> float:
+        """Pooled standard deviation over all voxels (the noise level of noise volumes)."""
+        return float(np.sqrt(self.var.mean()))
+
+
+@dataclass
+class SplitStats:
+    """Statistics gathered by :func:`~nordic_preproc.nifti_ops.stream_split_nifti` for each output."""
+
+    functional: SeriesStats = field(default_factory=SeriesStats)
+    noise: SeriesStats = field(default_factory=SeriesStats)
+
+
+def series_stats(source, stop: Optional[int] = None, cache=None, index=None, chunk_volumes: int = 8) -> SeriesStats:
+    """Statistics of the first ``stop`` volumes (all by default) of a file or array, read once."""
+    import nibabel as nib
+
+    if isinstance(source, np.ndarray):
+        n_volumes, (slope, inter) = source.shape[3], (1.0, 0.0)
+    else:
+        img = cache.image(source) if cache is not None else nib.load(str(source))
+        n_volumes, (slope, inter) = img.shape[3], slope_inter(img)
+    stats = SeriesStats()
+    for chunk in iter_stored_volumes(source, 0, n_volumes if stop is None else stop, chunk_volumes,
+                                     cache=cache, index=index):
+        stats.update(chunk.astype(np.float32) * np.float32(slope) + np.float32(inter))
+    return stats
+
+
+def tsnr_mask(raw: SeriesStats) -> np.ndarray:
+    """Voxels with signal: raw mean above :data:`MASK_FRACTION` of its 98th percentile."""
+    return raw.mean > MASK_FRACTION * np.percentile(raw.mean, 98)
+
+
+def _series_summary(stats: SeriesStats, mask: np.ndarray) -> dict:
+    tsnr = stats.tsnr[mask]
+    return {
+        "volumes": stats.n,
+        "tsnr_median": float(np.median(tsnr)) if tsnr.size else None,
+        "tsnr_mean": float(tsnr.mean()) if tsnr.size else None,
+    }
+
+
+def qc_summary(raw: SplitStats, nordic: SplitStats) -> dict:
+    """tSNR within the signal mask before and after NORDIC, and the noise level of the noise volumes.
+
+    ``tsnr_gain`` is None, with a ``tsnr_gain_note`` saying why, when the raw
+    median tSNR is 0 (or there is no masked voxel).
+    """
+    mask = tsnr_mask(raw.functional)
+    summary = {
+        "mask_voxels": int(mask.sum()),
+        "functional_raw": _series_summary(raw.functional, mask),
+        "functional_nordic": _series_summary(nordic.functional, mask),
+    }
+    before, after = summary["functional_raw"]["tsnr_median"], summary["functional_nordic"]["tsnr_median"]
+    summary["tsnr_gain"] = (after / before) if (before and after is not None) else None
+    if summary["tsnr_gain"] is None:
+        summary["tsnr_gain_note"] = "undefined: the raw median tSNR is 0 or there are no masked voxels"
+    if raw.noise.n > 1 and nordic.noise.n > 1:
+        summary["noise_sigma_raw"] = raw.noise.sigma
+        summary["noise_sigma_nordic"] = nordic.noise.sigma
+        summary["noise_reduction"] = (raw.noise.sigma / nordic.noise.sigma if nordic.noise.sigma > 0 else None)
+    return summary
+
+
+def _spatial_header(header, shape):
+    """A copy of a 4D series header for a 3D map: no time dimension, step or unit."""
+    header = header.copy()
+    header.set_data_shape(shape)
+    header["pixdim"][4] = 1.0
+    header.set_xyzt_units(xyz=header.get_xyzt_units()[0], t=None)
+    return header
+
+
+def write_qc(
+    raw: SplitStats,
+    nordic: SplitStats,
+    maps: Mapping[str, Mapping[str, Path]],
+    summary_file: Path,
+    header,
+    affine,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+) -> Dict[Path, Optional[str]]:
+    """Write the mean, std and tSNR maps (float32) and the JSON summary.
+
+    ``maps`` gives the path of each map of :data:`QC_MAPS`, keyed by
+    "raw" and "nordic". Returns the written paths, in the form taken by
+    :meth:`~nordic_preproc.manifest.Manifest.record`. ``header`` is the
+    source's 4D header; the maps keep its spatial fields only.
+    """
+    header = _spatial_header(header, raw.functional.mean.shape)
+    written: Dict[Path, Optional[str]] = {}
+    for key, stats in (("raw", raw.functional), ("nordic", nordic.functional)):
+        for name in QC_MAPS:
+            path = Path(maps[key][name])
+            save_nifti(getattr(stats, name).astype(np.float32), affine, path, compress_level=compress_level,
+                       header=header, dtype=np.float32, scaling=(1.0, 0.0))
+            written[path] = None
+    summary = qc_summary(raw, nordic)
+    summary["maps"] = {key: {name: Path(p).name for name, p in paths.items()} for key, paths in maps.items()}
+    summary_file = Path(summary_file)
+    with atomic_path(summary_file) as tmp, open(tmp, "w") as f:
+        json.dump(summary, f, indent=4)
+    written[summary_file] = None
+    return written
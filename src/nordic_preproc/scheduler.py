@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import math
+import re
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Working-set multipliers used by estimate_run_memory, in bytes per voxel of
+# the 4D series. NORDIC holds the magnitude/phase pair as complex double plus
+# temporaries of the same size; the Python side holds the decoded magnitude,
+# the NORDIC output and float32 working copies of the splits.
+BACKEND_BYTES_PER_VOXEL = 48
+PYTHON_BYTES_PER_VOXEL = 16
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+@dataclass(frozen=True)
+class Job:
+    """One unit of work: ``fn(*args)`` needing about ``memory`` bytes."""
+
+    name: str
+    memory: int
+    fn: Callable[..., str]
+    args: tuple = ()
+
+
+@dataclass(frozen=True)
+class RunOutcome:
+    name: str
+    status: str  # "done", "skipped", ... as returned by the job, or "failed"
+    log: str = ""
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    @property
+    def failed(self) -> bool:
+        return self.status == "failed"
+
+
+def parse_memory(text: str) -> int:
+    """Parse a size such as ``"64G"``, ``"512M"`` or ``"1073741824"`` into bytes."""
+    m = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)i?B?\s*", str(text), flags=re.IGNORECASE)
+    if m is None:
+        raise ValueError(f"Invalid memory size: {text!r}")
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()])
+
+
+def estimate_run_memory(magnitude_file, phase_file=None, backend_memory: Optional[int] = None) -> int:
+    """Estimate the peak memory of one NORDIC run from NIfTI headers only.
+
+    The estimate is the raw size of the inputs (shape x dtype) plus the
+    backend and Python working sets (see ``BACKEND_BYTES_PER_VOXEL`` and
+    ``PYTHON_BYTES_PER_VOXEL``). No image data is decoded. ``backend_memory``
+    caps the backend's share, for backends that process a run in slabs.
+    """
+    import nibabel as nib
+
+    total = 0
+    n_voxels = 0
+    for path in (magnitude_file, phase_file):
+        if path is None or not Path(path).exists():
+            continue
+        hdr = nib.load(str(path)).header
+        n = math.prod(hdr.get_data_shape())
+        total += n * hdr.get_data_dtype().itemsize
+        n_voxels = max(n_voxels, n)
+    backend = n_voxels * BACKEND_BYTES_PER_VOXEL
+    if backend_memory is not None:
+        backend = min(backend, backend_memory)
+    return total + backend + n_voxels * PYTHON_BYTES_PER_VOXEL
+
+
+def capture_run(name: str, fn: Callable[..., str], *args: Any) -> RunOutcome:
+    """Call ``fn(*args)`` with stdout/stderr captured; never raises."""
+    buf = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+        try:
+            status = fn(*args)
+            error = None
+        except Exception as e:
+            status = "failed"
+            error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+    return RunOutcome(name=name, status=status, log=buf.getvalue(), error=error,
+                      seconds=time.perf_counter() - start)
+
+
+def run_jobs(
+    jobs: Sequence[Job],
+    n_jobs: int = 1,
+    max_memory: Optional[int] = None,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: tuple = (),
+    emit: Callable[[str], None] = print,
+) -> List[RunOutcome]:
+    """Run jobs in a process pool, starting a job only when it fits in memory.
+
+    A job is started when a worker is free and the sum of the estimated memory
+    of the running jobs plus its own stays under ``max_memory``. If nothing is
+    running, the next job is started even if it alone exceeds the budget, so
+    every job eventually runs. Each job's output is captured in its worker and
+    emitted in submission order; failures are recorded and do not stop the
+    remaining jobs.
+
+    Returns the outcomes in submission order.
+    """
+    if n_jobs < 1:
+        raise ValueError(f"n_jobs must be >= 1, got {n_jobs}")
+    budget = max_memory if max_memory is not None else float("inf")
+
+    outcomes: Dict[int, RunOutcome] = {}
+    next_to_emit = 0
+
+    def flush() -> None:
+        nonlocal next_to_emit
+        while next_to_emit in outcomes:
+            out = outcomes[next_to_emit]
+            emit(f"===== [{next_to_emit + 1}/{len(jobs)}] {out.name}: {out.status} ({out.seconds:.1f}s)")
+            if out.log:
+                emit(out.log.rstrip("\n"))
+            next_to_emit += 1
+
+    pending = list(range(len(jobs)))
+    running: Dict[Future, int] = {}
+    in_use = 0
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs) as pool:
+        while pending or running:
+            started = True
+            while started and pending and len(running) < n_jobs:
+                started = False
+                for pos, idx in enumerate(pending):
+                    job = jobs[idx]
+                    if not running or in_use + job.memory <= budget:
+                        if job.memory > budget:
+                            emit(f"Warning: {job.name} needs ~{job.memory / 1024**3:.1f} GB, "
+                                 f"more than --max-memory; running it alone")
+                        fut = pool.submit(capture_run, job.name, job.fn, *job.args)
+                        running[fut] = idx
+                        in_use += job.memory
+                        del pending[pos]
+                        started = True
+                        break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                idx = running.pop(fut)
+                in_use -= jobs[idx].memory
+                try:
+                    outcomes[idx] = fut.result()
+                except Exception as e:  # worker process died
+                    outcomes[idx] = RunOutcome(name=jobs[idx].name, status="failed",
+                                               error=f"{type(e).__name__}: {e}")
+            flush()
+    return [outcomes[i] for i in range(len(jobs))]
+
+
+def summarize(outcomes: Sequence[RunOutcome]) -> str:
+    """Return a short text summary of run outcomes, listing failures."""
+    counts: Dict[str, int] = {}
+    for out in outcomes:
+        counts[out.status] = counts.get(out.status, 0) + 1
+    lines = [
+        f"Summary: {len(outcomes)} run(s): "
+        + ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+    ]
+    for out in outcomes:
+        if out.failed:
+            lines.append(f"  FAILED {out.name}: {out.error}")
+    return "\n".join(lines)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import contextlib
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+
+from .backends import NordicArgs
+from .backends.numpy_nordic import kernel_size
+from .nifti_ops import NiftiStreamWriter, VolumeReader
+from .scheduler import BACKEND_BYTES_PER_VOXEL
+
+# Volumes read at a time when cutting inputs into slabs and stitching outputs
+SLAB_CHUNK_VOLUMES = 8
+
+
+def plan_slabs(n: int, size: int, overlap: int, align: int = 1) -> List[Tuple[int, int]]:
+    """Cover ``0..n`` with ``[start, stop)`` slabs of at most ``size`` overlapping by at least ``overlap``.
+
+    Every slab starts on a multiple of ``align``, as far along as the overlap
+    allows; the last slab ends at ``n``.
+    """
+    if size >= n:
+        return [(0, n)]
+    if (size - overlap) // align < 1:
+        raise ValueError(f"Slab size ({size}) must exceed the overlap ({overlap}) by at least {align}")
+    slabs = []
+    start = 0
+    while start + size < n:
+        slabs.append((start, start + size))
+        start = (start + size - overlap) // align * align
+    slabs.append((start, n))
+    return slabs
+
+
+def blend_weights(slabs: Sequence[Tuple[int, int]], n: int) -> List[np.ndarray]:
+    """Per-slab weights along the slab axis that sum to one at every position.
+
+    Each slab ramps linearly up across its overlap with the previous slab and
+    down across its overlap with the next, so the stitched image moves
+    smoothly from one slab's result to the next instead of showing a seam.
+    """
+    raw = []
+    for i, (start, stop) in enumerate(slabs):
+        pos = np.arange(start, stop, dtype=np.float64) + 0.5
+        w = np.ones(stop - start)
+        if i > 0 and slabs[i - 1][1] > start:
+            w = np.minimum(w, (pos - start) / (slabs[i - 1][1] - start))
+        if i + 1 < len(slabs) and slabs[i + 1][0] < stop:
+            w = np.minimum(w, (stop - pos) / (stop - slabs[i + 1][0]))
+        raw.append(w)
+    total = np.zeros(n)
+    for (start, stop), w in zip(slabs, raw):
+        total[start:stop] += w
+    return [(w / total[start:stop]).astype(np.float32) for (start, stop), w in zip(slabs, raw)]
+
+
+def default_overlap(shape: Sequence[int], axis: int = 2) -> int:
+    """One NORDIC patch width along ``axis``, so every patch fits in some slab."""
+    return int(kernel_size(shape)[axis])
+
+
+def patch_step(shape: Sequence[int], axis: int = 2) -> int:
+    """Spacing of NORDIC patches along ``axis``.
+
+    Slabs starting on a multiple of it see the same patch grid as the whole
+    image, so away from the overlaps a slab's result matches a single run.
+    """
+    return max(1, int(kernel_size(shape)[axis]) // 2)
+
+
+def slab_size_for_budget(shape: Sequence[int], itemsize: int, memory: int, axis: int = 2) -> int:
+    """Largest slab (in slices along ``axis``) whose NORDIC working set fits in ``memory`` bytes."""
+    per_slice = int(np.prod(shape)) // shape[axis]
+    return int(memory // (per_slice * (2 * itemsize + BACKEND_BYTES_PER_VOXEL)))
+
+
+def _crop_affine(affine: np.ndarray, axis: int, start: int) -> np.ndarray:
+    out = np.array(affine, dtype=np.float64)
+    out[:3, 3] += out[:3, axis] * start
+    return out
+
+
+def _index(axis: int, start: int, stop: int) -> tuple:
+    idx = [slice(None)] * 4
+    idx[axis] = slice(start, stop)
+    return tuple(idx)
+
+
+def cut_slabs(nifti_file, slabs: Sequence[Tuple[int, int]], out_paths: Sequence[Path], axis: int = 2) -> None:
+    """Write each slab of ``nifti_file`` to its own uncompressed file, in one pass.
+
+    The slabs keep the source's stored dtype and scaling; their affines are
+    shifted so each slab stays in place in world space.
+    """
+    img = nib.load(str(nifti_file))
+    with VolumeReader(nifti_file) as reader, contextlib.ExitStack() as stack:
+        writers = []
+        for (start, stop), path in zip(slabs, out_paths):
+            shape = list(reader.shape)
+            shape[axis] = stop - start
+            writers.append(stack.enter_context(NiftiStreamWriter(
+                path, shape, _crop_affine(img.affine, axis, start), header=img.header, dtype=reader.dtype,
+                scaling=(reader.slope, reader.inter))))
+        for t in range(0, reader.n_volumes, SLAB_CHUNK_VOLUMES):
+            chunk = reader.read(t, t + SLAB_CHUNK_VOLUMES)
+            for (start, stop), writer in zip(slabs, writers):
+                writer.write(chunk[_index(axis, start, stop)])
+
+
+def stitch_slabs(slab_files: Sequence[Path], slabs: Sequence[Tuple[int, int]], out_path: Path, shape,
+                 affine, header, axis: int = 2) -> None:
+    """Blend per-slab outputs back into one float32 4D image at ``out_path``."""
+    weights = blend_weights(slabs, shape[axis])
+    with contextlib.ExitStack() as stack:
+        readers = [stack.enter_context(VolumeReader(p)) for p in slab_files]
+        out = stack.enter_context(NiftiStreamWriter(out_path, shape, affine, header=header, dtype=np.float32))
+        for t in range(0, shape[3], SLAB_CHUNK_VOLUMES):
+            n = min(SLAB_CHUNK_VOLUMES, shape[3] - t)
+            acc = np.zeros(tuple(shape[:3]) + (n,), dtype=np.float32)
+            for reader, (start, stop), w in zip(readers, slabs, weights):
+                values = reader.read(t, t + n).astype(np.float32)
+                if reader.slope != 1.0 or reader.inter != 0.0:
+                    values = values * np.float32(reader.slope) + np.float32(reader.inter)
+                bshape = [1, 1, 1, 1]
+                bshape[axis] = stop - start
+                acc[_index(axis, start, stop)] += values * w.reshape(bshape)
+            out.write(acc)
+
+
+class SlabBackend:
+    """Run another backend on overlapping slabs of each run and stitch the result.
+
+    NORDIC denoises small local patches, so a run can be cut along ``axis``
+    (z by default) into slabs that each fit in memory. The magnitude and
+    phase are cut in one streaming pass, ``backend`` runs on every slab (up to
+    ``jobs`` at once, so ``backend.run`` must then be thread-safe), and the
+    slab outputs are blended back with :func:`blend_weights` into
+    ``<dirout>/<output_base>.nii``, as a single run would have written it.
+
+    The slab size is ``slab_size`` slices or, if that is not given, the
+    largest that lets ``jobs`` slabs fit in ``memory`` bytes together. Runs
+    that fit whole are passed to ``backend`` unchanged. The overlap defaults
+    to one NORDIC patch width. Slab files are kept in a temporary directory
+    under ``work_dir`` (default: the output directory) and removed afterwards.
+    """
+
+    def __init__(
+        self,
+        backend,
+        memory: Optional[int] = None,
+        slab_size: Optional[int] = None,
+        overlap: Optional[int] = None,
+        axis: int = 2,
+        jobs: int = 1,
+        work_dir: Optional[Path] = None,
+    ):
+        if memory is None and slab_size is None:
+            raise ValueError("SlabBackend needs a memory budget or a slab size")
+        if axis not in (0, 1, 2):
+            raise ValueError(f"Slab axis must be 0, 1 or 2, got {axis}")
+        self.backend = backend
+        self.memory = memory
+        self.slab_size = slab_size
+        self.overlap = overlap
+        self.axis = axis
+        self.jobs = max(1, int(jobs))
+        self.work_dir = Path(work_dir) if work_dir is not None else None
+
+    def plan(self, magnitude_nii) -> List[Tuple[int, int]]:
+        """The slabs a run would be cut into (one slab if it fits whole)."""
+        img = nib.load(str(magnitude_nii))
+        shape = tuple(int(n) for n in img.shape)
+        if len(shape) < 4:
+            return [(0, shape[self.axis])]
+        overlap = self.overlap if self.overlap is not None else default_overlap(shape, self.axis)
+        size = self.slab_size
+        if size is None:
+            size = slab_size_for_budget(shape, img.get_data_dtype().itemsize, self.memory // self.jobs,
+                                        self.axis)
+            if size < shape[self.axis] and size < overlap + patch_step(shape, self.axis):
+                raise ValueError(f"A memory budget of {self.memory / 1024**2:.0f} MB leaves slabs of {size} "
+                                 f"slice(s), not more than the {overlap}-slice overlap; raise the budget")
+        return plan_slabs(shape[self.axis], size, overlap, align=patch_step(shape, self.axis))
+
+    def run(self, magnitude_nii: str, phase_nii: str, output_base: str, args: NordicArgs) -> None:
+        slabs = self.plan(magnitude_nii)
+        if len(slabs) == 1:
+            self.backend.run(magnitude_nii, phase_nii, output_base, args)
+            return
+
+        print(f"Processing {output_base} in {len(slabs)} slabs along axis {self.axis}: {slabs}")
+        out_dir = Path(args.dirout)
+        work_root = self.work_dir or out_dir
+        work_root.mkdir(parents=True, exist_ok=True)
+        work = Path(tempfile.mkdtemp(prefix=f".{output_base}-slabs-", dir=work_root))
+        try:
+            mags = [work / f"mag_slab-{i}.nii" for i in range(len(slabs))]
+            phases = [work / f"phase_slab-{i}.nii" for i in range(len(slabs))]
+            cut_slabs(magnitude_nii, slabs, mags, self.axis)
+            cut_slabs(phase_nii, slabs, phases, self.axis)
+
+            slab_args = replace(args, dirout=str(work) + "/")
+
+            def run_slab(i: int) -> Path:
+                base = f"{output_base}_slab-{i}"
+                self.backend.run(str(mags[i]), str(phases[i]), base, slab_args)
+                mags[i].unlink()
+                phases[i].unlink()
+                for candidate in (work / f"{base}.nii", work / f"{base}.nii.gz"):
+                    if candidate.exists():
+                        return candidate
+                raise FileNotFoundError(f"No NORDIC output found for slab {i} of {output_base}")
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                outputs = list(pool.map(run_slab, range(len(slabs))))
+
+            img = nib.load(str(magnitude_nii))
+            stitch_slabs(outputs, slabs, out_dir / f"{output_base}.nii", img.shape, img.affine, img.header,
+                         self.axis)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    def close(self) -> None:
+        self.backend.close()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+import socket
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+# Scratch directories are named <PREFIX><host>-<pid>-<random> so that ones left
+# behind by a killed process can be recognised and removed later.
+SCRATCH_PREFIX = "nordic-"
+STAGE_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def stage_file(src: Path, dest_dir: Path) -> Path:
+    """Copy ``src`` into ``dest_dir`` uncompressed; returns the staged .nii path."""
+    src = Path(src)
+    name = src.name[:-3] if src.name.endswith(".gz") else src.name
+    dest = Path(dest_dir) / name
+    if src.name.endswith(".gz"):
+        with gzip.open(src, "rb") as f_in, open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, STAGE_BLOCK_SIZE)
+    else:
+        shutil.copyfile(src, dest)
+    return dest
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale(root: Path) -> List[Path]:
+    """Remove scratch directories under ``root`` left by dead processes on this host."""
+    root = Path(root)
+    prefix = f"{SCRATCH_PREFIX}{socket.gethostname()}-"
+    removed = []
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return removed
+    for entry in entries:
+        if not (entry.is_dir(follow_symlinks=False) and entry.name.startswith(prefix)):
+            continue
+        pid = entry.name[len(prefix):].split("-", 1)[0]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(Path(entry.path))
+    return removed
+
+
+class ScratchDir:
+    """A private directory for one run under ``--scratch-dir``.
+
+    Inputs are staged into it uncompressed (:meth:`stage`) and the backend
+    writes its full output there, so neither the backend nor the split that
+    follows touches compressed data or the shared filesystem; only the split
+    derivatives are written to ``derivatives/nordic``. :meth:`cleanup` removes
+    the directory; callers do so in a ``finally`` block, and directories left
+    by a killed process are removed by :func:`remove_stale` on the next start.
+    """
+
+    def __init__(self, root: Path, tag: str = ""):
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        prefix = f"{SCRATCH_PREFIX}{socket.gethostname()}-{os.getpid()}-"
+        self.path: Optional[Path] = Path(tempfile.mkdtemp(prefix=prefix, suffix=f"-{tag}" if tag else "",
+                                                          dir=root))
+
+    def stage(self, src: Path) -> Path:
+        return stage_file(src, self.path)
+
+    def cleanup(self) -> None:
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+    def __enter__(self) -> "ScratchDir":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
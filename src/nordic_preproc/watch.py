@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .bids_index import BidsIndex, BidsRun
+
+# Seconds between scans of the dataset
+DEFAULT_POLL_INTERVAL = 10.0
+# Seconds a run's files must go unchanged before the run counts as complete
+DEFAULT_SETTLE_TIME = 30.0
+# Seconds between saves of the directory listing while watching
+INDEX_SAVE_INTERVAL = 300.0
+
+Signature = Tuple[Tuple[int, int], ...]
+
+
+def _signature(run: BidsRun) -> Optional[Signature]:
+    """Size and mtime of the run's files; None if one of them disappeared."""
+    sig = []
+    for path in (run.magnitude, run.phase, run.sidecar):
+        if path is None:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        sig.append((st.st_size, st.st_mtime_ns))
+    return tuple(sig)
+
+
+class RunWatcher:
+    """Finds runs of a BIDS dataset that are new or changed and completely written.
+
+    Each :meth:`poll` refreshes a :class:`~nordic_preproc.bids_index.BidsIndex`
+    (one ``stat`` per directory; only directories whose mtime changed are
+    listed) and then ``stat``-s the files of runs that are not yet settled and
+    of runs in ``func`` directories the refresh listed; the first poll looks
+    at every run. A run is returned once it has a phase file, its magnitude, phase and
+    sidecar were unchanged for ``settle_time`` seconds (and between two
+    polls, if it was seen while still changing), and both images hold all
+    the data their headers announce
+    (:func:`~nordic_preproc.nifti_ops.nifti_complete`). It is returned again
+    only if its files are replaced later, e.g. when a run is exported anew;
+    a file rewritten in place does not change its directory and goes
+    unnoticed.
+    :attr:`changed_at` is the clock time at which a poll last saw a new or
+    changed run.
+    """
+
+    def __init__(
+        self,
+        bids_root: Path,
+        participant_labels: Optional[Sequence[str]] = None,
+        session_labels: Optional[Sequence[str]] = None,
+        cache_file: Optional[Path] = None,
+        settle_time: float = DEFAULT_SETTLE_TIME,
+        clock: Callable[[], float] = time.time,
+    ):
+        from .bids import _normalize_bids_labels
+
+        self.index = BidsIndex(bids_root, cache_file=cache_file)
+        self.participant_labels = _normalize_bids_labels(participant_labels, "sub-")
+        self.session_labels = _normalize_bids_labels(session_labels, "ses-")
+        self.settle_time = settle_time
+        self.clock = clock
+        self._pending: Dict[Path, Signature] = {}   # last signature seen of runs not yet returned
+        self._returned: Dict[Path, Signature] = {}  # signature each run was returned with
+        self._polled = False
+        self._saved_at = clock()
+        self.changed_at = clock()
+
+    def poll(self) -> List[BidsRun]:
+        """Runs that became complete since the last poll, in discovery order."""
+        from .nifti_ops import nifti_complete
+
+        self.index.refresh(self.participant_labels)
+        now = self.clock()
+        if now - self._saved_at >= INDEX_SAVE_INTERVAL:
+            self.index.save()
+            self._saved_at = now
+        ready = []
+        present = set()
+        changed_dirs, scan_all, self._polled = self.index.changed, not self._polled, True
+        for run in self.index.runs(self.participant_labels, self.session_labels):
+            present.add(run.magnitude)
+            if run.phase is None:
+                continue
+            if not (scan_all or run.magnitude in self._pending or run.magnitude.parent in changed_dirs):
+                continue
+            sig = _signature(run)
+            if sig is None or self._returned.get(run.magnitude) == sig:
+                continue
+            previous = self._pending.get(run.magnitude)
+            self._pending[run.magnitude] = sig
+            if previous != sig:
+                self.changed_at = now
+            # Files already older than the settle time need not be seen twice
+            changed = previous is not None and previous != sig
+            if changed or now - max(mtime for _, mtime in sig) / 1e9 < self.settle_time:
+                continue
+            if nifti_complete(run.magnitude) and nifti_complete(run.phase):
+                del self._pending[run.magnitude]
+                self._returned[run.magnitude] = sig
+                ready.append(run)
+        # Forget runs that were removed, so they are picked up if they come back
+        for gone in (set(self._pending) | set(self._returned)) - present:
+            self._pending.pop(gone, None)
+            self._returned.pop(gone, None)
+        return ready
+
+    def forget(self, run: BidsRun) -> None:
+        """Return ``run`` again from the next poll at which it is complete."""
+        sig = self._returned.pop(run.magnitude, None)
+        if sig is not None:
+            self._pending[run.magnitude] = sig
+
+    def close(self) -> None:
+        self.index.save()
+
+
+def watch(
+    watcher: RunWatcher,
+    handle: Callable[[List[BidsRun]], None],
+    interval: float = DEFAULT_POLL_INTERVAL,
+    idle_exit: float = 0.0,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Poll ``watcher`` every ``interval`` seconds and pass each batch of complete runs to ``handle``.
+
+    Returns when ``stop`` is set, or once no run was handled and no run's
+    files changed for ``idle_exit`` seconds (0 keeps watching). ``handle``
+    runs in the calling thread, so the next poll starts after it returns;
+    runs that arrive meanwhile are found then.
+    """
+    stop = stop if stop is not None else threading.Event()
+    handled_at = watcher.clock()
+    while not stop.is_set():
+        runs = watcher.poll()
+        if runs:
+            handle(runs)
+            handled_at = watcher.clock()
+        idle = watcher.clock() - max(handled_at, watcher.changed_at)
+        if idle_exit > 0 and idle >= idle_exit:
+            return
+        stop.wait(interval)
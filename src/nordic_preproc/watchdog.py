@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from .backends import NordicArgs
+
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_TIMEOUT_PER_VOLUME = 30.0
+DEFAULT_STALL_TIMEOUT = 1800.0
+DEFAULT_RETRIES = 1
+DEFAULT_RETRY_BACKOFF = 30.0
+
+# Seconds between progress checks while a backend call runs
+POLL_INTERVAL = 5.0
+# CPU seconds child processes must use between checks to count as working
+MIN_CPU_PROGRESS = 1.0
+# Seconds to wait for an aborted call to return before giving up on it
+ABORT_GRACE = 60.0
+
+
+class BackendTimeout(RuntimeError):
+    """A backend call exceeded its time limit or stopped making progress.
+
+    ``abandoned`` is set when the call could not be stopped and is still running.
+    """
+
+    def __init__(self, message: str, abandoned: bool = False):
+        super().__init__(message)
+        self.abandoned = abandoned
+
+
+def _descendants_cpu(root: int) -> float:
+    """CPU seconds of the live descendants of ``root`` (Linux /proc; 0 elsewhere)."""
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return 0.0
+    tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    parents, cpu = {}, {}
+    for name in entries:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                stat = f.read().decode(errors="replace")
+        except OSError:
+            continue
+        # The command name (field 2) may contain spaces; the rest follows the last ")"
+        fields = stat[stat.rfind(")") + 2:].split()
+        parents[int(name)] = int(fields[1])
+        cpu[int(name)] = (int(fields[11]) + int(fields[12])) / tick
+    total, frontier = 0.0, [root]
+    while frontier:
+        parent = frontier.pop()
+        for pid, ppid in parents.items():
+            if ppid == parent:
+                total += cpu[pid]
+                frontier.append(pid)
+    return total
+
+
+def child_process_cpu() -> float:
+    """CPU seconds used by the live child processes of this one, such as MATLAB or the MCR runner.
+
+    The CPU time of this process is left out: its other threads (prefetch,
+    writers, QC) keep working while a backend call hangs.
+    """
+    return _descendants_cpu(os.getpid())
+
+
+def _output_size(dirout: str, output_base: str) -> int:
+    """Total size of the files in ``dirout`` whose name contains ``output_base``."""
+    total = 0
+    try:
+        with os.scandir(dirout) as it:
+            for entry in it:
+                if output_base in entry.name:
+                    try:
+                        total += entry.stat().st_size
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+    return total
+
+
+class SupervisedBackend:
+    """Run another backend under a watchdog, with a time limit and bounded retries.
+
+    Each call of ``backend.run`` happens in a worker thread while this one
+    checks on it every ``poll`` seconds. The call is stopped when it runs
+    longer than ``timeout + timeout_per_volume * <volumes>`` seconds (from
+    the magnitude header), or when for ``stall_timeout`` seconds the call
+    made no progress. Progress is CPU time used by child processes (see
+    :func:`child_process_cpu`), growth of a file of the run in the output
+    directory, or, for an in-process backend, a change of
+    ``backend.progress(thread_id)``. A limit of 0 disables that check.
+
+    A stopped call is aborted through ``backend.abort(thread_id)`` if the
+    backend has one (the MCR and MATLAB engine backends kill their worker
+    process or engine); otherwise the call is left running in its thread.
+    Partial outputs are removed, and the run is retried up to ``retries``
+    times, waiting ``backoff * 2**attempt`` seconds before each retry. The
+    last error is raised when the retries are used up, so the caller records
+    the run as failed and moves on.
+
+    If the wrapped backend can denoise arrays (see
+    :class:`~nordic_preproc.backends.ArrayBackend`), so can this one, under
+    the same limits; output files do not count as progress there.
+    """
+
+    def __init__(
+        self,
+        backend,
+        timeout: float = DEFAULT_TIMEOUT,
+        timeout_per_volume: float = DEFAULT_TIMEOUT_PER_VOLUME,
+        stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_RETRY_BACKOFF,
+        poll: float = POLL_INTERVAL,
+    ):
+        self.backend = backend
+        self.timeout = timeout
+        self.timeout_per_volume = timeout_per_volume
+        self.stall_timeout = stall_timeout
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.poll = poll
+        if hasattr(backend, "denoise"):
+            self.denoise = self._denoise
+
+    def time_limit(self, magnitude_nii: str) -> Optional[float]:
+        """Wall-clock limit for one call on ``magnitude_nii``, or None if unlimited."""
+        if self.timeout <= 0 and self.timeout_per_volume <= 0:
+            return None
+        n_volumes = 1
+        if self.timeout_per_volume > 0:
+            import nibabel as nib
+
+            shape = nib.load(str(magnitude_nii)).shape
+            n_volumes = shape[3] if len(shape) > 3 else 1
+        return self._limit(n_volumes)
+
+    def _limit(self, n_volumes: int) -> Optional[float]:
+        if self.timeout <= 0 and self.timeout_per_volume <= 0:
+            return None
+        return max(0.0, self.timeout) + max(0.0, self.timeout_per_volume) * n_volumes
+
+    def run(self, magnitude_nii: str, phase_nii: str, output_base: str, args: NordicArgs) -> None:
+        self._supervise(lambda: self.backend.run(magnitude_nii, phase_nii, output_base, args), output_base,
+                        self.time_limit(magnitude_nii), args.dirout)
+
+    def _denoise(self, magnitude, phase, args: NordicArgs):
+        n_volumes = magnitude.shape[3] if magnitude.ndim > 3 else 1
+        return self._supervise(lambda: self.backend.denoise(magnitude, phase, args), "in-memory run",
+                               self._limit(n_volumes))
+
+    def _supervise(self, call, name: str, limit: Optional[float], dirout: Optional[str] = None):
+        for attempt in range(self.retries + 1):
+            try:
+                return self._attempt(call, name, limit, dirout)
+            except Exception as e:
+                # A call that is still running must not be raced by a retry
+                if attempt == self.retries or getattr(e, "abandoned", False):
+                    raise
+                if dirout is not None:
+                    self._remove_outputs(dirout, name)
+                delay = self.backoff * 2**attempt
+                print(f"NORDIC failed for {name} ({type(e).__name__}: {e}); "
+                      f"retry {attempt + 1}/{self.retries} in {delay:.0f}s")
+                time.sleep(delay)
+
+    def _attempt(self, call, name: str, limit: Optional[float], dirout: Optional[str]):
+        outcome = {}
+
+        def target() -> None:
+            try:
+                outcome["result"] = call()
+            except BaseException as e:
+                outcome["error"] = e
+
+        def output_size() -> int:
+            return _output_size(dirout, name) if dirout is not None else 0
+
+        backend_progress = getattr(self.backend, "progress", None)
+        worker = threading.Thread(target=target, name=f"nordic-{name}", daemon=True)
+        start = time.monotonic()
+        worker.start()
+
+        def counter():
+            return backend_progress(worker.ident) if backend_progress is not None else None
+
+        progress_at, cpu, size, count = start, child_process_cpu(), output_size(), counter()
+        while True:
+            worker.join(self.poll)
+            if not worker.is_alive():
+                break
+            now = time.monotonic()
+            new_cpu, new_size, new_count = child_process_cpu(), output_size(), counter()
+            if new_cpu - cpu >= MIN_CPU_PROGRESS or new_size != size or new_count != count:
+                progress_at, cpu, size, count = now, new_cpu, new_size, new_count
+            if limit is not None and now - start > limit:
+                self._stop(worker, f"NORDIC exceeded its {limit:.0f}s time limit for {name}")
+            if self.stall_timeout > 0 and now - progress_at > self.stall_timeout:
+                self._stop(worker, f"NORDIC made no progress for {self.stall_timeout:.0f}s on {name}")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def _stop(self, worker: threading.Thread, reason: str) -> None:
+        abort = getattr(self.backend, "abort", None)
+        if abort is None:
+            raise BackendTimeout(f"{reason}; the backend cannot be aborted and is left running", abandoned=True)
+        abort(worker.ident)
+        worker.join(ABORT_GRACE)
+        if worker.is_alive():
+            raise BackendTimeout(f"{reason}; the aborted call did not return within {ABORT_GRACE:.0f}s",
+                                 abandoned=True)
+        raise BackendTimeout(reason)
+
+    @staticmethod
+    def _remove_outputs(dirout: str, output_base: str) -> None:
+        for ext in (".nii", ".nii.gz"):
+            try:
+                (Path(dirout) / f"{output_base}{ext}").unlink()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.backend.close()
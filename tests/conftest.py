@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The synthetic datasets and the stand-in backend of the benchmarks double as test fixtures
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+
+@pytest.fixture(name="synthetic")
+def synthetic_module():
+    import synthetic
+
+    return synthetic
+
+
+@pytest.fixture(name="standin")
+def standin_module():
+    import standin
+
+    return standin
+
+
+@pytest.fixture(name="bench")
+def bench_module():
+    import bench
+
+    return bench
+
+
+def _synthetic_run(shape=(16, 16, 8, 40), n_noise=3, sigma=3.0, seed=0):
+    """Clean series plus noisy magnitude and phase; the last ``n_noise`` volumes hold noise only."""
+    rng = np.random.default_rng(seed)
+    t = shape[3]
+    x, y, z = np.meshgrid(*[np.linspace(-1, 1, n) for n in shape[:3]], indexing="ij")
+    base = 100 * np.exp(-(x**2 + y**2 + z**2)) + 20
+    timecourses = np.stack([np.sin(np.arange(t) / 5), np.cos(np.arange(t) / 9)])
+    maps = rng.normal(size=shape[:3] + (2,))
+    clean = base[..., None] * (1 + 0.05 * np.einsum("xyzk,kt->xyzt", maps, timecourses))
+    phase = (0.5 * x + 0.3 * y)[..., None]
+    noise = sigma * (rng.normal(size=shape) + 1j * rng.normal(size=shape)) / np.sqrt(2)
+    data = clean * np.exp(1j * phase) + noise
+    data[..., -n_noise:] = noise[..., -n_noise:]
+    return clean, np.abs(data), np.angle(data)
+
+
+@pytest.fixture
+def synthetic_run():
+    return _synthetic_run
@@ -0,0 +1,8 @@
+from pathlib import Path
+
+
+def test_tiny_benchmark_runs_end_to_end(tmp_path: Path, bench):
+    result = bench.run_benchmarks("tiny", tmp_path, repeat=1, selected=list(bench.BENCHMARKS))
+    assert set(result["results"]) == set(bench.BENCHMARKS)
+    assert all(r["wall_s"] >= 0 and r["peak_rss"] > 0 for r in result["results"].values())
+    assert not bench.compare(result, result, threshold=0.1)
@@ -0,0 +1,73 @@
+import os
+from pathlib import Path
+
+from nordic_preproc.bids import discover_runs, iter_bids_func_files
+from nordic_preproc.bids_index import BidsIndex, parse_entities
+
+
+def _touch(path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+
+
+def _make_dataset(root: Path) -> None:
+    for rel in [
+        "sub-01/ses-01/func/sub-01_ses-01_task-rest_bold.nii.gz",
+        "sub-01/ses-01/func/sub-01_ses-01_task-rest_part-phase_bold.nii.gz",
+        "sub-01/ses-01/func/sub-01_ses-01_task-rest_bold.json",
+        "sub-01/ses-02/func/sub-01_ses-02_task-rest_bold.nii.gz",
+        "sub-02/func/sub-02_task-rest_bold.nii.gz",
+        "sub-02/func/sub-02_task-rest_part-phase_bold.nii.gz",
+        "sub-02/anat/sub-02_T1w.nii.gz",
+    ]:
+        _touch(root / rel)
+
+
+def _age(root: Path) -> None:
+    # Directory mtimes from the last couple of seconds are not trusted by the index
+    for d, _, _ in os.walk(root):
+        os.utime(d, ns=(os.stat(d).st_atime_ns, os.stat(d).st_mtime_ns - 10**10))
+
+
+def test_index_pairs_files_and_filters(tmp_path: Path):
+    _make_dataset(tmp_path)
+    runs = discover_runs(tmp_path)
+    assert [r.magnitude.name for r in runs] == [
+        "sub-01_ses-01_task-rest_bold.nii.gz",
+        "sub-01_ses-02_task-rest_bold.nii.gz",
+        "sub-02_task-rest_bold.nii.gz",
+    ]
+    assert runs[0].phase.name == "sub-01_ses-01_task-rest_part-phase_bold.nii.gz"
+    assert runs[0].sidecar.name == "sub-01_ses-01_task-rest_bold.json"
+    assert runs[1].phase is None and runs[1].sidecar is None
+    assert runs[0].entities == {"sub": "01", "ses": "01", "task": "rest"}
+
+    assert [r.magnitude.name for r in discover_runs(tmp_path, ["02"])] == ["sub-02_task-rest_bold.nii.gz"]
+    assert [r.magnitude.name for r in discover_runs(tmp_path, session_labels=["ses-02"])] == [
+        "sub-01_ses-02_task-rest_bold.nii.gz"
+    ]
+    assert list(iter_bids_func_files(tmp_path, ["01"], ["01"])) == [runs[0].magnitude]
+
+
+def test_cached_index_lists_only_changed_directories(tmp_path: Path):
+    root = tmp_path / "ds"
+    _make_dataset(root)
+    _age(root)
+    cache_file = tmp_path / "index.json"
+
+    first = BidsIndex(root, cache_file=cache_file).refresh()
+    first.save()
+    assert first.listed > 0
+
+    again = BidsIndex(root, cache_file=cache_file).refresh()
+    assert again.listed == 0
+    assert list(again.runs()) == list(first.runs())
+
+    _touch(root / "sub-02" / "func" / "sub-02_task-motor_bold.nii.gz")
+    updated = BidsIndex(root, cache_file=cache_file).refresh()
+    assert updated.listed == 1
+    assert "sub-02_task-motor_bold.nii.gz" in [r.magnitude.name for r in updated.runs()]
+
+
+def test_parse_entities():
+    assert parse_entities("sub-01_task-rest_run-2_bold.nii.gz") == {"sub": "01", "task": "rest", "run": "2"}
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_cli_import_does_not_load_numpy():
+    src = Path(__file__).resolve().parents[1] / "src"
+    code = ("import sys; sys.path.insert(0, sys.argv[1]); "
+            "import nordic_preproc.cli.run, nordic_preproc.cli.bids_run; "
+            "print(sorted(m for m in ('numpy', 'nibabel') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code, str(src)], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_dry_run_plans_without_writing(tmp_path: Path, capsys, synthetic, standin):
+    from nordic_preproc.cli import bids_run
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    phase = next(ds.rglob("*_part-phase_bold.nii.gz"))
+    orphan = phase.with_name(phase.name.replace("run-1", "run-9").replace("_part-phase", ""))
+    orphan.write_bytes(phase.with_name(phase.name.replace("_part-phase", "")).read_bytes())
+
+    bids_run.main([str(ds), "--numpy", "--dry-run"])
+    out = capsys.readouterr().out
+    assert "Plan: 2 run(s): 1 process, 0 skip, 1 no-phase, 0 invalid" in out
+    assert not (ds / "derivatives").exists()
+
+    bids_run.main([str(ds), "--numpy", "--pipeline-depth", "0"], backend=standin.StandInBackend())
+    capsys.readouterr()
+    bids_run.main([str(ds), "--numpy", "--dry-run"])
+    assert "0 process, 1 skip, 1 no-phase, 0 invalid" in capsys.readouterr().out
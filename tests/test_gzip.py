@@ -0,0 +1,34 @@
+import gzip
+
+import numpy as np
+import nibabel as nib
+from pathlib import Path
+
+from nordic_preproc.nifti_ops import ParallelGzipWriter, gzip_nii, save_nifti
+
+
+def test_parallel_gzip_writer_roundtrip(tmp_path: Path):
+    payload = np.random.default_rng(0).bytes(10_000) * 3
+    p = tmp_path / "blob.gz"
+    with ParallelGzipWriter(p, compress_level=6, threads=3, block_size=4096) as f:
+        f.write(payload[:5000])
+        f.write(payload[5000:])
+        assert f.tell() == len(payload)
+    assert gzip.decompress(p.read_bytes()) == payload
+
+    empty = tmp_path / "empty.gz"
+    ParallelGzipWriter(empty).close()
+    assert gzip.decompress(empty.read_bytes()) == b""
+
+
+def test_save_nifti_and_gzip_nii(tmp_path: Path):
+    data = np.arange(4 * 5 * 6 * 7, dtype=np.float32).reshape(4, 5, 6, 7)
+    out = tmp_path / "out.nii.gz"
+    save_nifti(data, np.eye(4), out, compress_level=9, threads=2)
+    np.testing.assert_array_equal(nib.load(str(out)).get_fdata(), data)
+
+    nii = tmp_path / "plain.nii"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), str(nii))
+    gz = gzip_nii(nii, threads=2)
+    assert gz == tmp_path / "plain.nii.gz" and not nii.exists()
+    np.testing.assert_array_equal(nib.load(str(gz)).get_fdata(), data)
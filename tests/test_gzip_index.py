@@ -0,0 +1,91 @@
+import gzip
+import os
+import zlib
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from nordic_preproc.gzip_index import GzipIndex, IndexedGzipReader, index_file_for, load_index
+from nordic_preproc.nifti_ops import ParallelGzipWriter, VolumeReader
+from nordic_preproc.noise import find_noise_scans
+
+PAYLOAD = np.random.default_rng(0).normal(1000, 50, size=2_000_000).astype(np.int16).tobytes()
+
+
+def _sync_flushed(path: Path, data: bytes, level: int = 6, block: int = 16 * 1024) -> None:
+    """One gzip member with a sync flush after every block, as pigz writes."""
+    c = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    parts = []
+    for i in range(0, len(data), block):
+        parts += [c.compress(data[i:i + block]), c.flush(zlib.Z_SYNC_FLUSH)]
+    path.write_bytes(b"".join(parts) + c.flush())
+
+
+def _check_random_reads(path: Path, data: bytes, index: GzipIndex) -> None:
+    rng = np.random.default_rng(1)
+    with IndexedGzipReader(path, index) as reader:
+        for offset in rng.integers(0, len(data), 30):
+            n = int(rng.integers(1, 50_000))
+            reader.seek(int(offset))
+            assert reader.read(n) == data[offset:offset + n]
+
+
+def test_index_of_block_and_pigz_style_files(tmp_path: Path):
+    blocked = tmp_path / "blocked.gz"
+    with ParallelGzipWriter(blocked, block_size=32 * 1024) as f:
+        f.write(PAYLOAD)
+    pigz = tmp_path / "pigz.gz"
+    _sync_flushed(pigz, PAYLOAD)
+
+    for path in (blocked, pigz):
+        index = GzipIndex.for_file(path, spacing=64 * 1024)
+        with IndexedGzipReader(path, index) as reader:
+            assert reader.read() == PAYLOAD
+        assert len(index.points) > 3 and index.dirty
+        index.save(index_file_for(path))
+        loaded = load_index(path)
+        assert loaded.points == index.points and not loaded.dirty
+        _check_random_reads(path, PAYLOAD, loaded)
+
+
+def test_false_sync_markers_are_rejected(tmp_path: Path):
+    # Stored (level 0) blocks carry the data verbatim, including marker-like bytes
+    data = (b"\x00\x00\xff\xff" + bytes(range(60))) * 10_000
+    path = tmp_path / "stored.gz"
+    _sync_flushed(path, data, level=0)
+    index = GzipIndex.for_file(path, spacing=32 * 1024)
+    with IndexedGzipReader(path, index) as reader:
+        assert reader.read() == data
+    _check_random_reads(path, data, index)
+
+
+def test_stale_index_is_replaced(tmp_path: Path):
+    path = tmp_path / "a.gz"
+    path.write_bytes(gzip.compress(PAYLOAD))
+    index = GzipIndex.for_file(path)
+    index.save(index_file_for(path, cache_dir=tmp_path / "cache"))
+    path.write_bytes(gzip.compress(PAYLOAD[::-1]))
+    os.utime(path, ns=(0, 0))
+    fresh = load_index(path, cache_dir=tmp_path / "cache")
+    assert fresh.mtime_ns == 0 and fresh.dirty and len(fresh.points) == 1
+
+
+def test_volume_reads_through_index(tmp_path: Path):
+    data = np.random.default_rng(2).normal(100, 10, size=(8, 8, 4, 40)).astype(np.float32)
+    data[..., -3:] *= 0.01
+    nii = tmp_path / "run.nii"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), str(nii))
+    path = tmp_path / "run.nii.gz"
+    with ParallelGzipWriter(path, block_size=4096) as f:
+        f.write(nii.read_bytes())
+    index = GzipIndex.for_file(path, spacing=4 * 1024)
+
+    plain = find_noise_scans(str(path), mad_thresh=5)
+    indexed = find_noise_scans(str(path), mad_thresh=5, index=index)
+    np.testing.assert_allclose(indexed.variances, plain.variances, rtol=1e-5)
+    assert len(index.points) > 1
+
+    with VolumeReader(path, index=index) as reader:
+        np.testing.assert_array_equal(reader.read(37, 40), data[..., 37:])
+        np.testing.assert_array_equal(reader.read(3, 5), data[..., 3:5])
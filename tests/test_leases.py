@@ -0,0 +1,57 @@
+import os
+import time
+from pathlib import Path
+
+from nordic_preproc.leases import LeaseManager
+
+REL = Path("sub-01/func/sub-01_task-rest_bold.nii.gz")
+
+
+def _age(path: Path, seconds: float) -> None:
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+
+def test_lease_is_exclusive_until_released(tmp_path: Path):
+    a = LeaseManager(tmp_path, ttl=60, owner="a")
+    b = LeaseManager(tmp_path, ttl=60, owner="b")
+
+    lease = a.acquire(REL)
+    assert lease is not None
+    assert b.acquire(REL) is None
+    lease.release()
+    assert not a.lease_path(REL).exists()
+
+    lease_b = b.acquire(REL)
+    assert lease_b is not None
+    lease_b.release()
+
+
+def test_expired_lease_is_taken_over(tmp_path: Path):
+    a = LeaseManager(tmp_path, ttl=60, owner="a")
+    b = LeaseManager(tmp_path, ttl=60, owner="b")
+
+    stale = a.acquire(REL)
+    _age(a.lease_path(REL), 120)  # worker "a" stopped heartbeating
+    taken = b.acquire(REL)
+    assert taken is not None
+
+    # The stalled worker must not delete the new owner's lease
+    stale.release()
+    assert b.lease_path(REL).exists()
+    assert a.acquire(REL) is None
+    taken.release()
+
+
+def test_heartbeat_keeps_lease_alive_and_detects_loss(tmp_path: Path):
+    a = LeaseManager(tmp_path, ttl=0.2, owner="a")
+    lease = a.acquire(REL)
+    _age(a.lease_path(REL), 10)
+    time.sleep(0.15)  # at least one heartbeat (every ttl / 4)
+    assert time.time() - os.stat(a.lease_path(REL)).st_mtime < 0.2
+
+    a.lease_path(REL).write_text('{"owner": "someone-else"}')
+    time.sleep(0.15)
+    assert lease.lost
+    lease.release()
+    assert a.lease_path(REL).exists()
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from nordic_preproc.manifest import Manifest, file_fingerprint, file_sha256, run_key
+
+
+def _inputs(tmp_path: Path, content: bytes = b"magnitude"):
+    mag = tmp_path / "sub-01_bold.nii.gz"
+    mag.write_bytes(content)
+    return {"magnitude": file_fingerprint(mag, sample_bytes=4), "phase": None}
+
+
+def test_run_key_tracks_content_and_params(tmp_path: Path):
+    params = {"mad_thresh": 50, "temporal_phase": 1}
+    key = run_key(_inputs(tmp_path), params)
+    assert run_key(_inputs(tmp_path), dict(params)) == key
+    assert run_key(_inputs(tmp_path), {**params, "mad_thresh": 10}) != key
+    # Same size, different tail (e.g. the gzip trailer of a changed image)
+    assert run_key(_inputs(tmp_path, b"magnitudX"), params) != key
+
+
+def test_manifest_is_current_until_outputs_change(tmp_path: Path):
+    deriv = tmp_path / "derivatives" / "nordic"
+    out = deriv / "sub-01" / "func" / "sub-01_desc-functional-nordic_bold.nii.gz"
+    out.parent.mkdir(parents=True)
+    out.write_bytes(b"denoised")
+    rel = Path("sub-01/func/sub-01_bold.nii.gz")
+    inputs = _inputs(tmp_path)
+    key = run_key(inputs, {})
+
+    manifest = Manifest(deriv)
+    assert manifest.load(rel) is None
+    manifest.record(rel, key, inputs, {}, [17, 18], {out: None})
+
+    entry = manifest.load(rel)
+    assert entry["noise_indices"] == [17, 18]
+    assert entry["outputs"]["sub-01/func/sub-01_desc-functional-nordic_bold.nii.gz"]["sha256"] == file_sha256(out)
+    assert manifest.is_current(entry, key, verify=True)
+    assert not manifest.is_current(entry, "other-key")
+
+    out.write_bytes(b"denoisex")  # same size: only caught by verify
+    assert manifest.is_current(entry, key)
+    assert not manifest.is_current(entry, key, verify=True)
+    out.unlink()
+    assert not manifest.is_current(entry, key)
@@ -0,0 +1,165 @@
+import sys
+import types
+
+import pytest
+
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.backends.matlab_engine import MatlabEngineBackend
+
+
+class FakeEngineError(Exception):
+    pass
+
+
+class FakeMatlabExecutionError(Exception):
+    pass
+
+
+class FakeEngine:
+    def __init__(self, log):
+        self.log = log
+        self.paths = []
+        self.crashed = False
+        self.quit_called = False
+
+    def addpath(self, path, nargout=0):
+        self.paths.append(path)
+
+    def eval(self, expr, nargout=0):
+        if self.crashed:
+            raise FakeEngineError("engine is dead")
+
+    def struct(self, d):
+        return dict(d)
+
+    def NIFTI_NORDIC(self, mag, phase, base, arg, nargout=0, background=False):
+        if background:
+            return FakeCall(lambda: self.NIFTI_NORDIC(mag, phase, base, arg, nargout=nargout))
+        if self.crashed:
+            raise FakeEngineError("engine is dead")
+        if base == "bad":
+            raise FakeMatlabExecutionError("NORDIC failed")
+        self.log.append((id(self), mag, phase, base))
+
+    def feval(self, name, *args, nargout=1, background=False):
+        if background:
+            return FakeCall(lambda: self.feval(name, *args, nargout=nargout))
+        mag, phase, arg = args
+        self.log.append((id(self), name, arg["noise_volume_last"]))
+        return FakeSingle([[[[2 * v for v in row] for row in plane] for plane in vol] for vol in mag.data])
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeSingle:
+    """Stand-in for ``matlab.single``: keeps nested lists, as MATLAB's own type does."""
+
+    def __init__(self, data):
+        self.data = data.tolist() if hasattr(data, "tolist") else data
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+
+        return np.asarray(self.data, dtype=dtype)
+
+
+class FakeFuture:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def result(self):
+        return self.engine
+
+    def done(self):
+        return True
+
+    def cancel(self):
+        return False
+
+
+class FakeCall:
+    """A background engine call; it runs when its result is asked for."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def result(self):
+        return self.fn()
+
+    def cancel(self):
+        return False
+
+
+@pytest.fixture
+def fake_matlab(monkeypatch):
+    log = []
+    started = []
+
+    def start_matlab(background=False):
+        eng = FakeEngine(log)
+        started.append(eng)
+        return FakeFuture(eng) if background else eng
+
+    engine_mod = types.ModuleType("matlab.engine")
+    engine_mod.start_matlab = start_matlab
+    engine_mod.EngineError = FakeEngineError
+    engine_mod.MatlabExecutionError = FakeMatlabExecutionError
+    matlab_mod = types.ModuleType("matlab")
+    matlab_mod.engine = engine_mod
+    matlab_mod.single = FakeSingle
+    monkeypatch.setitem(sys.modules, "matlab", matlab_mod)
+    monkeypatch.setitem(sys.modules, "matlab.engine", engine_mod)
+    return types.SimpleNamespace(log=log, started=started)
+
+
+def test_engine_is_reused_across_runs(fake_matlab):
+    backend = MatlabEngineBackend(nordic_path="/nordic", prestart=True)
+    assert len(fake_matlab.started) == 1
+    for i in range(3):
+        backend.run(f"m{i}.nii.gz", f"p{i}.nii.gz", f"out{i}", NordicArgs())
+    assert len(fake_matlab.started) == 1
+    assert fake_matlab.started[0].paths == ["/nordic"]
+    assert [entry[3] for entry in fake_matlab.log] == ["out0", "out1", "out2"]
+    backend.close()
+    assert fake_matlab.started[0].quit_called
+
+
+def test_matlab_error_keeps_engine(fake_matlab):
+    with MatlabEngineBackend(nordic_path="/nordic") as backend:
+        with pytest.raises(FakeMatlabExecutionError):
+            backend.run("m.nii.gz", "p.nii.gz", "bad", NordicArgs())
+        backend.run("m.nii.gz", "p.nii.gz", "good", NordicArgs())
+    assert len(fake_matlab.started) == 1
+
+
+def test_crashed_engine_is_replaced(fake_matlab):
+    with MatlabEngineBackend(nordic_path="/nordic") as backend:
+        backend.run("m.nii.gz", "p.nii.gz", "first", NordicArgs())
+        fake_matlab.started[0].crashed = True
+        backend.run("m.nii.gz", "p.nii.gz", "second", NordicArgs())
+    first, second = fake_matlab.started
+    assert first.quit_called and second.quit_called
+    assert second.paths == ["/nordic"]
+    assert fake_matlab.log[-1][0] == id(second)
+
+
+def test_denoise_hands_arrays_to_array_function(fake_matlab, tmp_path, monkeypatch):
+    import numpy as np
+
+    monkeypatch.chdir(tmp_path)
+    magnitude = np.arange(2 * 3 * 2 * 4, dtype=np.int16).reshape(2, 3, 2, 4)
+    with MatlabEngineBackend(nordic_path="/nordic", array_function="nordic_arrays") as backend:
+        out = backend.denoise(magnitude, np.zeros_like(magnitude), NordicArgs(noise_volume_last=1))
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out, 2 * magnitude)
+    assert fake_matlab.log[0][1:] == ("nordic_arrays", 1)
+    assert not list(tmp_path.iterdir())
+
+
+def test_denoise_needs_array_function(fake_matlab):
+    import numpy as np
+
+    with MatlabEngineBackend(nordic_path="/nordic") as backend:
+        with pytest.raises(RuntimeError, match="array_function"):
+            backend.denoise(np.zeros((2, 2, 2, 2)), None, NordicArgs())
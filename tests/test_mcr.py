@@ -0,0 +1,105 @@
+import os
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.backends.mcr import BATCH_SCRIPT, PIPELINE_SCRIPT, MCRBackend, claim_cache_root
+
+pytest.importorskip("fcntl")
+
+# Stand-ins for the compiled runners: both write <DIROUT>/<base>.nii and a
+# line to stdout, and record their MCR_CACHE_ROOT and PID.
+PIPELINE = """#!{python}
+import os, sys
+mcr, mag, ph, base, tp, width, dirout, noise = sys.argv[1:]
+if base == "boom":
+    print("simulated MATLAB error"); sys.exit(3)
+open(os.path.join(dirout, base + ".nii"), "w").write(os.environ["MCR_CACHE_ROOT"] + " " + str(os.getpid()))
+print("processed", base)
+"""
+
+BATCH = """#!{python}
+import os, sys
+for line in sys.stdin:
+    line = line.rstrip("\\n")
+    if not line or line == "quit":
+        break
+    done, mag, ph, base, tp, width, dirout, noise = line.split("\\t")
+    status = "ok"
+    if base == "boom":
+        status = "error: simulated MATLAB error"
+    elif base == "crash":
+        sys.exit(1)
+    else:
+        open(os.path.join(dirout, base + ".nii"), "w").write(os.environ["MCR_CACHE_ROOT"] + " " + str(os.getpid()))
+    print("processed", base, flush=True)
+    open(done + ".tmp", "w").write(status + "\\n")
+    os.replace(done + ".tmp", done)
+"""
+
+
+def _runner(dirpath: Path, name: str, source: str) -> None:
+    path = dirpath / name
+    path.write_text(source.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+
+@pytest.fixture
+def compiled(tmp_path: Path) -> Path:
+    d = tmp_path / "nordic_mcr"
+    d.mkdir()
+    _runner(d, PIPELINE_SCRIPT, PIPELINE)
+    return d
+
+
+def _args(out: Path) -> NordicArgs:
+    return NordicArgs(temporal_phase=1, phase_filter_width=10.0, noise_volume_last=0, dirout=str(out) + "/")
+
+
+def test_cache_roots_are_per_worker_and_reused(tmp_path: Path):
+    first, fd1 = claim_cache_root(tmp_path)
+    second, fd2 = claim_cache_root(tmp_path)
+    assert first != second
+    os.close(fd1)
+    again, fd3 = claim_cache_root(tmp_path)
+    assert again == first
+    os.close(fd2)
+    os.close(fd3)
+
+
+def test_per_run_mode_logs_to_file(compiled: Path, tmp_path: Path):
+    backend = MCRBackend("/opt/mcr", str(compiled), log_dir=tmp_path / "logs", cache_base=tmp_path / "cache")
+    assert not backend.batch
+    try:
+        backend.run("mag.nii", "ph.nii", "a", _args(tmp_path))
+        assert "processed a" in backend.log_path.read_text()
+        with pytest.raises(RuntimeError, match="simulated MATLAB error"):
+            backend.run("mag.nii", "ph.nii", "boom", _args(tmp_path))
+    finally:
+        backend.close()
+
+
+def test_batch_mode_reuses_one_process(compiled: Path, tmp_path: Path):
+    _runner(compiled, BATCH_SCRIPT, BATCH)
+    backend = MCRBackend("/opt/mcr", str(compiled), log_dir=tmp_path / "logs", cache_base=tmp_path / "cache")
+    assert backend.batch
+    try:
+        backend.run("mag.nii", "ph.nii", "a", _args(tmp_path))
+        backend.run("mag.nii", "ph.nii", "b", _args(tmp_path))
+        (root_a, pid_a), (root_b, pid_b) = ((tmp_path / f"{b}.nii").read_text().split() for b in "ab")
+        assert pid_a == pid_b
+        assert root_a == root_b and Path(root_a).parent == tmp_path / "cache"
+
+        with pytest.raises(RuntimeError, match="simulated MATLAB error"):
+            backend.run("mag.nii", "ph.nii", "boom", _args(tmp_path))
+        with pytest.raises(RuntimeError, match="exited with code 1"):
+            backend.run("mag.nii", "ph.nii", "crash", _args(tmp_path))
+        # A dead process is restarted for the next run
+        backend.run("mag.nii", "ph.nii", "c", _args(tmp_path))
+        assert (tmp_path / "c.nii").read_text().split()[1] != pid_a
+        assert "processed b" in backend.log_path.read_text()
+    finally:
+        backend.close()
@@ -17,3 +17,17 @@ def test_find_noise_scans_detects_low_variance(tmp_path: Path):
     res = find_noise_scans(str(p), mad_thresh=10)
     assert len(res.noise_indices) >= 1
     assert res.noise_indices[0] >= 7
+
+
+def test_streaming_variances_match_full_load(tmp_path: Path):
+    rng = np.random.default_rng(1)
+    data = rng.normal(loc=100.0, scale=5.0, size=(6, 5, 4, 13)).astype(np.float32)
+    data[..., 10:] = rng.normal(scale=0.1, size=(6, 5, 4, 3))
+    p = tmp_path / "test.nii.gz"
+    nib.save(nib.Nifti1Image(data, affine=np.eye(4)), str(p))
+
+    full = find_noise_scans(str(p), mad_thresh=3, batch_size=None)
+    streamed = find_noise_scans(str(p), mad_thresh=3, batch_size=4)
+    np.testing.assert_allclose(streamed.variances, full.variances, rtol=1e-4)
+    np.testing.assert_array_equal(streamed.noise_indices, full.noise_indices)
+    assert list(streamed.noise_indices) == [10, 11, 12]
@@ -0,0 +1,106 @@
+import numpy as np
+import nibabel as nib
+from pathlib import Path
+
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.backends.numpy_nordic import NumpyBackend, scale_phase
+
+
+def test_scale_phase_maps_range_to_radians():
+    phase = np.array([-4096, 0, 4094], dtype=np.int16)
+    scaled = scale_phase(phase)
+    np.testing.assert_allclose([scaled.min(), scaled.max()], [-np.pi, np.pi], atol=1e-5)
+
+
+def test_numpy_backend_reduces_noise(tmp_path: Path, synthetic_run):
+    clean, mag, phase = synthetic_run()
+    mag_p, ph_p = tmp_path / "mag.nii.gz", tmp_path / "phase.nii.gz"
+    nib.save(nib.Nifti1Image(mag.astype(np.float32), np.eye(4)), str(mag_p))
+    nib.save(nib.Nifti1Image(phase.astype(np.float32), np.eye(4)), str(ph_p))
+
+    args = NordicArgs(noise_volume_last=3, dirout=str(tmp_path) + "/")
+    NumpyBackend(n_threads=2).run(str(mag_p), str(ph_p), "out", args)
+
+    out = nib.load(str(tmp_path / "out.nii"))
+    assert out.shape == mag.shape
+    assert out.get_data_dtype() == np.float32
+    func = slice(0, mag.shape[3] - 3)
+    err_in = np.sqrt(np.mean((mag[..., func] - clean[..., func]) ** 2))
+    err_out = np.sqrt(np.mean((out.get_fdata()[..., func] - clean[..., func]) ** 2))
+    assert err_out < 0.5 * err_in
+
+    in_memory = NumpyBackend(n_threads=2).denoise(mag.astype(np.float32), phase.astype(np.float32), args)
+    np.testing.assert_allclose(in_memory, out.get_fdata(), rtol=1e-5, atol=1e-3)
+
+
+def test_in_memory_run_matches_file_run(tmp_path: Path, synthetic):
+    from nordic_preproc.cli import bids_run
+
+    outputs = {}
+    for mode, extra in (("file", []), ("memory", ["--in-memory"])):
+        ds = synthetic.make_dataset(tmp_path / mode, "tiny")
+        bids_run.main([str(ds), "--numpy", "--threads", "1", *extra])
+        deriv = ds / "derivatives" / "nordic"
+        outputs[mode] = {p.relative_to(deriv): nib.load(str(p)).get_fdata()
+                         for p in deriv.rglob("*nordic_bold.nii*")}
+        # Nothing but the split outputs is left behind
+        assert not [p for p in deriv.rglob("*.nii") if not p.name.endswith("_bold.nii")]
+    assert outputs["file"] and outputs["file"].keys() == outputs["memory"].keys()
+    for name, data in outputs["file"].items():
+        np.testing.assert_allclose(outputs["memory"][name], data, rtol=1e-4, atol=1e-2)
+
+
+def test_numpy_backend_abort_stops_the_call(synthetic_run):
+    import threading
+    import time
+
+    import pytest
+
+    from nordic_preproc.backends.numpy_nordic import NordicCancelled
+
+    _, mag, phase = synthetic_run(shape=(24, 24, 12, 40))
+    backend = NumpyBackend(n_threads=1, batch_size=1)
+    outcome = {}
+
+    def call():
+        try:
+            backend.denoise(mag.astype(np.float32), phase.astype(np.float32), NordicArgs(noise_volume_last=3))
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=call)
+    worker.start()
+    while not backend._cancel and worker.is_alive():
+        time.sleep(0.001)
+    backend.abort(worker.ident)
+    worker.join(30)
+    assert not worker.is_alive()
+    with pytest.raises(NordicCancelled):
+        raise outcome["error"]
+
+
+def test_patch_batches_in_flight_are_bounded(monkeypatch, synthetic_run):
+    import threading
+
+    from nordic_preproc.backends import numpy_nordic
+
+    lock = threading.Lock()
+    counts = {"denoised": 0, "added": 0, "ahead": 0}
+    denoise_batch = numpy_nordic._denoise_batch
+
+    def counting(*args):
+        with lock:
+            counts["denoised"] += 1
+            counts["ahead"] = max(counts["ahead"], counts["denoised"] - counts["added"])
+        return denoise_batch(*args)
+
+    def added():
+        with lock:
+            counts["added"] += 1
+
+    monkeypatch.setattr(numpy_nordic, "_denoise_batch", counting)
+    _, mag, phase = synthetic_run(shape=(24, 24, 12, 40))
+    numpy_nordic.nordic_denoise(mag.astype(np.float32), phase.astype(np.float32), NordicArgs(noise_volume_last=3),
+                                n_threads=2, batch_size=1, on_batch=added)
+    assert counts["added"] == counts["denoised"] > 4 * numpy_nordic.BATCHES_PER_THREAD * 2
+    assert counts["ahead"] <= numpy_nordic.BATCHES_PER_THREAD * 2
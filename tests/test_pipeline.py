@@ -0,0 +1,49 @@
+import threading
+
+from nordic_preproc.pipeline import run_pipeline
+
+
+def test_pipeline_overlaps_stages_and_keeps_order():
+    n = 5
+    prepared = [threading.Event() for _ in range(n + 1)]
+    next_ready_during_compute = []
+
+    def prepare(i):
+        prepared[i].set()
+        return "skipped" if i == 2 else i
+
+    def compute(i):
+        # Run i+1 is prepared while run i is in the backend; a strictly serial
+        # loop would only prepare it afterwards and this wait would time out.
+        if i + 1 < n:
+            next_ready_during_compute.append(prepared[i + 1].wait(timeout=5))
+        if i == 3:
+            raise RuntimeError("backend crashed")
+        return i * 10
+
+    finished = []
+
+    def finish(value):
+        finished.append(value)
+        return "done"
+
+    discarded = []
+    outcomes = run_pipeline(list(range(n)), prepare, compute, finish, name=lambda i: f"run-{i}",
+                            discard=discarded.append)
+
+    assert [o.name for o in outcomes] == [f"run-{i}" for i in range(n)]
+    assert [o.status for o in outcomes] == ["done", "done", "skipped", "failed", "done"]
+    assert "backend crashed" in outcomes[3].error
+    assert discarded == [3]
+    assert all(next_ready_during_compute)
+    assert sorted(finished) == [0, 10, 40]
+
+
+def test_pipeline_records_prepare_failures():
+    def prepare(i):
+        if i == 0:
+            raise ValueError("bad header")
+        return i
+
+    outcomes = run_pipeline([0, 1], prepare, lambda p: p, lambda p: "done")
+    assert [o.status for o in outcomes] == ["failed", "done"]
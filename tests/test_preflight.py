@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from nordic_preproc.bids_index import BidsRun
+from nordic_preproc.preflight import check_headers, format_report, preflight_runs
+
+
+def _save(path: Path, shape, affine=None, dtype=np.int16) -> Path:
+    nib.save(nib.Nifti1Image(np.zeros(shape, dtype=dtype), np.eye(4) if affine is None else affine), str(path))
+    return path
+
+
+def test_check_headers_reports_mismatches(tmp_path: Path):
+    mag = _save(tmp_path / "mag.nii.gz", (4, 4, 3, 6))
+    assert check_headers(mag, _save(tmp_path / "ok.nii.gz", (4, 4, 3, 6)), tmp_path / "x.json") == ([], [])
+
+    errors, _ = check_headers(mag, _save(tmp_path / "vols.nii.gz", (4, 4, 3, 5)), tmp_path / "x.json")
+    assert errors == ["volume count differs: magnitude 6, phase 5"]
+
+    shifted = np.eye(4)
+    shifted[:3, 3] = 2.0
+    errors, _ = check_headers(mag, _save(tmp_path / "aff.nii.gz", (4, 4, 3, 6), shifted), tmp_path / "x.json")
+    assert errors == ["affine differs between magnitude and phase"]
+
+    errors, warnings = check_headers(mag, _save(tmp_path / "3d.nii.gz", (4, 4, 3)))
+    assert errors and "expected a 4D series" in errors[0]
+    assert warnings and "sidecar" in warnings[0]
+
+    errors, _ = check_headers(mag, tmp_path / "missing.nii.gz", tmp_path / "x.json")
+    assert errors[0].startswith("cannot read phase header")
+
+
+def test_preflight_runs_keeps_order(tmp_path: Path):
+    mag = _save(tmp_path / "a_bold.nii.gz", (4, 4, 3, 6))
+    bad = _save(tmp_path / "b_part-phase_bold.nii.gz", (4, 5, 3, 6))
+    runs = [BidsRun(mag, bad, None), BidsRun(mag, mag, tmp_path / "x.json"), BidsRun(mag, None, None)]
+    results = preflight_runs(runs, tmp_path, threads=2)
+    assert [r.ok for r in results] == [False, True, True]
+    assert "matrix size differs" in results[0].errors[0]
+    assert results[2].warnings == ["no phase file"]
+    assert format_report(results).endswith("3 run(s) checked, 1 failed, 1 with warnings")
+
+
+def test_bids_run_excludes_failed_runs_before_backend(tmp_path: Path, synthetic, standin):
+    from nordic_preproc.cli import bids_run
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    phase = next(ds.rglob("*_part-phase_bold.nii.gz"))
+    img = nib.load(str(phase))
+    nib.save(nib.Nifti1Image(np.asarray(img.dataobj)[..., :-1], img.affine, img.header), str(phase))
+    calls = []
+
+    class Backend(standin.StandInBackend):
+        def run(self, *args):
+            calls.append(args)
+            super().run(*args)
+
+    with pytest.raises(SystemExit):
+        bids_run.main([str(ds), "--numpy"], backend=Backend())
+    assert calls == []
+    with pytest.raises(SystemExit):
+        bids_run.main([str(ds), "--numpy", "--preflight", "abort"], backend=Backend())
+    assert calls == []
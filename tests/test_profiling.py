@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from nordic_preproc.profiling import NULL_PROFILER, Profiler, load_trace, summarize_records
+
+
+def test_profiler_records_stages_to_trace(tmp_path: Path):
+    trace = tmp_path / "trace.jsonl"
+    prof = Profiler(trace_file=trace)
+    with prof.stage("detect", run="sub-01"):
+        sum(range(10000))
+    with prof.stage("split", run="sub-01"):
+        (tmp_path / "out.bin").write_bytes(b"x" * 4096)
+
+    records = load_trace(trace)
+    assert [(r.run, r.stage) for r in records] == [("sub-01", "detect"), ("sub-01", "split")]
+    assert records == prof.records
+    assert all(r.wall_s >= 0 and r.cpu_s >= 0 and r.peak_rss > 0 for r in records)
+    if records[1].write_bytes is not None:
+        assert records[1].write_bytes >= 4096
+
+    table = summarize_records(records)
+    assert "detect" in table and "split" in table
+
+
+def test_null_profiler_records_nothing():
+    with NULL_PROFILER.stage("detect"):
+        pass
+    assert NULL_PROFILER.records == []
@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from nordic_preproc.nifti_ops import stream_split_nifti
+from nordic_preproc.qc import SeriesStats, SplitStats
+
+
+def test_streaming_stats_match_numpy():
+    data = np.random.default_rng(0).normal(1e4, 3, size=(5, 4, 3, 50)).astype(np.float32)
+    stats = SeriesStats()
+    for lo, hi in [(0, 1), (1, 8), (8, 9), (9, 30), (30, 50)]:
+        stats.update(data[..., lo:hi])
+    assert stats.n == 50
+    np.testing.assert_allclose(stats.mean, data.mean(axis=3, dtype=np.float64), rtol=1e-10)
+    np.testing.assert_allclose(stats.std, data.std(axis=3, ddof=1, dtype=np.float64), rtol=1e-6)
+    np.testing.assert_allclose(stats.tsnr, stats.mean / stats.std)
+
+
+@pytest.mark.parametrize("dtype", [None, "float32", "int16"])
+def test_split_gathers_stats_of_real_world_values(tmp_path: Path, dtype):
+    rng = np.random.default_rng(1)
+    stored = rng.integers(100, 2000, size=(6, 5, 4, 20)).astype(np.int16)
+    img = nib.Nifti1Image(stored, np.eye(4))
+    img.header.set_slope_inter(0.5, 10.0)
+    src = tmp_path / "run.nii.gz"
+    nib.save(img, str(src))
+    real = stored * 0.5 + 10.0
+
+    stats = SplitStats()
+    stream_split_nifti(src, np.array([17, 18, 19]), tmp_path / "func.nii.gz", tmp_path / "noise.nii.gz",
+                       dtype=dtype, chunk_volumes=4, stats=stats)
+    assert (stats.functional.n, stats.noise.n) == (17, 3)
+    np.testing.assert_allclose(stats.functional.mean, real[..., :17].mean(axis=3), rtol=1e-6)
+    np.testing.assert_allclose(stats.noise.std, real[..., 17:].std(axis=3, ddof=1), rtol=1e-5)
+
+
+def test_bids_qc_outputs(tmp_path: Path, synthetic, standin):
+    from nordic_preproc.cli import bids_run
+    from nordic_preproc.manifest import WORK_DIR
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    bids_run.main([str(ds), "--numpy", "--pipeline-depth", "0", "--qc"], backend=standin.StandInBackend())
+    func = ds / "derivatives" / "nordic" / "sub-01" / "ses-01" / "func"
+    base = "sub-01_ses-01_task-rest_run-1"
+
+    summary = json.loads((func / f"{base}_desc-nordic_qc.json").read_text())
+    assert summary["functional_raw"]["volumes"] == 27 and summary["mask_voxels"] > 0
+    # The stand-in smooths over time, which raises tSNR
+    assert summary["tsnr_gain"] > 1
+    noise = nib.load(str(func / f"{base}_desc-noise_bold.nii.gz")).get_fdata()
+    assert summary["noise_sigma_raw"] == pytest.approx(np.sqrt(noise.var(axis=3, ddof=1).mean()))
+
+    for series, desc in (("raw", "functional"), ("nordic", "functional-nordic")):
+        split = nib.load(str(func / f"{base}_desc-{desc}_bold.nii.gz")).get_fdata()
+        tsnr = nib.load(str(func / f"{base}_desc-{desc}_tsnr.nii.gz"))
+        assert tsnr.shape == split.shape[:3] and tsnr.get_data_dtype() == np.float32
+        assert tsnr.header["dim"][0] == 3 and tsnr.header["pixdim"][4] == 1
+        assert tsnr.header.get_xyzt_units()[1] == "unknown"
+        np.testing.assert_allclose(tsnr.get_fdata(), split.mean(axis=3) / split.std(axis=3, ddof=1), rtol=1e-3)
+        assert summary["maps"][series]["tsnr"] == f"{base}_desc-{desc}_tsnr.nii.gz"
+
+    entry = json.loads(next((ds / "derivatives" / "nordic" / WORK_DIR / "manifest").rglob("*.json")).read_text())
+    assert entry["params"]["qc"] is True
+    assert any(name.endswith("_desc-nordic_qc.json") for name in entry["outputs"])
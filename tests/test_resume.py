@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from nordic_preproc.manifest import WORK_DIR
+
+
+def test_crash_after_split_resumes_without_backend(tmp_path: Path, monkeypatch, synthetic, standin):
+    from nordic_preproc import bids
+    from nordic_preproc.cli import bids_run
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    deriv = ds / "derivatives" / "nordic"
+    calls = []
+
+    class Backend(standin.StandInBackend):
+        def run(self, *args):
+            calls.append(args)
+            super().run(*args)
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(bids, "write_sidecar", crash)
+        with pytest.raises(SystemExit):
+            bids_run.main([str(ds), "--numpy", "--pipeline-depth", "0"], backend=Backend())
+    assert len(calls) == 1
+    checkpoints = list((deriv / WORK_DIR / "checkpoints").rglob("*.json"))
+    assert len(checkpoints) == 1
+    # The full NORDIC output survives the crash, next to complete splits only
+    assert list(deriv.rglob("*.nii"))
+    assert not list(deriv.rglob(".tmp*"))
+
+    bids_run.main([str(ds), "--numpy", "--pipeline-depth", "0"], backend=Backend())
+    assert len(calls) == 1
+    assert not checkpoints[0].exists()
+    assert not [p for p in deriv.rglob("*.nii") if WORK_DIR not in p.parts]
+    assert list(deriv.rglob("*_desc-functional-nordic_bold.json"))
+
+    bids_run.main([str(ds), "--numpy", "--pipeline-depth", "0"], backend=Backend())
+    assert len(calls) == 1
+
+
+def test_run_taken_over_stops_without_writing(tmp_path: Path, synthetic, standin):
+    from nordic_preproc.bids import discover_runs
+    from nordic_preproc.cli import bids_run
+    from nordic_preproc.leases import LeaseManager
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    deriv = ds / "derivatives" / "nordic"
+    args = bids_run.build_parser().parse_args([str(ds), "--numpy", "--shared"])
+    args.compress_level = 1
+    [run] = discover_runs(ds)
+    leases = LeaseManager(deriv, ttl=60, owner="a")
+    lease_file = leases.lease_path(run.magnitude.relative_to(ds))
+    calls = []
+
+    class Backend(standin.StandInBackend):
+        def run(self, *args):
+            calls.append(args)
+            # Another node takes the run over while this one is in the backend
+            lease_file.write_text('{"owner": "b"}')
+            super().run(*args)
+
+    for take_over_before_backend in (True, False):
+        plan = bids_run.prepare_run(run.magnitude, args, ds, deriv, run=run, leases=leases)
+        if take_over_before_backend:
+            lease_file.write_text('{"owner": "b"}')
+        plan = bids_run.compute_run(plan, args, Backend())
+        assert bids_run.finish_run(plan, args, deriv) == "claimed"
+        lease_file.unlink()
+
+    assert len(calls) == 1
+    assert not list(deriv.rglob("*_desc-*"))
+    assert not list((deriv / WORK_DIR).rglob("manifest/**/*.json"))
+    # Only noise detection, done while the lease was still held, was checkpointed
+    [checkpoint] = (deriv / WORK_DIR / "checkpoints").rglob("*.json")
+    assert json.loads(checkpoint.read_text())["stage"] == "detected"
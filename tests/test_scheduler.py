@@ -0,0 +1,43 @@
+import numpy as np
+import nibabel as nib
+from pathlib import Path
+
+import pytest
+
+from nordic_preproc.scheduler import Job, estimate_run_memory, parse_memory, run_jobs, summarize
+
+
+def _job(value):
+    print(f"working on {value}")
+    if value == 2:
+        raise ValueError("boom")
+    return "done"
+
+
+def test_parse_memory():
+    assert parse_memory("1024") == 1024
+    assert parse_memory("2G") == 2 * 1024**3
+    assert parse_memory("1.5gb") == int(1.5 * 1024**3)
+    with pytest.raises(ValueError):
+        parse_memory("lots")
+
+
+def test_estimate_run_memory_uses_header_only(tmp_path: Path):
+    p = tmp_path / "mag.nii.gz"
+    nib.save(nib.Nifti1Image(np.zeros((4, 4, 4, 10), dtype=np.int16), np.eye(4)), str(p))
+    est = estimate_run_memory(p)
+    assert est > 4 * 4 * 4 * 10 * 2
+    assert estimate_run_memory(p, p) > est
+
+
+def test_run_jobs_orders_logs_and_continues_after_failure():
+    lines = []
+    jobs = [Job(name=f"run-{i}", memory=10, fn=_job, args=(i,)) for i in range(4)]
+    outcomes = run_jobs(jobs, n_jobs=2, max_memory=15, emit=lines.append)
+
+    assert [o.status for o in outcomes] == ["done", "done", "failed", "done"]
+    assert "ValueError: boom" in outcomes[2].error
+    headers = [line for line in lines if line.startswith("=====")]
+    assert [h.split()[2] for h in headers] == ["run-0:", "run-1:", "run-2:", "run-3:"]
+    assert "working on 3" in outcomes[3].log
+    assert "1 failed" in summarize(outcomes)
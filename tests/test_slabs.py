@@ -0,0 +1,62 @@
+import numpy as np
+import nibabel as nib
+from pathlib import Path
+
+import pytest
+
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.backends.numpy_nordic import NumpyBackend
+from nordic_preproc.slabs import SlabBackend, blend_weights, plan_slabs, slab_size_for_budget
+
+
+def test_plan_slabs_covers_axis_with_overlap():
+    slabs = plan_slabs(50, 16, 6, align=4)
+    assert slabs[0][0] == 0 and slabs[-1][1] == 50
+    for (a0, a1), (b0, b1) in zip(slabs, slabs[1:]):
+        assert b0 % 4 == 0 and a1 - b0 >= 6 and b1 - b0 <= 16
+    assert plan_slabs(10, 16, 6) == [(0, 10)]
+    with pytest.raises(ValueError):
+        plan_slabs(50, 6, 6)
+
+
+def test_blend_weights_sum_to_one():
+    slabs = plan_slabs(40, 12, 5)
+    total = np.zeros(40)
+    for (start, stop), w in zip(slabs, blend_weights(slabs, 40)):
+        total[start:stop] += w
+    np.testing.assert_allclose(total, 1.0, rtol=1e-6)
+
+
+def test_slab_size_follows_memory_budget(tmp_path: Path):
+    shape = (64, 64, 48, 100)
+    per_slice = 64 * 64 * 100 * (2 * 2 + 48)
+    assert slab_size_for_budget(shape, 2, 20 * per_slice) == 20
+
+    mag = tmp_path / "mag.nii"
+    nib.save(nib.Nifti1Image(np.zeros(shape[:3] + (4,), dtype=np.int16), np.eye(4)), str(mag))
+    # Too small to hold more than the overlap
+    with pytest.raises(ValueError, match="raise the budget"):
+        SlabBackend(NumpyBackend(), memory=64 * 64 * 4 * 52).plan(mag)
+    assert SlabBackend(NumpyBackend(), memory=10 * 1024**3).plan(mag) == [(0, 48)]
+
+
+def test_slab_output_matches_single_run(tmp_path: Path, synthetic_run):
+    clean, mag, phase = synthetic_run(shape=(16, 16, 24, 40))
+    affine = np.diag([2.0, 2.0, 3.0, 1.0])
+    mag_p, ph_p = tmp_path / "mag.nii.gz", tmp_path / "phase.nii.gz"
+    nib.save(nib.Nifti1Image(mag.astype(np.float32), affine), str(mag_p))
+    nib.save(nib.Nifti1Image(phase.astype(np.float32), affine), str(ph_p))
+    args = NordicArgs(noise_volume_last=3, dirout=str(tmp_path) + "/")
+
+    NumpyBackend(n_threads=2).run(str(mag_p), str(ph_p), "whole", args)
+    backend = SlabBackend(NumpyBackend(n_threads=2), slab_size=12, jobs=2)
+    assert len(backend.plan(mag_p)) > 1
+    backend.run(str(mag_p), str(ph_p), "slabs", args)
+
+    whole = nib.load(str(tmp_path / "whole.nii"))
+    stitched = nib.load(str(tmp_path / "slabs.nii"))
+    assert stitched.shape == whole.shape
+    np.testing.assert_allclose(stitched.affine, affine)
+    a, b = whole.get_fdata(), stitched.get_fdata()
+    assert np.sqrt(np.mean((a - b) ** 2)) < 0.01 * np.sqrt(np.mean(a ** 2))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["mag.nii.gz", "phase.nii.gz", "slabs.nii", "whole.nii"]
@@ -1,8 +1,12 @@
+import gzip
+
 import numpy as np
 import nibabel as nib
 from pathlib import Path
 
-from nordic_preproc.nifti_ops import split_4d_nifti
+import pytest
+
+from nordic_preproc.nifti_ops import ImageCache, save_nifti, slope_inter, split_4d_nifti, stream_split_nifti
 
 
 def test_split_4d_nifti(tmp_path: Path):
@@ -16,3 +20,122 @@ def test_split_4d_nifti(tmp_path: Path):
     func, noise = split_4d_nifti(str(p), noise_inds=np.array([4, 5]))
     assert func.shape[-1] == 4
     assert noise.shape[-1] == 2
+
+
+def test_split_reuses_cached_decode(tmp_path: Path):
+    data = np.arange(2 * 2 * 2 * 6, dtype=np.float64).reshape(2, 2, 2, 6)
+    p = tmp_path / "test.nii.gz"
+    nib.save(nib.Nifti1Image(data, affine=np.eye(4)), str(p))
+
+    cache = ImageCache(max_bytes=10**6)
+    first = cache.data(p)
+    func, noise = split_4d_nifti(str(p), noise_inds=np.array([5]), cache=cache)
+    assert np.shares_memory(func, first)
+    np.testing.assert_array_equal(noise[..., 0], data[..., 5])
+    assert cache.nbytes == data.nbytes
+
+    tiny = ImageCache(max_bytes=8)
+    tiny.data(p)
+    assert tiny.nbytes == 0
+
+
+def test_split_and_save_preserve_dtype_and_scaling(tmp_path: Path):
+    stored = np.arange(3 * 3 * 2 * 5, dtype=np.int16).reshape(3, 3, 2, 5)
+    img = nib.Nifti1Image(stored, affine=np.diag([2.0, 2.0, 3.0, 1.0]))
+    img.header.set_xyzt_units("mm", "sec")
+    img.header["pixdim"][4] = 1.5
+    img.set_qform(img.affine, code=1)
+    src = tmp_path / "src.nii.gz"
+    save_nifti(stored, img.affine, src, header=img.header, scaling=(0.5, 10.0))
+
+    cache = ImageCache()
+    func, noise = split_4d_nifti(str(src), np.array([4]), cache=cache, dtype=None)
+    assert func.dtype == np.int16
+    header = cache.header(src)
+    out = tmp_path / "func.nii.gz"
+    save_nifti(func, cache.affine(src), out, header=header, scaling=slope_inter(cache.image(src)))
+
+    back = nib.load(str(out))
+    assert back.get_data_dtype() == np.int16
+    assert slope_inter(back) == (0.5, 10.0)
+    assert back.header.get_xyzt_units() == ("mm", "sec")
+    assert back.header["pixdim"][4] == 1.5
+    assert back.header["qform_code"] == 1
+    np.testing.assert_array_equal(back.get_fdata(), stored[..., :4] * 0.5 + 10.0)
+
+    scaled, _ = split_4d_nifti(str(src), np.array([4]), cache=cache, dtype=np.float32)
+    out16 = tmp_path / "nordic.nii.gz"
+    save_nifti(scaled, cache.affine(src), out16, header=header, dtype="int16")
+    assert nib.load(str(out16)).get_data_dtype() == np.int16
+    np.testing.assert_allclose(nib.load(str(out16)).get_fdata(), scaled, atol=0.01)
+
+
+def test_stream_split_matches_in_memory_split(tmp_path: Path):
+    stored = np.random.default_rng(0).integers(0, 1000, size=(4, 5, 3, 11)).astype(np.int16)
+    src = tmp_path / "src.nii.gz"
+    save_nifti(stored, np.eye(4), src, scaling=(0.5, 3.0))
+    noise_inds = np.array([8, 9, 10])
+
+    func_out, noise_out = tmp_path / "func.nii.gz", tmp_path / "noise.nii"
+    stream_split_nifti(src, noise_inds, func_out, noise_out, chunk_volumes=3)
+    func, noise = split_4d_nifti(str(src), noise_inds)
+    assert nib.load(str(func_out)).get_data_dtype() == np.int16
+    np.testing.assert_array_equal(nib.load(str(func_out)).get_fdata(), func)
+    np.testing.assert_array_equal(nib.load(str(noise_out)).get_fdata(), noise)
+
+    f32 = tmp_path / "func32.nii.gz"
+    stream_split_nifti(src, noise_inds, f32, dtype="float32")
+    assert nib.load(str(f32)).get_data_dtype() == np.float32
+    np.testing.assert_array_equal(nib.load(str(f32)).get_fdata(), func)
+
+
+def test_failed_stream_write_leaves_no_file(tmp_path: Path):
+    from nordic_preproc.nifti_ops import NiftiStreamWriter
+
+    out = tmp_path / "out.nii.gz"
+    with pytest.raises(ValueError):
+        with NiftiStreamWriter(out, (2, 2, 2, 3), np.eye(4), dtype=np.float32) as writer:
+            writer.write(np.zeros((2, 2, 2, 2), dtype=np.float32))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_nifti_complete_detects_truncation(tmp_path: Path):
+    from nordic_preproc.nifti_ops import nifti_complete
+
+    data = np.random.default_rng(0).normal(size=(8, 8, 8, 5)).astype(np.float32)
+    for name in ("a.nii", "b.nii.gz"):
+        p = tmp_path / name
+        save_nifti(data, np.eye(4), p)
+        assert nifti_complete(p)
+        p.write_bytes(p.read_bytes()[:-100])
+        assert not nifti_complete(p)
+    p = tmp_path / "c.nii.gz"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), str(p))
+    assert nifti_complete(p)
+
+
+@pytest.mark.parametrize("block_size", [4096, 5000, 1024 * 1024])
+def test_nifti_complete_checks_every_gzip_member(tmp_path: Path, block_size):
+    from nordic_preproc.nifti_ops import ParallelGzipWriter, nifti_complete
+
+    data = np.random.default_rng(0).normal(size=(16, 16, 16, 64)).astype(np.float32)
+    nii = tmp_path / "a.nii"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), str(nii))
+    p = tmp_path / "a.nii.gz"
+    with ParallelGzipWriter(p, threads=2, block_size=block_size) as f:
+        f.write(nii.read_bytes())
+    assert gzip.decompress(p.read_bytes()) == nii.read_bytes()
+    assert nifti_complete(p)
+
+    # Cut where the last member starts, and in the middle of a member
+    whole = p.read_bytes()
+    starts = [0]
+    while True:
+        end = starts[-1] + int.from_bytes(whole[starts[-1] + 16:starts[-1] + 20], "little")
+        if end == len(whole):
+            break
+        starts.append(end)
+    assert len(starts) == -(-len(nii.read_bytes()) // block_size)
+    for cut in (whole[:starts[-1]], whole[:len(whole) // 2]):
+        p.write_bytes(cut)
+        assert not nifti_complete(p)
@@ -0,0 +1,101 @@
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from nordic_preproc.manifest import WORK_DIR
+from nordic_preproc.nifti_ops import VolumeReader
+from nordic_preproc.staging import SCRATCH_PREFIX, ScratchDir, remove_stale
+
+
+def test_staged_input_is_uncompressed_and_memory_mapped(tmp_path: Path):
+    data = np.arange(3 * 3 * 2 * 4, dtype=np.int16).reshape(3, 3, 2, 4)
+    src = tmp_path / "mag.nii.gz"
+    nib.save(nib.Nifti1Image(data, affine=np.eye(4)), str(src))
+
+    with ScratchDir(tmp_path / "scratch", tag="run") as scratch:
+        staged = scratch.stage(src)
+        assert staged.name == "mag.nii" and staged.parent == scratch.path
+        with VolumeReader(staged) as reader:
+            vols = reader.read(1, 3)
+            assert reader._mmap is not None
+            np.testing.assert_array_equal(vols, data[..., 1:3])
+        np.testing.assert_array_equal(vols, data[..., 1:3])  # still valid after close
+    assert not staged.parent.exists()
+
+
+def test_remove_stale_only_removes_dead_processes(tmp_path: Path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    host = socket.gethostname()
+    stale = tmp_path / f"{SCRATCH_PREFIX}{host}-{dead.pid}-abc"
+    live = tmp_path / f"{SCRATCH_PREFIX}{host}-{os.getpid()}-def"
+    other = tmp_path / f"{SCRATCH_PREFIX}otherhost-{dead.pid}-ghi"
+    for d in (stale, live, other):
+        d.mkdir()
+
+    assert remove_stale(tmp_path) == [stale]
+    assert live.exists() and other.exists()
+
+
+@pytest.mark.parametrize("crash", [False, True])
+def test_bids_run_with_scratch_dir(tmp_path: Path, crash, synthetic, standin):
+    from nordic_preproc.cli import bids_run
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    scratch = tmp_path / "scratch"
+    seen = []
+
+    class Backend(standin.StandInBackend):
+        def run(self, magnitude_nii, phase_nii, output_base, args):
+            seen.append((magnitude_nii, phase_nii, args.dirout))
+            super().run(magnitude_nii, phase_nii, output_base, args)
+            if crash:
+                raise RuntimeError("backend crashed")
+
+    argv = [str(ds), "--numpy", "--scratch-dir", str(scratch), "--pipeline-depth", "0"]
+    if crash:
+        with pytest.raises(SystemExit):
+            bids_run.main(argv, backend=Backend())
+    else:
+        bids_run.main(argv, backend=Backend())
+
+    assert seen
+    for mag, ph, dirout in seen:
+        assert mag.endswith("_bold.nii") and ph.endswith("_part-phase_bold.nii")
+        assert Path(dirout).parent == scratch
+    assert list(scratch.iterdir()) == []
+    deriv = [p for p in (ds / "derivatives" / "nordic").rglob("*_bold.nii*") if WORK_DIR not in p.parts]
+    if crash:
+        assert deriv == []
+    else:
+        assert deriv and not list((ds / "derivatives" / "nordic").rglob("*_bold.nii"))
+
+
+def test_existing_outputs_are_adopted_without_staging_the_phase(tmp_path: Path, monkeypatch, synthetic, standin):
+    import shutil
+
+    from nordic_preproc import staging
+    from nordic_preproc.cli import bids_run
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    argv = [str(ds), "--numpy", "--scratch-dir", str(tmp_path / "scratch"), "--pipeline-depth", "0"]
+    bids_run.main(argv, backend=standin.StandInBackend())
+    # Derivatives from before the manifest existed
+    shutil.rmtree(ds / "derivatives" / "nordic" / WORK_DIR)
+
+    staged = []
+    stage = staging.ScratchDir.stage
+
+    def recording_stage(self, path):
+        staged.append(Path(path).name)
+        return stage(self, path)
+
+    monkeypatch.setattr(staging.ScratchDir, "stage", recording_stage)
+    bids_run.main(argv, backend=standin.StandInBackend())
+    assert staged and not [name for name in staged if "part-phase" in name]
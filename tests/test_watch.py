@@ -0,0 +1,180 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from nordic_preproc.watch import RunWatcher, watch
+
+FUNC = Path("sub-01/ses-01/func")
+
+
+def _copy_run(ds: Path, src: str, dst: str) -> None:
+    """Copy a run's files under new names, each renamed into place when complete."""
+    for suffix in ("_bold.nii.gz", "_part-phase_bold.nii.gz", "_bold.json"):
+        tmp = ds / FUNC / f".{dst}{suffix}.part"
+        shutil.copy(ds / FUNC / f"{src}{suffix}", tmp)
+        os.replace(tmp, ds / FUNC / f"{dst}{suffix}")
+
+
+def test_runs_are_returned_once_complete_and_settled(tmp_path: Path, synthetic):
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    now = [time.time()]
+    watcher = RunWatcher(ds, settle_time=30, clock=lambda: now[0])
+    assert watcher.poll() == []  # just written: not settled yet
+
+    now[0] += 60
+    [run] = watcher.poll()
+    assert run.magnitude.name == "sub-01_ses-01_task-rest_run-1_bold.nii.gz"
+    assert watcher.poll() == []
+
+    # A run whose phase is still being written is held back
+    _copy_run(ds, "sub-01_ses-01_task-rest_run-1", "sub-01_ses-01_task-rest_run-2")
+    phase = ds / FUNC / "sub-01_ses-01_task-rest_run-2_part-phase_bold.nii.gz"
+    data = phase.read_bytes()
+    phase.write_bytes(data[: len(data) // 2])
+    now[0] += 60
+    os.utime(phase, (now[0] - 60, now[0] - 60))
+    assert watcher.poll() == []
+    phase.write_bytes(data)
+    assert watcher.poll() == []
+    now[0] += 60
+    [run] = watcher.poll()
+    assert run.magnitude.name == "sub-01_ses-01_task-rest_run-2_bold.nii.gz"
+
+    # A replaced sidecar makes the run new again
+    tmp = run.sidecar.with_name(".sidecar.part")
+    tmp.write_text('{"RepetitionTime": 2.0}')
+    os.replace(tmp, run.sidecar)
+    now[0] += 60
+    assert [r.magnitude for r in watcher.poll()] == [run.magnitude]
+
+
+def test_returned_runs_in_unchanged_directories_are_not_stat_ed(tmp_path: Path, monkeypatch, synthetic):
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    old = time.time() - 3600
+    for path in (ds / FUNC).iterdir():
+        os.utime(path, (old, old))
+    os.utime(ds / FUNC, (old, old))
+    watcher = RunWatcher(ds, settle_time=30)
+    [run] = watcher.poll()
+
+    files = {str(run.magnitude), str(run.phase), str(run.sidecar)}
+    stat, calls = os.stat, []
+
+    def counting_stat(path, *args, **kwargs):
+        calls.append(str(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    for _ in range(3):
+        assert watcher.poll() == []
+    assert calls and not files & set(calls)
+
+    # A run added next to it makes the directory change, so both are looked at
+    monkeypatch.setattr(os, "stat", stat)
+    _copy_run(ds, "sub-01_ses-01_task-rest_run-1", "sub-01_ses-01_task-rest_run-2")
+    monkeypatch.setattr(os, "stat", counting_stat)
+    calls.clear()
+    watcher.poll()
+    assert files <= set(calls)
+
+
+def test_watch_stops_when_idle():
+    class Watcher:
+        changed_at = 0.0
+
+        def __init__(self):
+            self.polls = 0
+
+        def clock(self):
+            return float(self.polls)
+
+        def poll(self):
+            self.polls += 1
+            return ["run"] if self.polls == 2 else []
+
+    handled = []
+    watcher = Watcher()
+    watch(watcher, handled.append, interval=0, idle_exit=3)
+    assert handled == [["run"]] and watcher.polls == 5
+
+
+def test_watch_mode_processes_runs_as_they_arrive(tmp_path: Path, synthetic, standin):
+    from nordic_preproc.cli import bids_run
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    func_out = ds / "derivatives" / "nordic" / FUNC
+    calls = []
+
+    class Backend(standin.StandInBackend):
+        def run(self, *args):
+            calls.append(args[2])
+            super().run(*args)
+
+        def close(self):
+            calls.append("close")
+
+    argv = [str(ds), "--numpy", "--pipeline-depth", "0", "--watch", "--watch-interval", "0.05",
+            "--settle-time", "0", "--watch-idle-exit", "1"]
+    daemon = threading.Thread(target=bids_run.main, args=(argv,), kwargs={"backend": Backend()})
+    daemon.start()
+    deadline = time.monotonic() + 30
+    while not list(func_out.glob("*run-1_desc-functional-nordic_bold.nii*")) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    _copy_run(ds, "sub-01_ses-01_task-rest_run-1", "sub-01_ses-01_task-rest_run-2")
+    daemon.join(60)
+
+    assert not daemon.is_alive()
+    assert len(calls) == 3 and calls[-1] == "close"
+    out = nib.load(str(next(func_out.glob("*run-2_desc-functional-nordic_bold.nii*"))))
+    assert out.shape[3] == 27 and np.isfinite(out.get_fdata()).all()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="SIGTERM cannot be caught on Windows")
+def test_sigterm_interrupts_the_run_in_progress(tmp_path: Path, synthetic, standin):
+    from nordic_preproc.cli import bids_run
+    from nordic_preproc.manifest import WORK_DIR
+
+    ds = synthetic.make_dataset(tmp_path / "data", "tiny")
+    started = tmp_path / "started"
+    code = (
+        "import sys, time, standin\n"
+        "from nordic_preproc.cli import bids_run\n"
+        "class Backend(standin.StandInBackend):\n"
+        "    def run(self, *args):\n"
+        "        open(sys.argv[2], 'w').close()\n"
+        "        time.sleep(120)\n"
+        "bids_run.main([sys.argv[1], '--numpy', '--pipeline-depth', '0', '--watch', '--watch-interval', '0.05',\n"
+        "               '--settle-time', '0'], backend=Backend())\n"
+    )
+    root = Path(__file__).resolve().parents[1]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(root / "src"), str(root / "benchmarks")])}
+    proc = subprocess.Popen([sys.executable, "-c", code, str(ds), str(started)], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        deadline = time.monotonic() + 60
+        while not started.exists() and proc.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert started.exists()
+        start = time.monotonic()
+        proc.send_signal(signal.SIGTERM)
+        out, _ = proc.communicate(timeout=30)
+    finally:
+        proc.kill()
+    assert time.monotonic() - start < 30 and "Stopped watching" in out
+
+    # The run was left to its checkpoint, and the next start finishes it
+    deriv = ds / "derivatives" / "nordic"
+    assert list((deriv / WORK_DIR / "checkpoints").rglob("*.json"))
+    assert not list(deriv.rglob("*_desc-functional-nordic_bold.nii*"))
+    bids_run.main([str(ds), "--numpy", "--pipeline-depth", "0"], backend=standin.StandInBackend())
+    assert list(deriv.rglob("*_desc-functional-nordic_bold.nii*"))
+    assert not list((deriv / WORK_DIR / "checkpoints").rglob("*.json"))
@@ -0,0 +1,147 @@
+import threading
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from nordic_preproc.backends import NordicArgs
+from nordic_preproc.watchdog import BackendTimeout, SupervisedBackend
+
+
+class HangingBackend:
+    """Hangs on the first call until aborted; later calls write an output."""
+
+    def __init__(self):
+        self.calls = 0
+        self.aborted = []
+        self._release = threading.Event()
+
+    def run(self, magnitude_nii, phase_nii, output_base, args):
+        self.calls += 1
+        if self.calls == 1:
+            Path(args.dirout, f"{output_base}.nii").write_bytes(b"partial")
+            self._release.wait(10)
+            raise RuntimeError("killed")
+        Path(args.dirout, f"{output_base}.nii").write_bytes(b"done")
+
+    def abort(self, thread_id):
+        self.aborted.append(thread_id)
+        self._release.set()
+
+    def close(self):
+        pass
+
+
+class UnabortableBackend(HangingBackend):
+    abort = None
+
+
+class FlakyBackend:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def run(self, magnitude_nii, phase_nii, output_base, args):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("transient failure")
+
+    def close(self):
+        pass
+
+
+def _supervised(backend, **kw):
+    opts = dict(timeout=0, timeout_per_volume=0, stall_timeout=0, retries=0, backoff=0, poll=0.02)
+    opts.update(kw)
+    return SupervisedBackend(backend, **opts)
+
+
+def test_stalled_call_is_aborted_and_retried(tmp_path: Path):
+    backend = HangingBackend()
+    _supervised(backend, stall_timeout=0.2, retries=1).run("m.nii", "p.nii", "run", NordicArgs(dirout=str(tmp_path)))
+    assert backend.calls == 2 and len(backend.aborted) == 1
+    assert (tmp_path / "run.nii").read_bytes() == b"done"
+
+
+def test_time_limit_raises_once_retries_are_used_up(tmp_path: Path):
+    backend = HangingBackend()
+    with pytest.raises(BackendTimeout, match="time limit"):
+        _supervised(backend, timeout=0.1).run("m.nii", "p.nii", "run", NordicArgs(dirout=str(tmp_path)))
+    assert backend.aborted
+
+
+def test_unabortable_call_is_not_retried(tmp_path: Path):
+    backend = UnabortableBackend()
+    sup = _supervised(backend, timeout=0.1, retries=3)
+    with pytest.raises(BackendTimeout) as err:
+        sup.run("m.nii", "p.nii", "run", NordicArgs(dirout=str(tmp_path)))
+    assert err.value.abandoned and backend.calls == 1
+    backend._release.set()
+
+
+def test_failures_are_retried_up_to_the_limit(tmp_path: Path):
+    args = NordicArgs(dirout=str(tmp_path))
+    flaky = FlakyBackend(failures=2)
+    _supervised(flaky, retries=2).run("m.nii", "p.nii", "run", args)
+    assert flaky.calls == 3
+
+    flaky = FlakyBackend(failures=5)
+    with pytest.raises(RuntimeError, match="transient"):
+        _supervised(flaky, retries=2).run("m.nii", "p.nii", "run", args)
+    assert flaky.calls == 3
+
+
+def test_time_limit_scales_with_volumes(tmp_path: Path):
+    mag = tmp_path / "mag.nii"
+    nib.save(nib.Nifti1Image(np.zeros((4, 4, 2, 12), dtype=np.int16), np.eye(4)), str(mag))
+    assert _supervised(None, timeout=60, timeout_per_volume=5).time_limit(str(mag)) == 120
+    assert _supervised(None).time_limit(str(mag)) is None
+
+
+def test_busy_pipeline_threads_do_not_hide_a_stall(tmp_path: Path):
+    class CountingBackend(HangingBackend):
+        def progress(self, thread_id):
+            return 0
+
+    # CPU used elsewhere in this process (prefetch, writers) is not progress of the call
+    done = threading.Event()
+
+    def spin():
+        while not done.is_set():
+            sum(range(1000))
+
+    busy = threading.Thread(target=spin, daemon=True)
+    busy.start()
+    backend = CountingBackend()
+    try:
+        with pytest.raises(BackendTimeout, match="no progress"):
+            _supervised(backend, stall_timeout=0.2).run("m.nii", "p.nii", "run", NordicArgs(dirout=str(tmp_path)))
+    finally:
+        done.set()
+    assert backend.aborted
+
+
+def test_backend_progress_counter_keeps_a_call_alive(tmp_path: Path):
+    class SlowBackend:
+        def __init__(self):
+            self.count = 0
+
+        def run(self, magnitude_nii, phase_nii, output_base, args):
+            for _ in range(8):
+                time.sleep(0.05)
+                self.count += 1
+
+        def progress(self, thread_id):
+            return self.count
+
+        def abort(self, thread_id):
+            raise AssertionError("a call that makes progress must not be aborted")
+
+        def close(self):
+            pass
+
+    backend = SlowBackend()
+    _supervised(backend, stall_timeout=0.15).run("m.nii", "p.nii", "run", NordicArgs(dirout=str(tmp_path)))
+    assert backend.count == 8